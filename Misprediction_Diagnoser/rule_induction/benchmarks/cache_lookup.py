@@ -0,0 +1,59 @@
+# Copyright (c) Facebook, Inc. and its affiliates.
+# All rights reserved.
+#
+# This source code is licensed under the license found in the
+# LICENSE file in the root directory of this source tree.
+
+"""
+Compares the cost of building a rule-cache key by hashing the whole data frame
+(the previous behaviour of rules.cache.get_cache_key) with looking up the token
+of an already registered data frame (rules.cache.dataset_token).
+
+Run from the rule_induction directory:
+    python benchmarks/cache_lookup.py
+"""
+import os
+import sys
+import timeit
+
+import numpy as np
+import pandas as pd
+from pandas.util import hash_pandas_object
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from rules.cache import dataset_token, get_cache_key
+from rules.rule import Rule
+
+
+def make_data(num_rows: int) -> pd.DataFrame:
+    rng = np.random.default_rng(0)
+    return pd.DataFrame({
+        'age': rng.integers(18, 90, num_rows),
+        'income': rng.normal(50000, 15000, num_rows),
+        'gender': rng.choice(['Female', 'Male'], num_rows),
+        'target': rng.random(num_rows) < 0.3,
+    })
+
+
+def hashed_key(rule, df: pd.DataFrame):
+    return str(rule) + ":" + str(hash_pandas_object(df))
+
+
+def registry_key(rule, df: pd.DataFrame):
+    return get_cache_key(rule, dataset_token(df))
+
+
+def main(row_counts=(1000, 10000, 100000, 1000000), number=20):
+    rule = Rule.from_string('age<=40 & gender=="Female"')
+    print("{:>10} {:>18} {:>18}".format("rows", "hashed key (us)", "registry key (us)"))
+    for num_rows in row_counts:
+        df = make_data(num_rows)
+        dataset_token(df)  # registration happens once, when ConfusionMatrix or discover sees df
+        hashed = timeit.timeit(lambda: hashed_key(rule, df), number=number) / number
+        registry = timeit.timeit(lambda: registry_key(rule, df), number=number) / number
+        print("{:>10} {:>18.1f} {:>18.1f}".format(num_rows, hashed * 1e6, registry * 1e6))
+
+
+if __name__ == '__main__':
+    main()
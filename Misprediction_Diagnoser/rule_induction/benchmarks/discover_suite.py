@@ -0,0 +1,240 @@
+# Copyright (c) Facebook, Inc. and its affiliates.
+# All rights reserved.
+#
+# This source code is licensed under the license found in the
+# LICENSE file in the root directory of this source tree.
+
+"""
+Benchmark suite of the rule induction engine.
+
+Generates synthetic datasets (see benchmarks/synthetic.py), runs discover on
+them for a grid of Settings and records, for every case, the median wall-clock
+time, the peak memory allocated during one run (tracemalloc) and the rules found.
+The results are written to a JSON file. If a baseline file is given, the run
+fails (exit code 1) when a case got slower or used more memory than the baseline
+allows, or when it finds different rules.
+
+Wall-clock times depend on the machine, so every run also times a fixed
+numpy/pandas/Python workload (see calibrate) and times are compared relative
+to it: a baseline recorded on a faster or slower machine is scaled by the ratio
+of the two reference times. This only corrects for the overall speed of the
+machine; for a strict time gate, record the baseline on the machine that runs
+the check (--save-baseline). Rules and peak memory do not depend on the machine,
+but peak memory may change with the numpy and pandas versions, which are
+recorded in the results file.
+
+The rules found depend on the order in which sets of predicates are iterated,
+so the suite re-runs itself with PYTHONHASHSEED=0 to make them reproducible.
+
+Run from the rule_induction directory:
+    python benchmarks/discover_suite.py --preset small --output results.json
+    python benchmarks/discover_suite.py --preset small --baseline benchmarks/baseline_small.json
+    python benchmarks/discover_suite.py --preset small --save-baseline benchmarks/baseline_small.json
+"""
+import argparse
+import itertools
+import json
+import os
+import platform
+import statistics
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from diagnoser import discover, Settings, Target
+from rules.cache import dataset_token
+from synthetic import DatasetSpec, generate
+
+
+# preset -> (row counts, settings grid)
+PRESETS = {
+    'small': ((1000, 10000), {'beam_width': (5, 10, 20), 'num_bins': (5, 10), 'disjunctions': (False, True)}),
+    'medium': ((100000, 1000000), {'beam_width': (10,), 'num_bins': (5, 10), 'disjunctions': (False, True)}),
+    'large': ((10000000,), {'beam_width': (10,), 'num_bins': (5,), 'disjunctions': (False,)}),
+}
+
+
+def settings_grid(grid):
+    names = sorted(grid)
+    for values in itertools.product(*(grid[name] for name in names)):
+        yield dict(zip(names, values))
+
+
+def settings_name(settings):
+    return ",".join("{}={}".format(name, value) for (name, value) in sorted(settings.items()))
+
+
+# Rules of a Result or DisjunctiveResult as strings
+def found_rules(result):
+    if hasattr(result, 'rulesets'):
+        return [str(ruleset) for ruleset in result.rulesets]
+    return [str(rule) for rule in result.rules]
+
+
+def run_case(df, relevant_attributes, settings, repeat):
+    target = Target('target', True)
+    times = []
+    for _ in range(repeat):
+        # fresh settings, so that no run re-uses the rule cache of a previous one
+        config = Settings(**settings)
+        start = time.perf_counter()
+        result = discover(df, target, relevant_attributes, config)
+        times.append(time.perf_counter() - start)
+
+    tracemalloc.start()
+    discover(df, target, relevant_attributes, Settings(**settings))
+    (_, peak) = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {
+        'time': statistics.median(times),
+        'times': times,
+        'peak_memory_mb': peak / 2**20,
+        'num_rules': len(found_rules(result)),
+        'rules': found_rules(result),
+    }
+
+
+def run_suite(row_counts, grid, repeat=3, spec_args=None, log=print):
+    results = {}
+    for num_rows in row_counts:
+        spec = DatasetSpec(num_rows=num_rows, **(spec_args or {}))
+        (df, relevant_attributes, planted) = generate(spec)
+        # fingerprint the data once, so that the first case does not pay for it
+        dataset_token(df)
+        for settings in settings_grid(grid):
+            case = "{}/{}".format(spec.name, settings_name(settings))
+            record = run_case(df, relevant_attributes, settings, repeat)
+            record['dataset'] = spec.to_dict()
+            record['planted'] = planted
+            record['settings'] = settings
+            results[case] = record
+            log("{:<70} {:>9.3f}s {:>9.1f}MB {:>4} rules".format(
+                case, record['time'], record['peak_memory_mb'], record['num_rules']))
+    return results
+
+
+def calibrate(repeat=5):
+    """ Seconds taken by a fixed workload (median of repeat runs), the reference time of a machine
+
+        The workload mixes the kinds of work of discover: numpy array operations,
+        a pandas group-by and a pure Python loop.
+    """
+    rng = np.random.default_rng(0)
+    values = rng.random(10**6)
+    keys = rng.integers(0, 1000, 10**6)
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        np.sort(values)
+        np.count_nonzero(np.packbits(values > 0.5))
+        pd.Series(values).groupby(keys).sum()
+        counts = {}
+        for key in keys[:200000].tolist():
+            counts[key] = counts.get(key, 0) + 1
+        times.append(time.perf_counter() - start)
+    return statistics.median(times)
+
+
+def compare(results, baseline, time_tolerance=1.5, memory_tolerance=1.25, min_time=0.05, time_scale=1.0):
+    """ Returns the regressions of results with respect to baseline (an empty list if there are none)
+
+        A case regresses if it takes more than time_tolerance times the baseline time
+        (and at least min_time seconds more), if it allocates more than memory_tolerance
+        times the baseline peak memory, or if it finds other rules.
+        Baseline times are multiplied by time_scale, the reference time of this run divided
+        by the one of the baseline (see calibrate).
+        Cases that are not in the baseline are not checked.
+    """
+    regressions = []
+    for (case, record) in results.items():
+        base = baseline.get(case)
+        if base is None:
+            continue
+        base_time = base['time'] * time_scale
+        if record['time'] > base_time * time_tolerance and record['time'] - base_time > min_time:
+            regressions.append("{}: time {:.3f}s (baseline {:.3f}s, scaled to this machine)".format(
+                case, record['time'], base_time))
+        if record['peak_memory_mb'] > base['peak_memory_mb'] * memory_tolerance:
+            regressions.append("{}: peak memory {:.1f}MB (baseline {:.1f}MB)".format(
+                case, record['peak_memory_mb'], base['peak_memory_mb']))
+        if record['rules'] != base['rules']:
+            regressions.append("{}: rules {} (baseline {})".format(case, record['rules'], base['rules']))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--preset', choices=sorted(PRESETS), default='small')
+    parser.add_argument('--rows', type=int, nargs='+', help="row counts (overrides the preset)")
+    parser.add_argument('--repeat', type=int, default=3, help="timed runs per case (the median is reported)")
+    parser.add_argument('--discrete', type=int, default=DatasetSpec.num_discrete)
+    parser.add_argument('--continuous', type=int, default=DatasetSpec.num_continuous)
+    parser.add_argument('--integer', type=int, default=DatasetSpec.num_integer)
+    parser.add_argument('--cardinality', type=int, default=DatasetSpec.cardinality)
+    parser.add_argument('--subgroups', type=int, default=DatasetSpec.num_subgroups)
+    parser.add_argument('--output', default='benchmark_results.json', help="results file")
+    parser.add_argument('--baseline', help="baseline file to check the results against")
+    parser.add_argument('--save-baseline', help="also write the results to this baseline file")
+    parser.add_argument('--time-tolerance', type=float, default=1.5)
+    parser.add_argument('--memory-tolerance', type=float, default=1.25)
+    args = parser.parse_args()
+
+    if os.environ.get('PYTHONHASHSEED') != '0':
+        os.environ['PYTHONHASHSEED'] = '0'
+        os.execv(sys.executable, [sys.executable] + sys.argv)
+
+    (row_counts, grid) = PRESETS[args.preset]
+    if args.rows:
+        row_counts = args.rows
+    spec_args = {
+        'num_discrete': args.discrete,
+        'num_continuous': args.continuous,
+        'num_integer': args.integer,
+        'cardinality': args.cardinality,
+        'num_subgroups': args.subgroups,
+    }
+    reference_time = calibrate()
+    print("reference time {:.3f}s".format(reference_time))
+    results = run_suite(row_counts, grid, args.repeat, spec_args)
+
+    report = {
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'pandas': pd.__version__,
+        'machine': platform.machine(),
+        'reference_time': reference_time,
+        'results': results,
+    }
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=1)
+    if args.save_baseline:
+        with open(args.save_baseline, 'w') as f:
+            json.dump(report, f, indent=1)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline_report = json.load(f)
+        for library in ('python', 'numpy', 'pandas'):
+            if baseline_report.get(library) not in (None, report[library]):
+                print("note: the baseline was recorded with {} {} (this run: {})".format(
+                    library, baseline_report[library], report[library]))
+        # baselines without a reference time are compared unscaled
+        time_scale = reference_time / baseline_report.get('reference_time', reference_time)
+        regressions = compare(results, baseline_report['results'], args.time_tolerance, args.memory_tolerance,
+                              time_scale=time_scale)
+        for regression in regressions:
+            print("REGRESSION " + regression)
+        if regressions:
+            sys.exit(1)
+        print("No regressions against {}".format(args.baseline))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,107 @@
+# Copyright (c) Facebook, Inc. and its affiliates.
+# All rights reserved.
+#
+# This source code is licensed under the license found in the
+# LICENSE file in the root directory of this source tree.
+
+"""
+Synthetic tabular datasets with planted subgroups, used by the benchmarks.
+
+Every dataset has a boolean 'target' column. Rows of a planted subgroup
+(a discrete attribute equal to one of its values AND a continuous attribute
+above a quantile) are more likely to be positive than the other rows, so
+discover has something to find.
+"""
+from dataclasses import dataclass, asdict
+from typing import Dict, List, Tuple
+
+import numpy as np
+import pandas as pd
+
+
+@dataclass(frozen=True)
+class DatasetSpec:
+    """
+    num_rows : int
+        Number of rows
+
+    num_discrete : int
+        Number of discrete (string valued) attributes, named d0, d1, ...
+
+    num_continuous : int
+        Number of continuous (float valued) attributes, named c0, c1, ...
+
+    num_integer : int
+        Number of integer attributes, named i0, i1, ...
+
+    cardinality : int
+        Number of distinct values of each discrete attribute
+
+    num_subgroups : int
+        Number of planted subgroups (at most min(num_discrete, num_continuous))
+
+    base_rate : float
+        Probability of the target outside of the planted subgroups
+
+    subgroup_rate : float
+        Probability of the target inside a planted subgroup
+
+    seed : int
+        Seed of the random generator
+    """
+    num_rows: int = 10000
+    num_discrete: int = 3
+    num_continuous: int = 2
+    num_integer: int = 1
+    cardinality: int = 5
+    num_subgroups: int = 2
+    base_rate: float = 0.2
+    subgroup_rate: float = 0.8
+    seed: int = 0
+
+    @property
+    def name(self):
+        return "rows={}_d={}_c={}_i={}_card={}_sub={}".format(
+            self.num_rows, self.num_discrete, self.num_continuous, self.num_integer,
+            self.cardinality, self.num_subgroups)
+
+    def to_dict(self):
+        return asdict(self)
+
+
+def generate(spec: DatasetSpec) -> Tuple[pd.DataFrame, Dict[str, str], List[str]]:
+    """ Generates a dataset according to spec
+
+        Returns
+        -------
+        (df, relevant_attributes, planted): Tuple[pd.DataFrame, Dict[str, str], List[str]]
+            The data, the mapping from attributes to their type (as expected by discover)
+            and a description of the planted subgroups
+    """
+    rng = np.random.default_rng(spec.seed)
+    n = spec.num_rows
+    columns = {}
+    relevant_attributes = {}
+
+    values = np.array(["v{}".format(k) for k in range(spec.cardinality)])
+    for k in range(spec.num_discrete):
+        columns["d{}".format(k)] = values[rng.integers(0, spec.cardinality, n)]
+        relevant_attributes["d{}".format(k)] = 'D'
+    for k in range(spec.num_continuous):
+        columns["c{}".format(k)] = rng.normal(0, 1, n)
+        relevant_attributes["c{}".format(k)] = 'C'
+    for k in range(spec.num_integer):
+        columns["i{}".format(k)] = rng.integers(0, 100, n)
+        relevant_attributes["i{}".format(k)] = 'I'
+
+    in_subgroup = np.zeros(n, dtype=bool)
+    planted = []
+    for k in range(min(spec.num_subgroups, spec.num_discrete, spec.num_continuous)):
+        value = values[k % spec.cardinality]
+        threshold = 0.0
+        in_subgroup |= (columns["d{}".format(k)] == value) & (columns["c{}".format(k)] > threshold)
+        planted.append('d{}=="{}" & c{}>{}'.format(k, value, k, threshold))
+
+    probability = np.where(in_subgroup, spec.subgroup_rate, spec.base_rate)
+    columns['target'] = rng.random(n) < probability
+    return pd.DataFrame(columns), relevant_attributes, planted
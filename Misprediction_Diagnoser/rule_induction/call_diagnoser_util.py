@@ -1,14 +1,36 @@
 import glob
+import hashlib
+import io
+import json
+import multiprocessing
+import os
+import numpy as np
 import pandas as pd
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+from contextlib import redirect_stdout
+from dataclasses import fields, replace
 from itertools import combinations
 from rule_induction.diagnoser import *
 
 
 def start_diagnosis(file_path: str, target_column : str, target_value : any, config : Settings, relevant_attributes : Dict[str, str],
-                    result_name : str, conversion_dict : Dict[str, list] = None, map_dict : Dict[str, list] = None):
+                    result_name : str, conversion_dict : Dict[str, list] = None, map_dict : Dict[str, list] = None,
+                    workers : int = 1, chunk_size : int = 1, resume : bool = False, flush_every : int = 50,
+                    engine : str = None, file_workers : int = 1, max_memory : int = None):
     """
     Preprocesses data and subsequently starts diagnosis procedure for all sizes of the synthetic data sets.
 
+    Results are appended to the result file while the diagnosis is running (see ResultWriter).
+    With resume = True, if a previous run with the same result_name and the same settings (see run_fingerprint)
+    was interrupted, the finished (file, attribute combination) pairs are skipped and the run continues where it
+    stopped. A previous run with other settings is not resumed, its results are overwritten.
+
+    With file_workers = 1 the files are diagnosed one after another, and the next file is loaded and preprocessed
+    in the background while the current one is diagnosed (see prefetch_files); not if workers > 1, because the
+    worker processes of a file are forked, and forking while the loader thread is running can deadlock them. With file_workers > 1 the files are
+    diagnosed concurrently by a pool of worker processes (see parallel_files). Either way, results and printed
+    output are merged in sorted file order, so the result file is the same.
+
     Parameters
     ----------
     file_path : str
@@ -16,7 +38,8 @@ def start_diagnosis(file_path: str, target_column : str, target_value : any, con
     target_column : str
         Name of the column of interest
     target_value : any
-        Value of the target that will be mapped to "True", any other value in the target_column will be mapped to "False"
+        Value of the target that will be mapped to "True", any other value in the target_column will be mapped to "False".
+        A list of values diagnoses each of them as a target, sharing the predicates of a file (see diagnosis_targets)
     conversion_dict : Dict[str, list]
         Mapping for columns defined in the list to a certain data type
     config : Settings
@@ -27,26 +50,226 @@ def start_diagnosis(file_path: str, target_column : str, target_value : any, con
         Name of the resulting file
     map_dict: Dict[str, list]
         Mapping for columns containing 0.0 and 1.0 to meaningful values (default : None)
+    workers : int
+        Number of worker processes used for the attribute combinations of a file (default : 1, no parallelism)
+    chunk_size : int
+        Number of attribute combinations handed to a worker at once (default : 1)
+    resume : bool
+        Continue an interrupted run instead of starting over (default : False)
+    flush_every : int
+        Number of attribute combinations after which results are written to the result file (default : 50)
+    engine : str
+        CSV parser used to load the files, e.g. "pyarrow" (default : None, the pandas default)
+    file_workers : int
+        Number of files diagnosed at the same time (default : 1). The combinations of a file are then diagnosed
+        in the process of that file, workers is only used if file_workers = 1
+    max_memory : int
+        Estimated number of bytes the files diagnosed at the same time may take (default : None, no limit),
+        see file_memory. A file is always diagnosed if no other file is running
     """
     files = sorted(glob.glob(file_path + "*.csv"))
-    result_data = pd.DataFrame()
-    count = 0
-    for filename in files:
-        data = load_file(filename, target_column, target_value)
-        if conversion_dict is not None:
-            data = define_types(data, conversion_dict)
-        if map_dict is not None:
-            data = define_targets(data,map_dict)
-        result_data, count = call_diagnoser(data, result_data, config, relevant_attributes, count)
+    fingerprint = run_fingerprint(config, relevant_attributes, target_column, target_value, conversion_dict, map_dict)
+    writer = ResultWriter(f"../analysis/diagnosis_result_{result_name}.csv", flush_every, resume, fingerprint)
+    combination_list = attribute_combinations(relevant_attributes)
+    count = writer.count
+    # only the columns needed for the diagnosis are read
+    schema = file_schema(relevant_attributes, target_column, conversion_dict, map_dict)
+    targets = diagnosis_targets(target_value)
+    load_options = {"target_column": target_column, "target_value": target_value, "schema": schema, "engine": engine,
+                    "conversion_dict": conversion_dict, "map_dict": map_dict}
+    # combinations of every file that are not completed yet
+    pending = [[combination for combination in combination_list
+                if not writer.is_completed(os.path.basename(filename), combination)] for filename in files]
+    files = [filename for filename, combinations_of_file in zip(files, pending) if len(combinations_of_file) > 0]
+    pending = [combinations_of_file for combinations_of_file in pending if len(combinations_of_file) > 0]
+
+    if file_workers > 1:
+        file_outcomes = parallel_files(files, pending, config, relevant_attributes, targets, load_options,
+                                       file_workers, max_memory)
+        for filename, combinations_of_file, outcomes in zip(files, pending, file_outcomes):
+            _, count = collect_results(combinations_of_file, replay(outcomes), None, count, writer,
+                                       os.path.basename(filename))
+    else:
+        for filename, data in zip(files, prefetch_files(files, load_options, background=workers <= 1)):
+            _, count = call_diagnoser(data, None, config, relevant_attributes, count, workers, chunk_size, writer,
+                                      os.path.basename(filename), targets)
+            # rule evaluations of this file are not needed for the next one
+            config.cache.invalidate(dataset_token(data))
+
+    writer.close()
+
+
+def run_fingerprint(config : Settings, relevant_attributes : Dict[str, str], target_column : str, target_value : any,
+                    conversion_dict : Dict[str, list] = None, map_dict : Dict[str, list] = None):
+    """
+    Identifies the settings of a run, so that a run is only resumed with the settings it was started with.
+
+    The fingerprint covers the fields of config (except the rule cache and the debug print function), the
+    thresholds and weights in cfg, the attributes and their types, the target and the column conversions.
+
+    Returns
+    -------
+    Hex digest of the settings
+    """
+    settings = {
+        "config": {field.name: getattr(config, field.name) for field in fields(config)
+                   if field.name not in ("cache", "debug_print_function")},
+        "cfg": {name: value for name, value in vars(cfg).items()
+                if not name.startswith("_") and isinstance(value, (bool, int, float, str))},
+        "relevant_attributes": relevant_attributes,
+        "target_column": target_column,
+        "target_value": target_value,
+        "conversion_dict": conversion_dict,
+        "map_dict": map_dict,
+    }
+    return hashlib.sha256(json.dumps(settings, sort_keys=True, default=repr).encode()).hexdigest()
 
-    result_data.to_csv(f"../analysis/diagnosis_result_{result_name}.csv", index=False)
+
+def prepare_file(file_path : str, target_column : str, target_value : any, schema : Dict[str, str] = None, engine : str = None,
+                 conversion_dict : Dict[str, list] = None, map_dict : Dict[str, list] = None):
+    """
+    Loads a file (see load_file) and converts its columns as defined by conversion_dict and map_dict.
+
+    Returns
+    -------
+    Data of the file, ready to be diagnosed
+    """
+    data = load_file(file_path, target_column, target_value, schema, engine)
+    if conversion_dict is not None:
+        data = define_types(data, conversion_dict)
+    if map_dict is not None:
+        data = define_targets(data,map_dict)
+    return data
 
 
-def call_diagnoser(data : pd.DataFrame, result_data : pd.DataFrame, config : Settings, relevant_attributes : Dict[str, str], count : int):
+def prefetch_files(files : List[str], load_options : Dict[str, any], background : bool = True):
+    """
+    Loads and preprocesses the files one after another (see prepare_file). While a file is processed by the caller,
+    the next one is already loaded by a background thread, so at most two files are held in memory.
+
+    The loader thread may still be running while the caller processes a file, so the caller must not fork
+    (e.g., start a "fork" process pool) in the meantime; with background = False the files are loaded in the
+    calling thread, when they are requested.
+
+    Parameters
+    ----------
+    files : List[str]
+        Paths to the files
+    load_options : Dict[str, any]
+        Arguments of prepare_file besides the file path
+    background : bool
+        Load the next file in a background thread (default : True)
+
+    Returns
+    -------
+    Generator of the data of each file, in the order of files
+    """
+    if len(files) == 0:
+        return
+    if not background:
+        for filename in files:
+            yield prepare_file(filename, **load_options)
+        return
+    with ThreadPoolExecutor(max_workers=1) as loader:
+        future = loader.submit(prepare_file, files[0], **load_options)
+        for k in range(len(files)):
+            data = future.result()
+            if k + 1 < len(files):
+                future = loader.submit(prepare_file, files[k + 1], **load_options)
+            yield data
+
+
+# Rough number of bytes a file takes in memory while it is diagnosed (data, encoded columns and predicate masks),
+# per byte of CSV
+MEMORY_PER_FILE_BYTE = 10
+
+
+# Estimated number of bytes the file takes in memory while it is diagnosed
+def file_memory(file_path : str):
+    return os.path.getsize(file_path) * MEMORY_PER_FILE_BYTE
+
+
+def parallel_files(files : List[str], combination_lists : List[List[Dict[str, str]]], config : Settings,
+                   relevant_attributes : Dict[str, str], targets : List[Target], load_options : Dict[str, any],
+                   file_workers : int, max_memory : int = None):
+    """
+    Diagnoses files in a pool of worker processes, each file in one worker (see _diagnose_file_in_worker).
+
+    A file is started when fewer than file_workers files are running and the estimated memory of the running files
+    (see file_memory) stays within max_memory, in the order of files. A worker loads and preprocesses its file itself,
+    so loading overlaps with the diagnosis of the other files. Every worker starts with an empty rule cache of the same
+    size as config.cache.
+
+    Parameters
+    ----------
+    files : List[str]
+        Paths to the files
+    combination_lists : List[List[Dict[str, str]]]
+        Attribute combinations to diagnose for each file
+    config : Settings
+        Adapts the default settings
+    relevant_attributes: Dict[str, str]
+         Mapping for all attributes to their type
+    targets : List[Target]
+        Targets to diagnose
+    load_options : Dict[str, any]
+        Arguments of prepare_file besides the file path
+    file_workers : int
+        Number of files diagnosed at the same time
+    max_memory : int
+        Estimated number of bytes the running files may take (default : None, no limit)
+
+    Returns
+    -------
+    Generator of the outcomes (printed output, rule statistics or None) of the combinations of each file,
+    in the order of files
+    """
+    worker_config = replace(config, cache=RuleCache(config.cache.max_entries, config.cache.max_bytes))
+    estimates = [file_memory(filename) for filename in files]
+    running = {}
+    finished = {}
+    next_file = 0
+    used_memory = 0
+    with ProcessPoolExecutor(max_workers=file_workers, mp_context=pool_context()) as executor:
+        for k in range(len(files)):
+            while k not in finished:
+                # start files in order while there is room for them (at least one file is always running)
+                while next_file < len(files) and len(running) < file_workers and \
+                        (len(running) == 0 or max_memory is None or used_memory + estimates[next_file] <= max_memory):
+                    future = executor.submit(_diagnose_file_in_worker, files[next_file], combination_lists[next_file],
+                                             worker_config, relevant_attributes, targets, load_options)
+                    running[future] = next_file
+                    used_memory += estimates[next_file]
+                    next_file += 1
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    index = running.pop(future)
+                    used_memory -= estimates[index]
+                    finished[index] = future.result()
+            yield finished.pop(k)
+
+
+def _diagnose_file_in_worker(file_path : str, combination_list : List[Dict[str, str]], config : Settings,
+                             relevant_attributes : Dict[str, str], targets : List[Target], load_options : Dict[str, any]):
+    data = prepare_file(file_path, **load_options)
+    catalog = file_catalog(data, config, relevant_attributes, targets)
+    return [diagnose_captured(data, config, combination, catalog, targets) for combination in combination_list]
+
+
+def call_diagnoser(data : pd.DataFrame, result_data : pd.DataFrame, config : Settings, relevant_attributes : Dict[str, str], count : int,
+                   workers : int = 1, chunk_size : int = 1, writer : "ResultWriter" = None, file_name : str = None,
+                   targets : List[Target] = None):
     """
     Iterates through all attributes and combines up to min(4,len(relevant_attributes)+1) attributes to use them as an input for the "discover" function.
     Calls "discover" function and saves the results by adding to the result_data.
 
+    With workers > 1 the combinations are diagnosed concurrently by a pool of worker processes. Each worker receives
+    the data once (not once per combination); results and printed output are merged in combination order,
+    so the outcome is the same as with a single process.
+
+    If a writer is given, the results are passed to the writer instead of being added to result_data, and
+    combinations the writer has already completed for file_name are skipped.
+
     Parameters
     ----------
     data : pd.DataFrame
@@ -59,39 +282,366 @@ def call_diagnoser(data : pd.DataFrame, result_data : pd.DataFrame, config : Set
          Mapping for all attributes to their type
     count : int
         Increments after each attribute combination is tested
+    workers : int
+        Number of worker processes (default : 1, the combinations are diagnosed in this process)
+    chunk_size : int
+        Number of combinations handed to a worker at once (default : 1)
+    writer : ResultWriter
+        Sink for the results of each combination (default : None, results are added to result_data)
+    file_name : str
+        Name of the data file, used by the writer to record completed combinations
+    targets : List[Target]
+        Targets to diagnose, all sharing the same predicates (default : None, the "target" column being True)
 
     Returns
     -------
     Complemented result data and the incremented count
     """
-    target = Target("target", True)
+    combination_list = attribute_combinations(relevant_attributes)
+    if writer is not None:
+        combination_list = [combination for combination in combination_list
+                            if not writer.is_completed(file_name, combination)]
+
+    if targets is None:
+        targets = [Target("target", True)]
+    catalog = file_catalog(data, config, relevant_attributes, targets)
 
+    if workers > 1:
+        outcomes = parallel_sweep(data, config, combination_list, workers, chunk_size, catalog, targets)
+    else:
+        outcomes = (diagnose_combination(data, config, combination, catalog, targets) for combination in combination_list)
+
+    return collect_results(combination_list, outcomes, result_data, count, writer, file_name)
+
+
+def file_catalog(data : pd.DataFrame, config : Settings, relevant_attributes : Dict[str, str], targets : List[Target]):
+    """
+    Generates and filters the predicates of every attribute once for all combinations (and targets) of the data.
+
+    Returns
+    -------
+    Predicate catalog of the data
+    """
+    catalog = predicate_catalog(data, targets[0], config)
+    for target in targets:
+        catalog.for_target(target).filter(catalog.generate(relevant_attributes))
+    return catalog
+
+
+def collect_results(combination_list : List[Dict[str, str]], outcomes, result_data : pd.DataFrame, count : int,
+                    writer : "ResultWriter" = None, file_name : str = None):
+    """
+    Numbers the rule statistics of the combinations and passes them to the writer, or adds them to result_data.
+
+    Parameters
+    ----------
+    combination_list : List[Dict[str, str]]
+        Attribute combinations of the outcomes
+    outcomes : Iterable[pd.DataFrame]
+        Rule statistics (or None) of each combination, in combination order
+    result_data : pd.DataFrame
+         Contains the (already collected) results
+    count : int
+        Increments for each combination with results
+    writer : ResultWriter
+        Sink for the results of each combination (default : None, results are added to result_data)
+    file_name : str
+        Name of the data file, used by the writer to record completed combinations
+
+    Returns
+    -------
+    Complemented result data and the incremented count
+    """
+    # results are concatenated once at the end (concatenating after every combination is quadratic)
+    result_frames = [result_data]
+    for combination, result_df in zip(combination_list, outcomes):
+        if result_df is not None:
+            count += 1
+            print(count)
+            print("\n")
+        if writer is not None:
+            writer.write(file_name, combination, result_df, count)
+        elif result_df is not None:
+            result_frames.append(result_df)
+
+    if writer is None:
+        result_data = pd.concat(result_frames, ignore_index=True)
+    return result_data, count
+
+
+class ResultWriter:
+    """
+    Append-only sink for the results of start_diagnosis.
+
+    Results of attribute combinations are buffered and appended to a CSV file every flush_every combinations.
+    After each flush, the completed (file, attribute combination) pairs, the running count and the size of the
+    CSV file are appended to a progress file next to it (<path>.progress, one JSON object per line).
+    When resuming, rows written after the last recorded flush are cut off and the recorded pairs are skipped,
+    so a crash loses at most the last flush_every combinations. The first line of the progress file records
+    the fingerprint of the run; a progress file with another fingerprint is not resumed.
+
+    Parameters
+    ----------
+    path : str
+        Path of the result CSV file
+    flush_every : int
+        Number of attribute combinations buffered before writing (default : 50)
+    resume : bool
+        Continue from the progress file of a previous run instead of overwriting its results (default : False)
+    fingerprint : str
+        Identifies the settings of the run (see run_fingerprint, default : None)
+    """
+    def __init__(self, path : str, flush_every : int = 50, resume : bool = False, fingerprint : str = None):
+        self.path = path
+        self.progress_path = path + ".progress"
+        self.flush_every = flush_every
+        self.fingerprint = fingerprint
+        self.count = 0
+        self._completed = set()
+        self._pending_keys = []
+        self._pending_frames = []
+        offset = self._load_progress() if resume else 0
+        # the new progress file replaces the old one before the CSV is cut off, so that a crash in between
+        # never leaves an empty (or missing) progress file next to results that are still needed
+        self._replace_progress(offset)
+        if os.path.exists(self.path):
+            os.truncate(self.path, offset)
+
+    @staticmethod
+    def _key(file_name : str, combination : Dict[str, str]):
+        return (file_name, tuple(combination))
+
+    def _load_progress(self):
+        offset = 0
+        if not os.path.exists(self.progress_path):
+            return offset
+        with open(self.progress_path) as progress_file:
+            for (k, line) in enumerate(progress_file):
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    # the last line may be incomplete if the previous run was killed while writing it
+                    break
+                if k == 0 and entry.get("fingerprint") != self.fingerprint:
+                    # results of a run with other settings, start over
+                    return 0
+                offset = entry["offset"]
+                self.count = entry["count"]
+                self._completed.update((file_name, tuple(combination)) for file_name, combination in entry["completed"])
+        return offset
+
+    def _progress_line(self, offset : int, keys):
+        entry = {
+            "offset": offset,
+            "count": self.count,
+            "completed": [[file_name, list(combination)] for file_name, combination in sorted(keys)],
+        }
+        return json.dumps(entry) + "\n"
+
+    def _write_progress(self, offset : int, keys):
+        with open(self.progress_path, "a") as progress_file:
+            progress_file.write(self._progress_line(offset, keys))
+            progress_file.flush()
+            os.fsync(progress_file.fileno())
+
+    # Atomically replaces the progress file by one recording the fingerprint and all completed pairs
+    def _replace_progress(self, offset : int):
+        temp_path = self.progress_path + ".tmp"
+        with open(temp_path, "w") as progress_file:
+            progress_file.write(json.dumps({"fingerprint": self.fingerprint, "offset": 0, "count": 0, "completed": []}) + "\n")
+            progress_file.write(self._progress_line(offset, self._completed))
+            progress_file.flush()
+            os.fsync(progress_file.fileno())
+        os.replace(temp_path, self.progress_path)
+
+    def is_completed(self, file_name : str, combination : Dict[str, str]):
+        return self._key(file_name, combination) in self._completed
+
+    def write(self, file_name : str, combination : Dict[str, str], result_df : pd.DataFrame, count : int):
+        """
+        Records the result of an attribute combination (None if no rules were found) and the count after it.
+        """
+        key = self._key(file_name, combination)
+        self._completed.add(key)
+        self._pending_keys.append(key)
+        if result_df is not None:
+            self._pending_frames.append(result_df)
+        self.count = count
+        if len(self._pending_keys) >= self.flush_every:
+            self.flush()
+
+    def flush(self):
+        if len(self._pending_keys) == 0:
+            return
+        if len(self._pending_frames) > 0:
+            header = not os.path.exists(self.path) or os.path.getsize(self.path) == 0
+            pd.concat(self._pending_frames, ignore_index=True).to_csv(self.path, mode="a", header=header, index=False)
+        offset = os.path.getsize(self.path) if os.path.exists(self.path) else 0
+        self._write_progress(offset, keys=self._pending_keys)
+        self._pending_keys = []
+        self._pending_frames = []
+
+    def close(self):
+        self.flush()
+        if not os.path.exists(self.path):
+            # no rules were found at all
+            pd.DataFrame().to_csv(self.path, index=False)
+
+
+def attribute_combinations(relevant_attributes : Dict[str, str]):
+    """
+    Lists all combinations of 1 up to 4 relevant attributes (in the order in which they are diagnosed).
+
+    Parameters
+    ----------
+    relevant_attributes: Dict[str, str]
+         Mapping for all attributes to their type
+
+    Returns
+    -------
+    List of mappings from the attributes of a combination to their type
+    """
+    combination_list = []
     for r in range(1, min(5, len(relevant_attributes) + 1)):
         for combination_keys in combinations(relevant_attributes.keys(), r):
-                combination = {key: relevant_attributes[key] for key in combination_keys}
-                print(combination)
-                result = discover(data, target, combination, config)
-                rules = result.rules
-                if len(rules) == 0:
-                    continue
-                result = Result(rules, data, target)
-                result.print()
-                result_df = result.dataframe()
-                pos, neg = partition(data, target)
-                result_df["Target"] = len(pos) / len(data)
-                result_df["Sample size"] = len(data)
-                result_data = pd.concat([result_data, result_df], ignore_index=True)
-                count += 1
-                print(count)
-                print("\n")
+            combination_list.append({key: relevant_attributes[key] for key in combination_keys})
+    return combination_list
+
+
+def diagnose_combination(data : pd.DataFrame, config : Settings, combination : Dict[str, str], catalog : PredicateCatalog = None,
+                         targets : List[Target] = None):
+    """
+    Calls "discover" for a single attribute combination and prints the resulting rules.
+    With several targets, the rules of every target are returned together, with the target value of each rule
+    in a "Target value" column.
+
+    Parameters
+    ----------
+    data : pd.DataFrame
+        Synthetic tabular data to be analyzed
+    config : Settings
+        Adapts the default settings
+    combination : Dict[str, str]
+        Mapping for the attributes of the combination to their type
+    catalog : PredicateCatalog
+        Predicates of the data shared by all combinations (optional)
+    targets : List[Target]
+        Targets to diagnose (default : None, the "target" column being True)
+
+    Returns
+    -------
+    Rule statistics of the combination, None if no rules were found
+    """
+    if targets is None:
+        targets = [Target("target", True)]
+    print(combination)
+    result_frames = []
+    for target, result in discover_targets(data, targets, combination, config, catalog).items():
+        rules = result.rules
+        if len(rules) == 0:
+            continue
+        result = Result(rules, data, target, index=result.index)
+        result.print()
+        result_df = result.dataframe()
+        pos, neg = partition(data, target)
+        result_df["Target"] = len(pos) / len(data)
+        result_df["Sample size"] = len(data)
+        if len(targets) > 1:
+            result_df["Target value"] = target.value
+        result_frames.append(result_df)
+    if len(result_frames) == 0:
+        return None
+    if len(result_frames) == 1:
+        return result_frames[0]
+    return pd.concat(result_frames)
 
-    return result_data, count
 
+# Data, settings and predicate catalog of a worker process, set once by _init_worker
+_worker_data = None
+_worker_config = None
+_worker_catalog = None
+_worker_targets = None
 
-def load_file(file_path : str, target_column : str, target_value : any):
+
+def _init_worker(data : pd.DataFrame, config : Settings, catalog : PredicateCatalog, targets : List[Target]):
+    global _worker_data, _worker_config, _worker_catalog, _worker_targets
+    _worker_data = data
+    _worker_config = config
+    _worker_catalog = catalog
+    _worker_targets = targets
+
+
+def _diagnose_in_worker(combination : Dict[str, str]):
+    return diagnose_captured(_worker_data, _worker_config, combination, _worker_catalog, _worker_targets)
+
+
+# Same as diagnose_combination, returns the printed output together with the rule statistics
+def diagnose_captured(data : pd.DataFrame, config : Settings, combination : Dict[str, str], catalog : PredicateCatalog,
+                      targets : List[Target]):
+    output = io.StringIO()
+    with redirect_stdout(output):
+        result_df = diagnose_combination(data, config, combination, catalog, targets)
+    return output.getvalue(), result_df
+
+
+# Prints the output of each outcome (printed output, rule statistics) and yields its rule statistics
+def replay(outcomes):
+    for output, result_df in outcomes:
+        print(output, end="")
+        yield result_df
+
+
+# Multiprocessing context of the worker pools: "fork" where available, so that data is inherited without being pickled
+def pool_context():
+    if "fork" in multiprocessing.get_all_start_methods():
+        return multiprocessing.get_context("fork")
+    return multiprocessing.get_context()
+
+
+def parallel_sweep(data : pd.DataFrame, config : Settings, combination_list : List[Dict[str, str]], workers : int, chunk_size : int = 1,
+                   catalog : PredicateCatalog = None, targets : List[Target] = None):
+    """
+    Diagnoses attribute combinations in a pool of worker processes.
+
+    The data is passed to every worker once, when the worker starts (with the "fork" start method, where available,
+    it is inherited without being pickled). Every worker starts with an empty rule cache of the same size as config.cache.
+    Printed output of each combination is replayed in combination order.
+
+    Parameters
+    ----------
+    data : pd.DataFrame
+        Synthetic tabular data to be analyzed
+    config : Settings
+        Adapts the default settings
+    combination_list : List[Dict[str, str]]
+        Attribute combinations to diagnose
+    workers : int
+        Number of worker processes
+    chunk_size : int
+        Number of combinations handed to a worker at once
+    catalog : PredicateCatalog
+        Predicates of the data shared by all combinations (optional, passed to the workers together with the data)
+    targets : List[Target]
+        Targets to diagnose (default : None, the "target" column being True)
+
+    Returns
+    -------
+    Generator of the rule statistics (or None) of each combination, in combination order
+    """
+    worker_config = replace(config, cache=RuleCache(config.cache.max_entries, config.cache.max_bytes))
+    with ProcessPoolExecutor(max_workers=workers, mp_context=pool_context(),
+                             initializer=_init_worker, initargs=(data, worker_config, catalog, targets)) as executor:
+        yield from replay(executor.map(_diagnose_in_worker, combination_list, chunksize=chunk_size))
+
+
+def load_file(file_path : str, target_column : str, target_value : any, schema : Dict[str, str] = None, engine : str = None):
     """
     Loads file and drops the first column because GReaT generates an <anonymous> column.
     Maps the target value within the target column to "True" and everything else to "False and adds this as "target" column to the data frame.
+    If target_value is a list of values, the "target" column is a copy of the target column instead (see diagnosis_targets).
+
+    If a schema is given (see file_schema), only the columns of the schema are read, discrete attributes holding strings
+    are stored as categoricals and integer columns are downcast (see read_options, categorize and downcast).
 
     Parameters
     ----------
@@ -101,17 +651,180 @@ def load_file(file_path : str, target_column : str, target_value : any):
         Name of the column of interest
     target_value : any
         Value of the target that will be mapped to "True", any other value in the target_column will be mapped to "False"
+    schema : Dict[str, str]
+        Mapping for the columns to read to their type (default : None, all columns are read with inferred types)
+    engine : str
+        CSV parser used by pandas, "pyarrow" is used only if it is installed (default : None, the pandas default)
 
     Returns
     -------
     Adapted synthetic data file
     """
-    data = pd.read_csv(filepath_or_buffer=file_path)
-    data = data.drop(data.columns[0], axis=1)
-    data["target"] = data[target_column].map(lambda x: map_to_bool(x, target_value))
+    if schema is None:
+        data = pd.read_csv(filepath_or_buffer=file_path, **engine_option(engine))
+        data = data.drop(data.columns[0], axis=1)
+    else:
+        data = pd.read_csv(filepath_or_buffer=file_path, **read_options(schema), **engine_option(engine))
+        data = downcast(categorize(data, schema), schema)
+    if isinstance(target_value, list):
+        data["target"] = data[target_column]
+    else:
+        data["target"] = (data[target_column] == target_value).to_numpy(dtype=bool, na_value=False)
     return data
 
 
+def diagnosis_targets(target_value : any):
+    """
+    Targets of the "target" column added by load_file.
+
+    Parameters
+    ----------
+    target_value : any
+        Value of the target, or a list of values of the target column that are each diagnosed as a target
+
+    Returns
+    -------
+    List of targets
+    """
+    if isinstance(target_value, list):
+        return [Target("target", value) for value in target_value]
+    return [Target("target", True)]
+
+
+def file_schema(relevant_attributes : Dict[str, str], target_column : str, conversion_dict : Dict[str, list] = None,
+                map_dict : Dict[str, list] = None):
+    """
+    Derives the columns (and their types) that have to be read from a file to diagnose it.
+
+    Parameters
+    ----------
+    relevant_attributes : Dict[str, str]
+        Mapping for all attributes to their type (D (discrete), I (Int), C (Continuous))
+    target_column : str
+        Name of the column of interest
+    conversion_dict : Dict[str, list]
+        Mapping for columns defined in the list to a certain data type (default : None)
+    map_dict : Dict[str, list]
+        Mapping for columns containing 0.0 and 1.0 to meaningful values (default : None)
+
+    Returns
+    -------
+    Mapping for the columns to read to their type: D, I, C, or "raw" for columns that are converted after reading
+    (the target column and the columns of conversion_dict and map_dict)
+    """
+    schema = dict(relevant_attributes)
+    schema[target_column] = "raw"
+    for columns in (conversion_dict or {}).values():
+        for column in columns:
+            schema[column] = "raw"
+    for column in (map_dict or {}):
+        schema[column] = "raw"
+    return schema
+
+
+def read_options(schema : Dict[str, str]):
+    """
+    Arguments of pd.read_csv for the columns of a schema (see file_schema): only these columns are read,
+    with inferred types (see categorize for the discrete attributes).
+    """
+    return {
+        "usecols": list(schema),
+    }
+
+
+def categorize(data : pd.DataFrame, schema : Dict[str, str]):
+    """
+    Stores the discrete attributes (D) of a schema that hold strings as categoricals. Discrete attributes holding
+    numbers or booleans keep their inferred type, so that their predicates are filtered as without a schema
+    (see Predicates.count_positives).
+    """
+    for column, column_type in schema.items():
+        dtype = data[column].dtype
+        if column_type == "D" and (pd.api.types.is_object_dtype(dtype) or pd.api.types.is_string_dtype(dtype)):
+            data[column] = data[column].astype("category")
+    return data
+
+
+def engine_option(engine : str = None):
+    """
+    Arguments of pd.read_csv selecting the CSV parser. The pyarrow parser needs pandas 1.4 or later (requirements.txt
+    pins 1.3.2) and pyarrow; if either is missing, the default (C) parser is used.
+    """
+    if engine is None:
+        return {}
+    if engine == "pyarrow":
+        if _pandas_version() < (1, 4):
+            return {}
+        try:
+            import pyarrow  # noqa: F401
+        except ImportError:
+            return {}
+    return {"engine": engine}
+
+
+# (major, minor) version of pandas
+def _pandas_version():
+    return tuple(int(part) for part in pd.__version__.split(".")[:2])
+
+
+def downcast(data : pd.DataFrame, schema : Dict[str, str]):
+    """
+    Stores the integer attributes (I) of a schema in 32 bits if their values (and the differences between them) fit.
+    Continuous attributes keep their type, as the cutoffs of their predicates are taken from their values.
+    """
+    for column, column_type in schema.items():
+        if column_type != "I" or not pd.api.types.is_integer_dtype(data[column].dtype) or len(data) == 0:
+            continue
+        min_value, max_value = int(data[column].min()), int(data[column].max())
+        if max_value - min_value < 2**31 and -2**31 <= min_value and max_value < 2**31:
+            data[column] = data[column].astype(np.int32)
+    return data
+
+
+def load_file_chunks(file_path : str, target_column : str, target_value : any, chunk_size : int = 100000,
+                     conversion_dict : Dict[str, list] = None, map_dict : Dict[str, list] = None,
+                     schema : Dict[str, str] = None):
+    """
+    Chunked counterpart of load_file (including define_types and define_targets) for files that do not fit in memory.
+    The result can be passed to discover_stream, which reads the file several times.
+
+    Parameters
+    ----------
+    file_path : str
+        Path to the file to be analyzed
+    target_column : str
+        Name of the column of interest
+    target_value : any
+        Value of the target that will be mapped to "True", any other value in the target_column will be mapped to "False"
+    chunk_size : int
+        Number of rows read at a time (default : 100000)
+    conversion_dict : Dict[str, list]
+        Mapping for columns defined in the list to a certain data type (default : None)
+    map_dict : Dict[str, list]
+        Mapping for columns containing 0.0 and 1.0 to meaningful values (default : None)
+    schema : Dict[str, str]
+        Mapping for the columns to read to their type (default : None, see load_file)
+
+    Returns
+    -------
+    Function that reads the file anew every time it is called, yielding one adapted data frame of at most chunk_size rows at a time
+    """
+    def chunks():
+        options = read_options(schema) if schema is not None else {}
+        for data in pd.read_csv(filepath_or_buffer=file_path, chunksize=chunk_size, **options):
+            if schema is None:
+                data = data.drop(data.columns[0], axis=1)
+            else:
+                data = categorize(data, schema)
+            data["target"] = (data[target_column] == target_value).to_numpy(dtype=bool, na_value=False)
+            if conversion_dict is not None:
+                data = define_types(data, conversion_dict)
+            if map_dict is not None:
+                data = define_targets(data, map_dict)
+            yield data
+    return chunks
+
+
 def map_to_bool(value : any, target_value: any):
     """
     Maps the value to True if it equals the target_value.
@@ -168,6 +881,8 @@ def define_targets(data, map_dict):
     Readability enhanced data
     """
     for column, values in map_dict.items():
-        data[column] = data[column].apply(lambda x: values[0] if x == 0.0 else (values[1] if x == 1.0 else None))
+        column_values = data[column].to_numpy()
+        mapped = np.select([column_values == 0.0, column_values == 1.0], [values[0], values[1]], default=None)
+        data[column] = pd.Series(mapped, index=data.index, dtype=object).infer_objects()
     return data
 
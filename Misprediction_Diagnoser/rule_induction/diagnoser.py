@@ -7,15 +7,24 @@
 
 from typing import Dict, List
 from collections.abc import Callable
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 import collections
 import pandas as pd
+import numpy as np
 
 from rules.ruleset import generate_ruleset, RuleSet
 from rules.rule import Rule
 from rules.conjuncts import generate_conjuncts
-from util import sorted_pareto_optimal_rules, partition, ConfusionMatrix, BinningMethod, debug_list_log, bold, percent_format
+from rules.catalog import PredicateCatalog
+from rules.implication import ImplicationMatrix
+from rules.scoring import RuleScorer
+from rules.coverage import CoverageIndex
+from rules.bitset import Bitset
+from rules.cache import RuleCache, dataset_token
+from util import sorted_pareto_optimal_rules, rule_statistics, statistics_table, partition, ConfusionMatrix, BinningMethod, debug_list_log, bold, percent_format
 import rules.predicate as Predicates
+import rules.streaming as Streaming
+import rules.sampling as Sampling
 import cfg as cfg
 import timing as Timing
 
@@ -52,6 +61,31 @@ class Settings:
 
     target_coverage : float
         The percentage of target that we want to cover (only applicable if Settings.disjunctions=True)
+
+    cache : RuleCache
+        Bounded cache of rule evaluations, shared by all discover calls using these settings
+
+    batched_search : bool
+        Score all extensions of a beam rule at once with vectorized mask operations
+        instead of evaluating them one by one (both find the same rules)
+
+    stream_chunk_size : int
+        Number of rows read at a time by discover_stream
+
+    sketch_size : int
+        Number of distinct values of a numerical attribute kept by discover_stream to place
+        the equal frequency cutoffs (see rules/streaming.py, QuantileSketch)
+
+    sample_size : int
+        If set, predicates are filtered and the beam search runs on a stratified sample of this many rows
+        (keeping the share of the target). Only the final beam is scored on the full data, and the result
+        reports how far the sample-based scores are off (see rules/sampling.py, SampleReport)
+
+    sample_confidence : float
+        Confidence level of the precision and recall bounds reported for a sample
+
+    sample_seed : int
+        Seed of the random sample
     """
     beam_width: int = 10
     num_rules: int = 3
@@ -62,13 +96,22 @@ class Settings:
     all_rules: bool = False
     disjunctions: bool = False
     debug_print_function: Callable = None
+    cache: RuleCache = field(default_factory=RuleCache, compare=False, repr=False)
+    batched_search: bool = True
+    stream_chunk_size: int = 100000
+    sketch_size: int = 4096
+    sample_size: int = None
+    sample_confidence: float = 0.95
+    sample_seed: int = 0
 
 
+@Timing.traced
 def discover(
     df: pd.DataFrame,
     target: Target,
     relevant_attributes: Dict[str, str],
-    config: Settings = None
+    config: Settings = None,
+    catalog: PredicateCatalog = None
 ):
     """
     Discovers rules (conjunction of predicates over attributes) that succinctly
@@ -96,6 +139,10 @@ def discover(
     config : Settings
         Contains all configurable settings
 
+    catalog : PredicateCatalog
+        Predicates (and their masks) of df, shared between discover calls on df (optional, see predicate_catalog).
+        A catalog created for another target is used through catalog.for_target(target)
+
     sample : pd.DataFrame
         A representative sample of the full dataset (optional)
 
@@ -108,59 +155,254 @@ def discover(
     if config is None:
         config = Settings()
 
-    # partition into positive and negative data subsets (wrt. target_attribute)
-    (positive_df, negative_df) = partition(df, target)
+    # fingerprint the dataset once (again, in case it was modified in place since the last call),
+    # cache lookups use its token from here on
+    dataset_token(df, verify=True)
+
+    if catalog is None:
+        catalog = predicate_catalog(df, target, config)
+    else:
+        catalog = catalog.for_target(target)
 
-    all_predicates = Predicates.generate(df, relevant_attributes, config.num_bins, config.binning_method)
+    with Timing.span('generate predicates'):
+        all_predicates = catalog.generate(relevant_attributes)
 
     # print features before and after filtering
     debug_list_log("Predicates before filter: {}".format(len(all_predicates)), all_predicates, config.debug_print_function)
 
     # filter predicates that do not meet our thresholds
-    relevant_predicates = Predicates.filter(all_predicates, df, positive_df, cfg.pred_relevance_threshold, config.minimum_relative_coverage)
+    with Timing.span('filter predicates'):
+        relevant_predicates = catalog.filter(all_predicates)
     debug_list_log("Predicates after filter: {}".format(len(relevant_predicates)), relevant_predicates, config.debug_print_function)
 
+    # masks of the relevant predicates are computed once per catalog; rules are evaluated on them
+    # search_df is df, or a sample of df if config.sample_size is set
+    search_df = catalog.df
+    search_index = catalog.index
+
+    # implication and usefulness relations between the relevant predicates, shared by all beam searches of this call
+    implications = ImplicationMatrix(relevant_predicates)
+
     # generate beam_width number of rules
-    rules = generate_conjuncts(df, target, relevant_predicates, config.beam_width)
+    rules = generate_conjuncts(search_df, target, relevant_predicates, config.beam_width, search_index, config.cache,
+                               config.batched_search, implications=implications)
+
+    # rules found on a sample are scored again on the full data
+    index = catalog.full_index
+    sample_report = None
+    if catalog.sampled:
+        with Timing.span('rescore'):
+            (rules, sample_report) = Sampling.rescore(rules, target, search_index, index,
+                                                      config.sample_confidence, config.num_rules)
 
     # return all rules if requested in the config
     if config.all_rules and not config.disjunctions:
         time_log = Timing.get_time_log()
-        return Result(rules, df, target, time_log)
+        return Result(rules, df, target, time_log, index, sample_report)
 
     # find the best num_rules that are Pareto optimal
-    pareto_optimal_rules = sorted_pareto_optimal_rules(rules, df, target)
+    pareto_optimal_rules = sorted_pareto_optimal_rules(rules, df, target, index, config.cache)
     best_rules = pareto_optimal_rules[:config.num_rules]
     debug_list_log("Best (pareto-optimal) rules: ", best_rules, config.debug_print_function)
 
     if config.disjunctions:
         final_rule_sets = []
         for r in best_rules:
-            rs = generate_ruleset(r, df, target, relevant_predicates,
-                                    config.target_coverage, config.beam_width)
+            with Timing.span('ruleset', seed=str(r)):
+                rs = generate_ruleset(r, search_df, target, relevant_predicates,
+                                        config.target_coverage, config.beam_width, search_index, config.cache,
+                                        config.batched_search, implications)
             final_rule_sets.append(rs)
-        return DisjunctiveResult(final_rule_sets, df, target)
+        return DisjunctiveResult(final_rule_sets, df, target, index, sample_report)
 
     time_log = Timing.get_time_log()
-    return Result(best_rules, df, target, time_log)
+    return Result(best_rules, df, target, time_log, index, sample_report)
+
+
+def discover_targets(
+    df: pd.DataFrame,
+    targets,
+    relevant_attributes: Dict[str, str],
+    config: Settings = None,
+    catalog: PredicateCatalog = None
+) -> Dict[Target, "Result"]:
+    """
+    Calls discover for several targets of the same dataset.
+
+    Binning, predicate masks and the encoded columns of df do not depend on the target; they
+    are computed once (in one PredicateCatalog) and shared by all targets. Only the relevance
+    of the predicates and the TP counts of the rules are computed for every target.
+
+    Parameters
+    ----------
+
+    df : pd.DataFrame
+        Tabular data as Pandas data frame
+
+    targets : List[Target] or str
+        The targets to diagnose, or the name of a (multi-class) column: every
+        value of the column (except missing values) is diagnosed as a target
+
+    relevant_attributes : Dict[str, str]
+        Mapping from relevant attributes to consider to their type (D (discrete), I (Int), C (Continuous))
+
+    config : Settings
+        Contains all configurable settings
+
+    catalog : PredicateCatalog
+        Predicates (and their masks) of df, for any target (optional, see predicate_catalog)
+
+    Returns
+    -------
+    Dict[Target, Result]
+        The Result (or DisjunctiveResult) of every target, in the order of targets
+    """
+    if isinstance(targets, str):
+        targets = column_targets(df, targets)
+    if config is None:
+        config = Settings()
+    if catalog is None and len(targets) > 0:
+        catalog = predicate_catalog(df, targets[0], config)
+    return {target: discover(df, target, relevant_attributes, config, catalog) for target in targets}
+
+
+# One target per value of a (multi-class) column, in order of appearance
+def column_targets(df: pd.DataFrame, column: str) -> List[Target]:
+    return [Target(column, value) for value in df[column].dropna().unique()]
+
+
+@Timing.traced
+def discover_stream(
+    data,
+    target: Target,
+    relevant_attributes: Dict[str, str],
+    config: Settings = None
+):
+    """
+    Same as discover for data that does not fit in memory: the data is read in chunks of
+    config.stream_chunk_size rows, and only counts are kept between chunks.
+
+    The data is read once to count rows and to sketch the values of every attribute
+    (equal frequency cutoffs come from a bounded quantile sketch, see rules/streaming.py),
+    once to count the rows covered by every predicate, and once per level of the beam search
+    to count the rows covered by all extensions of the beam rules.
+
+    Differences to discover: a rule is only pruned as irrelevant (see rules/conjuncts.py,
+    is_irrelevant) with respect to beam rules made of a subset of its predicates, as the
+    general check needs the covered rows (see rules/streaming.py, is_irrelevant). The beam
+    may thus keep rules that discover prunes, and the rules found can differ from those of
+    discover (e.g., for some settings of the small benchmark preset). Cutoffs of continuous
+    attributes with more than config.sketch_size distinct values are approximate.
+    Disjunctions are not supported.
+
+    Parameters
+    ----------
+
+    data : str, pd.DataFrame or Callable
+        Path to a CSV file, a data frame, or a function returning an iterable of
+        data frames (chunks) every time it is called (see load_file_chunks)
+
+    target : NamedTuple[attribute: str, value: bool]
+        See discover
+
+    relevant_attributes : Dict[str, str]
+        See discover
+
+    config : Settings
+        Contains all configurable settings
+
+    Returns
+    -------
+    StreamingResult containing final rules and their statistics
+    """
+    if config is None:
+        config = Settings()
+    if config.disjunctions:
+        raise Exception("disjunctions are not supported by discover_stream")
+
+    source = Streaming.chunk_source(data, config.stream_chunk_size)
+
+    with Timing.span('scan'):
+        (num_rows, num_pos, sketches) = Streaming.scan(source, target, relevant_attributes, config.sketch_size)
+
+    with Timing.span('generate predicates'):
+        all_predicates = list(Streaming.generate(sketches, relevant_attributes, config.num_bins, config.binning_method))
+    debug_list_log("Predicates before filter: {}".format(len(all_predicates)), all_predicates, config.debug_print_function)
+
+    with Timing.span('filter predicates'):
+        predicate_counts = Streaming.count_predicates(source, target, all_predicates)
+        relevant_predicates = Predicates.filter_counts(
+            set(all_predicates),
+            {pred: nc for (pred, (nc, _)) in predicate_counts.items()},
+            {pred: tp for (pred, (_, tp)) in predicate_counts.items()},
+            num_pos, num_rows, cfg.pred_relevance_threshold, config.minimum_relative_coverage)
+    debug_list_log("Predicates after filter: {}".format(len(relevant_predicates)), relevant_predicates, config.debug_print_function)
+
+    (rules, counts) = Streaming.generate_conjuncts(source, target, relevant_predicates, config.beam_width,
+                                                  num_rows, num_pos, predicate_counts)
+
+    if config.all_rules:
+        best_rules = rules
+    else:
+        best_rules = Streaming.sorted_pareto_optimal_rules(rules, counts, num_pos)[:config.num_rules]
+        debug_list_log("Best (pareto-optimal) rules: ", best_rules, config.debug_print_function)
+
+    statistics = statistics_table(
+        list(best_rules),
+        np.array([counts[r][0] for r in best_rules], dtype=np.int64),
+        np.array([counts[r][1] for r in best_rules], dtype=np.int64),
+        num_pos, num_rows)
+    time_log = Timing.get_time_log()
+    return StreamingResult(best_rules, target, statistics, num_rows, num_pos, time_log)
+
+
+def predicate_catalog(df: pd.DataFrame, target: Target, config: Settings = None):
+    """
+    Creates the catalog of predicates of a dataset for the binning and filtering settings in config.
+    Passing the catalog to several discover calls on the same dataset (e.g., for different attribute
+    combinations) generates and filters the predicates of each attribute only once.
+    """
+    if config is None:
+        config = Settings()
+    return PredicateCatalog(df, target, config.num_bins, config.binning_method,
+                            cfg.pred_relevance_threshold, config.minimum_relative_coverage,
+                            config.sample_size, config.sample_seed)
 
 
 class ConfusionMatrixRuleSet(ConfusionMatrix):
+    # A ruleset covers the union (OR of the masks) of the rows covered by its rules
     def coverage(self, ruleset, df=None):
         if df is None:
             df = self.df
+        index = self.index if df is self.index.df else CoverageIndex(df)
+        return df[union_mask(ruleset, index).to_mask()]
 
-        subgroups = [df.query(rule.dataframe_query()) for rule in ruleset.elems]
-        subgroups_merged = pd.concat(subgroups, join='outer', axis=1).drop_duplicates()
-        return subgroups_merged
+    def coverage_mask(self, ruleset):
+        mask = union_mask(ruleset, self.index)
+        if self.rows is not None:
+            mask = mask & self.rows
+        return mask
+
+
+def union_mask(ruleset: RuleSet, index: CoverageIndex):
+    mask = Bitset.zeros(index.num_rows)
+    for rule in ruleset.elems:
+        mask = mask | index.rule_mask(rule)
+    return mask
 
 
 class Result:
-    def __init__(self, rules: List, df: pd.DataFrame, target: Target, time_log=None):
+    def __init__(self, rules: List, df: pd.DataFrame, target: Target, time_log=None, index: CoverageIndex = None,
+                 sample_report: Sampling.SampleReport = None):
         self.rules = rules
         self.df = df
         self.target = target
         self.time_log = time_log
+        # comparison of sample-based and exact scores, if the rules were found on a sample
+        self.sample_report = sample_report
+        # predicate masks over df, shared by the statistics of all rules
+        self.index = index if index is not None else CoverageIndex(df)
+        self._statistics = None
 
     def __repr__(self):
         final = []
@@ -193,35 +435,39 @@ class Result:
         rules = list(map(Rule.from_string, rule_str.split('\n')))
         return cls(rules, df, target)
 
+    # compiled scorer of the rules, to tag rows of new data with the rules covering them (see rules/scoring.py)
+    def scorer(self, columns: List[str] = None):
+        return RuleScorer.from_result(self, columns)
+
+    # statistics of all rules (see rule_statistics), in the order of self.rules
+    def statistics(self, df: pd.DataFrame = None):
+        if df is not None and df is not self.df:
+            return rule_statistics(self.rules, df, self.target)
+        if self._statistics is None:
+            self._statistics = rule_statistics(self.rules, self.df, self.target, self.index)
+        return self._statistics
+
     def dataframe(self):
-        result = []
-        for rule in self.rules:
-            result.append(self._rule_stats(rule, self.df, self.target))
-        return pd.DataFrame(result).sort_values(by='precision', ascending=False)
+        return self.statistics()[['rule', 'precision', 'recall', 'rule_coverage']].sort_values(by='precision', ascending=False)
 
     # computes precision, recall, coverage for each rule
     def _rule_stats(self, rule: Rule, df: pd.DataFrame, target):
-        stats = ConfusionMatrix(df, target)
-        rule_coverage = stats.num_covered(rule)
-        return {
-            'rule' : str(rule),
-            'precision' : stats.get_tp_ratio(rule),
-            'recall' : stats.get_coverage_ratio(rule),
-            'rule_coverage' : rule_coverage/len(df),
-        }
+        if df is self.df and target == self.target:
+            stats = rule_statistics([rule], df, target, self.index)
+        else:
+            stats = rule_statistics([rule], df, target)
+        return _stats_record(stats.iloc[0])
 
-    def _print_rule(self, rule, df: pd.DataFrame, target):
+    def _print_rule(self, rule, df: pd.DataFrame, target, rule_stat=None):
         target_name, target_value = target
-        rule_stat = self._rule_stats(rule, df, target)
-        stats = ConfusionMatrix(df, target)
+        if rule_stat is None:
+            rule_stat = self._rule_stats(rule, df, target)
 
         print(bold("Subgroup: {}".format(str(rule))))
 
-        overall_coverage = stats.num_covered(rule)
-
         print("% of subgroup in population (Full Dataset):\t{}% ({} rows)".format(
             percent_format(rule_stat['rule_coverage']),
-            overall_coverage)
+            rule_stat['num_covered'])
         )
 
         print("Precision: P({}={} | {}) = {}%".format(
@@ -253,31 +499,102 @@ class Result:
         pos, _ = partition(df, self.target)
         print("% Target in dataset {}%".format(percent_format(len(pos)/len(df))))
 
-        for rule in self.rules:
+        if self.sample_report is not None:
+            print(self.sample_report)
+
+        stats = self.statistics(df)
+        for i, rule in enumerate(self.rules):
             print("="*40)
-            self._print_rule(rule, df, self.target)
+            self._print_rule(rule, df, self.target, _stats_record(stats.iloc[i]))
 
     def get_rule_stats(self):
+        stats = self.statistics()
         return [
-            self._rule_stats(rule, self.df, self.target)
-            for rule in self.rules
+            {key: record[key] for key in ('rule', 'precision', 'recall', 'rule_coverage')}
+            for record in (_stats_record(row) for _, row in stats.iterrows())
         ]
 
 
+# Turns a row of a rule_statistics table into a dict of plain Python values
+def _stats_record(row):
+    return {
+        'rule': row['rule'],
+        'num_covered': int(row['num_covered']),
+        'num_true_positive': int(row['num_true_positive']),
+        'num_false_positive': int(row['num_false_positive']),
+        'precision': float(row['precision']),
+        'recall': float(row['recall']),
+        'rule_coverage': float(row['rule_coverage']),
+        'lift': float(row['lift']),
+    }
+
+
+class StreamingResult(Result):
+    """
+        Result of discover_stream. The data is not kept, the statistics of the rules
+        were counted while streaming over it.
+    """
+    def __init__(self, rules: List, target: Target, statistics: pd.DataFrame, num_rows: int, num_pos: int, time_log=None):
+        self.rules = rules
+        self.df = None
+        self.target = target
+        self.time_log = time_log
+        self.index = None
+        self.sample_report = None
+        self.num_rows = num_rows
+        self.num_pos = num_pos
+        self._statistics = statistics
+
+    def statistics(self, df: pd.DataFrame = None):
+        if df is not None:
+            return rule_statistics(self.rules, df, self.target)
+        return self._statistics
+
+    def print(self, df: pd.DataFrame = None):
+        if df is not None:
+            return Result(self.rules, df, self.target).print()
+
+        print("Subgroup Discovery Result\n")
+        print("Found {} subgroups".format(bold(str(len(self.rules)))))
+
+        print(bold("Dataset"))
+        print("Target: {}={}".format(self.target[0], self.target[1]))
+        print("# Rows:\t{}".format(self.num_rows))
+        print("% Target in dataset {}%".format(percent_format(self.num_pos/self.num_rows)))
+
+        stats = self.statistics()
+        for i, rule in enumerate(self.rules):
+            print("="*40)
+            self._print_rule(rule, None, self.target, _stats_record(stats.iloc[i]))
+
+
 class DisjunctiveResult:
-    def __init__(self, rulesets: List[RuleSet], df: pd.DataFrame, target: Target):
+    def __init__(self, rulesets: List[RuleSet], df: pd.DataFrame, target: Target, index: CoverageIndex = None,
+                 sample_report: Sampling.SampleReport = None):
         self.rulesets = rulesets
         self.df = df
         self.target = target
+        self.sample_report = sample_report
+        # predicate masks over df, shared by the statistics of all rulesets
+        self.index = index if index is not None else CoverageIndex(df)
+        self._stats = None
+        self._statistics = None
 
     # computes precision, recall, coverage for each rule
     def _rule_stats(self, ruleset: RuleSet, df: pd.DataFrame, target):
-        stats = ConfusionMatrixRuleSet(df, target)
-        rule_coverage = stats.num_covered(ruleset)
+        if df is self.df and target == self.target:
+            if self._stats is None:
+                self._stats = ConfusionMatrixRuleSet(df, target, self.index)
+            stats = self._stats
+        else:
+            stats = ConfusionMatrixRuleSet(df, target)
+        covered = stats.coverage_mask(ruleset)
+        rule_coverage = covered.count()
+        num_tp = (covered & stats.pos_mask).count()
         return {
             'ruleset' : str(ruleset),
-            'precision' : stats.get_tp_ratio(ruleset), # coverage of all positive cases given a certain feature
-            'recall' : stats.get_coverage_ratio(ruleset), # coverage of all positive cases
+            'precision' : num_tp / rule_coverage if rule_coverage > 0 else 0, # coverage of all positive cases given a certain feature
+            'recall' : num_tp / stats.num_pos if stats.num_pos > 0 else 0, # coverage of all positive cases
             'rule_coverage' : rule_coverage/len(df) # coverage of all cases (positive and negative)
         }
 
@@ -287,11 +604,19 @@ class DisjunctiveResult:
             print(ruleset)
             print("#"*40)
             for rule in ruleset.elems:
-                Result([rule], self.df, self.target).print()
+                Result([rule], self.df, self.target, index=self.index).print()
+
+    # compiled scorer of the rulesets, to tag rows of new data with the rulesets covering them (see rules/scoring.py)
+    def scorer(self, columns: List[str] = None):
+        return RuleScorer.from_result(self, columns)
+
+    # statistics of all rulesets (see rule_statistics), in the order of self.rulesets
+    def statistics(self):
+        if self._statistics is None:
+            self._statistics = rule_statistics(self.rulesets, self.df, self.target, self.index, union_mask)
+        return self._statistics
 
     def dataframe(self):
-        result = []
-        for ruleset in self.rulesets:
-            result.append(self._rule_stats(ruleset, self.df, self.target))
-        return pd.DataFrame(result).sort_values(by='precision', ascending=False)
+        stats = self.statistics()[['rule', 'precision', 'recall', 'rule_coverage']].rename(columns={'rule': 'ruleset'})
+        return stats.sort_values(by='precision', ascending=False)
 
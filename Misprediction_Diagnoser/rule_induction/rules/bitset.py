@@ -0,0 +1,104 @@
+# Copyright (c) Facebook, Inc. and its affiliates.
+# All rights reserved.
+#
+# This source code is licensed under the license found in the
+# LICENSE file in the root directory of this source tree.
+
+import hashlib
+import numpy as np
+
+# Number of set bits for every possible byte value
+_POPCOUNT = np.array([bin(i).count('1') for i in range(256)], dtype=np.uint8)
+
+
+class Bitset:
+    """
+        Fixed-size set of row positions, stored as a numpy array of packed bits
+        (one bit per row, see np.packbits). Used to represent the rows covered by
+        a predicate or rule so that coverage can be computed by AND-ing and
+        counting bits instead of filtering a data frame.
+
+        Supports the set operations needed on true/false positives:
+        len() is the number of rows in the set, & and | are intersection
+        and union, issubset() compares two sets of rows.
+    """
+    __slots__ = ('words', 'size')
+
+    def __init__(self, words: np.ndarray, size: int):
+        self.words = words
+        self.size = size
+
+    @classmethod
+    def from_mask(cls, mask):
+        mask = np.asarray(mask, dtype=bool)
+        return cls(np.packbits(mask), mask.shape[0])
+
+    @classmethod
+    def ones(cls, size: int):
+        return cls.from_mask(np.ones(size, dtype=bool))
+
+    @classmethod
+    def zeros(cls, size: int):
+        return cls.from_mask(np.zeros(size, dtype=bool))
+
+    def to_mask(self):
+        return np.unpackbits(self.words, count=self.size).astype(bool)
+
+    def count(self):
+        return int(_POPCOUNT[self.words].sum())
+
+    def indices(self):
+        return np.flatnonzero(self.to_mask())
+
+    def issubset(self, other):
+        return not np.any(self.words & ~other.words)
+
+    # Hash of the rows in the set, used to identify subsets of a dataset in cache keys
+    def digest(self):
+        return hashlib.sha1(self.words.tobytes()).hexdigest()
+
+    @property
+    def nbytes(self):
+        return self.words.nbytes
+
+    def __len__(self):
+        return self.count()
+
+    def __eq__(self, other):
+        return isinstance(other, Bitset) and self.size == other.size and np.array_equal(self.words, other.words)
+
+    __hash__ = None
+
+    def __and__(self, other):
+        return Bitset(np.bitwise_and(self.words, other.words), self.size)
+
+    def __or__(self, other):
+        return Bitset(np.bitwise_or(self.words, other.words), self.size)
+
+    def __invert__(self):
+        words = np.invert(self.words)
+        # clear the padding bits of the last byte so that they are never counted
+        padding = -self.size % 8
+        if padding and len(words) > 0:
+            words[-1] &= np.uint8((0xFF << padding) & 0xFF)
+        return Bitset(words, self.size)
+
+
+# Packs the words of several equally sized bitsets into a 2-D array (one row per bitset)
+def stack(bitsets) -> np.ndarray:
+    return np.stack([b.words for b in bitsets])
+
+
+# For every row of a stacked array, is bitset a subset of that row?
+def subset_of_rows(bitset: Bitset, rows: np.ndarray) -> np.ndarray:
+    return ~np.any(bitset.words & ~rows, axis=1)
+
+
+# For every row of a stacked array, is that row a subset of bitset?
+def rows_subset_of(rows: np.ndarray, bitset: Bitset) -> np.ndarray:
+    return ~np.any(rows & ~bitset.words, axis=1)
+
+
+# Number of set bits in every row of a stacked array
+def count_rows(rows: np.ndarray) -> np.ndarray:
+    return _POPCOUNT[rows].sum(axis=1, dtype=np.int64)
@@ -6,13 +6,219 @@
 
 from pandas.util import hash_pandas_object
 import pandas as pd
+from collections import OrderedDict
+import hashlib
+import itertools
+import sys
+import weakref
 
-# Mapping from (rule_str, dataframe_hash) pairs to a tuple (q, tps, fps, num_covered)
-cache = {}
+from .bitset import Bitset
+import timing as Timing
 
-# Given a rule and data frame, returns the
-# cache key used for memoization
-def get_cache_key(rule, df: pd.DataFrame):
-    h = hash_pandas_object(df)
-    cache_key = (str(rule) + ":" + str(h))
-    return cache_key
+
+class RuleCache:
+    """
+        Memoizes rule evaluations: maps (rule_key, dataset_token, target) keys
+        (see get_cache_key) to tuples (q, tps, fps, num_covered).
+
+        The cache is bounded by a number of entries and by an (estimated) number
+        of bytes; when either budget is exceeded, the least recently used entries
+        are evicted. Entries of one dataset can be dropped with invalidate().
+
+        Parameters
+        ----------
+
+        max_entries : int
+            Maximum number of cached rule evaluations (None for no limit)
+
+        max_bytes : int
+            Maximum estimated size of all cached rule evaluations (None for no limit)
+    """
+    def __init__(self, max_entries: int = 100000, max_bytes: int = 512 * 2**20):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.num_bytes = 0
+        # key -> (value, size in bytes), in least to most recently used order
+        self._entries = OrderedDict()
+        # dataset token -> keys of the entries evaluated on that dataset
+        self._keys_by_token = {}
+
+    def get(self, key):
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            Timing.count('cache misses')
+            return None
+        self.hits += 1
+        Timing.count('cache hits')
+        self._entries.move_to_end(key)
+        return entry[0]
+
+    def put(self, key, value):
+        self._remove(key)
+        size = entry_size(value)
+        self._entries[key] = (value, size)
+        self._keys_by_token.setdefault(_dataset_of(key[1]), set()).add(key)
+        self.num_bytes += size
+        self._evict()
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    def __len__(self):
+        return len(self._entries)
+
+    # Drops all entries evaluated on the dataset with the given token (or on subsets of its rows)
+    def invalidate(self, token: int):
+        for key in list(self._keys_by_token.get(token, ())):
+            self._remove(key)
+
+    def clear(self):
+        self._entries.clear()
+        self._keys_by_token.clear()
+        self.num_bytes = 0
+
+    def stats(self):
+        return {
+            'entries': len(self._entries),
+            'bytes': self.num_bytes,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+        }
+
+    def __repr__(self):
+        return "RuleCache(max_entries={}, max_bytes={}, {})".format(self.max_entries, self.max_bytes, self.stats())
+
+    def _remove(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        self.num_bytes -= entry[1]
+        dataset = _dataset_of(key[1])
+        keys = self._keys_by_token[dataset]
+        keys.discard(key)
+        if not keys:
+            del self._keys_by_token[dataset]
+
+    def _evict(self):
+        while self._entries and self._over_budget():
+            key = next(iter(self._entries))
+            self._remove(key)
+            self.evictions += 1
+
+    def _over_budget(self):
+        if self.max_entries is not None and len(self._entries) > self.max_entries:
+            return True
+        return self.max_bytes is not None and self.num_bytes > self.max_bytes
+
+
+# Token of the dataset of a cache key token; rows subsets of a dataset use (dataset_token, rows_digest) tokens
+def _dataset_of(token):
+    return token[0] if isinstance(token, tuple) else token
+
+
+# Estimated number of bytes held by a cached (q, tps, fps, num_covered) tuple
+def entry_size(value) -> int:
+    size = sys.getsizeof(value)
+    for item in value:
+        size += sys.getsizeof(item)
+        if isinstance(item, Bitset):
+            size += item.nbytes
+        elif isinstance(item, (set, frozenset)):
+            size += sum(sys.getsizeof(x) for x in item)
+    return size
+
+
+class DatasetRegistry:
+    """
+        Hands out compact tokens for data frames, so that cache keys do not have to
+        hash the whole data frame on every lookup.
+
+        A data frame is fingerprinted (hashed row by row) the first time it is
+        registered; afterwards its token is found by object identity in O(1).
+        Data frames with identical content share the same token. Tokens are never
+        reused, and the fingerprint of a token is forgotten once no live data frame has it.
+
+        A lookup by identity does not notice that a data frame was modified in place:
+        register(df, verify=True) (done when discover is entered) fingerprints it again
+        and gives it the token of its new content if it changed.
+    """
+    def __init__(self):
+        # id(df) -> [weak reference to df, fingerprint, token]
+        self._frames = {}
+        # fingerprint -> [token, number of live registered data frames with that fingerprint]
+        self._tokens = {}
+        self._next_token = itertools.count()
+
+    def register(self, df: pd.DataFrame, verify: bool = False) -> int:
+        key = id(df)
+        entry = self._frames.get(key)
+        if entry is not None and entry[0]() is df:
+            if not verify:
+                return entry[2]
+            fp = fingerprint(df)
+            if fp != entry[1]:
+                self._release(entry[1])
+                entry[1:] = [fp, self._acquire(fp)]
+            return entry[2]
+
+        if entry is not None:
+            # a data frame with the same id was collected, but its entry not yet forgotten
+            self._forget(key, entry[0])
+        fp = fingerprint(df)
+        ref = weakref.ref(df, lambda ref, key=key: self._forget(key, ref))
+        self._frames[key] = [ref, fp, self._acquire(fp)]
+        return self._frames[key][2]
+
+    def __len__(self):
+        return len(self._tokens)
+
+    def _acquire(self, fp: str) -> int:
+        entry = self._tokens.get(fp)
+        if entry is None:
+            entry = self._tokens[fp] = [next(self._next_token), 0]
+        entry[1] += 1
+        return entry[0]
+
+    def _release(self, fp: str):
+        entry = self._tokens[fp]
+        entry[1] -= 1
+        if entry[1] == 0:
+            del self._tokens[fp]
+
+    # called when a registered data frame (referenced by ref) is garbage collected
+    def _forget(self, key, ref):
+        entry = self._frames.get(key)
+        if entry is not None and entry[0] is ref:
+            del self._frames[key]
+            self._release(entry[1])
+
+
+# Hash of the content (values, index and column names) of a data frame
+def fingerprint(df: pd.DataFrame) -> str:
+    h = hashlib.sha1()
+    h.update(str(df.shape).encode())
+    h.update(str(list(df.columns)).encode())
+    h.update(hash_pandas_object(df).to_numpy().tobytes())
+    return h.hexdigest()
+
+
+datasets = DatasetRegistry()
+
+
+# Returns the token identifying the content of df (see DatasetRegistry)
+# With verify=True, df is fingerprinted again in case it was modified in place
+def dataset_token(df: pd.DataFrame, verify: bool = False) -> int:
+    return datasets.register(df, verify)
+
+
+# Given a rule (or rule set), the token of a data frame (see dataset_token, or
+# ConfusionMatrix.token for a subset of its rows) and the target the rule is evaluated for,
+# returns the cache key used for memoization. Rules are identified by their canonical key
+# (see Rule.key), which does not depend on the order of their predicates
+def get_cache_key(rule, token: int, target=None):
+    return (rule.key, token, target)
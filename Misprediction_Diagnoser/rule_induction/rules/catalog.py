@@ -0,0 +1,138 @@
+# Copyright (c) Facebook, Inc. and its affiliates.
+# All rights reserved.
+#
+# This source code is licensed under the license found in the
+# LICENSE file in the root directory of this source tree.
+
+import copy
+import pandas as pd
+from typing import Dict, Set
+
+from . import predicate as Predicates
+from .predicate import Predicate
+from .coverage import CoverageIndex
+from .sampling import stratified_sample
+from util import BinningMethod, partition
+
+
+class PredicateCatalog:
+    """
+        Predicates of one dataset, shared by all discover calls on that dataset.
+
+        The predicates of an attribute do not depend on the other attributes that are
+        considered together with it. The catalog therefore bins every attribute
+        (Predicates.generate) and decides the relevance of every predicate
+        (Predicates.filter) only once, and keeps the coverage masks of the relevant
+        predicates in a CoverageIndex. discover draws the predicates of an
+        attribute subset from it.
+
+        Binning and predicate masks do not depend on the target either: for_target
+        returns a catalog of another target that shares them and only decides the
+        relevance of the predicates for that target again.
+
+        Parameters
+        ----------
+
+        df : pd.DataFrame
+            Tabular data as Pandas data frame
+
+        target : Target
+            Target variable (attribute_name, attribute_value)
+
+        num_bins : int
+            Number of bins
+
+        binning_method : BinningMethod
+            Either equal frequency or width binning
+
+        predicate_relevance_threshold : float
+            See Predicates.filter
+
+        minimum_relative_coverage : float
+            See Predicates.filter
+
+        sample_size : int
+            If given (and smaller than df), predicates are generated, filtered and searched
+            on a stratified sample of sample_size rows of df (see rules/sampling.py):
+            df is then the sample and full_df the original data frame.
+            The catalogs returned by for_target share the sample (stratified by target)
+
+        sample_seed : int
+            Seed of the random sample
+    """
+    def __init__(
+        self,
+        df: pd.DataFrame,
+        target,
+        num_bins: int,
+        binning_method: BinningMethod,
+        predicate_relevance_threshold: float,
+        minimum_relative_coverage: float,
+        sample_size: int = None,
+        sample_seed: int = 0
+    ):
+        self.full_df = df
+        if sample_size is not None and sample_size < df.shape[0]:
+            df = stratified_sample(df, target, sample_size, sample_seed)
+        self.df = df
+        self.target = target
+        self.num_bins = num_bins
+        self.binning_method = binning_method
+        self.predicate_relevance_threshold = predicate_relevance_threshold
+        self.minimum_relative_coverage = minimum_relative_coverage
+        self.pos_df, _ = partition(df, target)
+        self.index = CoverageIndex(df)
+        # masks over the full data, used to score the rules found on the sample again
+        self.full_index = CoverageIndex(self.full_df) if self.sampled else self.index
+        # (attribute_name, attribute_type) -> predicates of that attribute
+        self._predicates: Dict[tuple, Set[Predicate]] = {}
+        # predicate -> does it pass Predicates.filter?
+        self._relevance: Dict[Predicate, bool] = {}
+        # target -> catalog of that target, shared by all catalogs returned by for_target
+        self._catalogs = {target: self}
+
+    # are the predicates generated on a sample of the data?
+    @property
+    def sampled(self):
+        return self.df is not self.full_df
+
+    def generate(self, relevant_attributes: Dict[str, str]) -> Set[Predicate]:
+        """
+            Same as Predicates.generate, each attribute is only binned the first time it is requested
+        """
+        features: Set[Predicate] = set()
+        for attribute in relevant_attributes.items():
+            if attribute not in self._predicates:
+                self._predicates[attribute] = Predicates.generate(
+                    self.df, dict([attribute]), self.num_bins, self.binning_method)
+            features |= self._predicates[attribute]
+        return features
+
+    def filter(self, predicates: Set[Predicate]) -> Set[Predicate]:
+        """
+            Same as Predicates.filter, the relevance of each predicate is only computed
+            the first time it is requested (the masks of relevant predicates are computed at the same time)
+        """
+        missing = {predicate for predicate in predicates if predicate not in self._relevance}
+        if len(missing) > 0:
+            relevant = Predicates.filter(missing, self.df, self.pos_df,
+                                         self.predicate_relevance_threshold, self.minimum_relative_coverage)
+            for predicate in missing:
+                self._relevance[predicate] = predicate in relevant
+                if predicate in relevant:
+                    self.index.predicate_mask(predicate)
+        return {predicate for predicate in predicates if self._relevance[predicate]}
+
+    def for_target(self, target):
+        """
+            Catalog of the same data for another target. It shares the binned predicates,
+            the coverage masks (and the sample, if any) with this catalog.
+        """
+        catalog = self._catalogs.get(target)
+        if catalog is None:
+            catalog = copy.copy(self)
+            catalog.target = target
+            catalog.pos_df, _ = partition(self.df, target)
+            catalog._relevance = {}
+            self._catalogs[target] = catalog
+        return catalog
@@ -5,107 +5,283 @@
 # LICENSE file in the root directory of this source tree.
 
 import pandas as pd
+import numpy as np
+import heapq
+import functools
 import math
+from typing import Callable
 from timing import time_log
+import timing as Timing
 
 from .rule import Rule
+from . import bitset
+from .bitset import Bitset
+from .coverage import CoverageIndex
+from .cache import RuleCache
+from .implication import ImplicationMatrix
 from util import ConfusionMatrix
+import cfg as cfg
 
 
 # Find a set of beam_width conjuncts (rules) based on our goodness criteria (using beam search)
 # a Rule (aka conjunct) is a set of predicates conjoined by AND
 # Note that objective function is implemented in Rule.eval
+# With batched=True, all extensions of a beam rule are scored at once by ExtensionScorer
+# If rows (a Bitset over the rows of df) is given, the search only considers those rows
+# Useless extensions are looked up in implications (an ImplicationMatrix over the predicates, built here if not given)
 @time_log
-def generate_conjuncts(df: pd.DataFrame, target, predicates, beam_width):
-    stats = ConfusionMatrix(df, target)
-    num_pos = stats.pos_df.shape[0]
-    num_total = df.shape[0]
-    min_support = math.sqrt(num_pos) / num_total
-
-    #beam and new_beam are mappings from rules to q_values
-    beam = {}
-    new_beam = {}
+def generate_conjuncts(df: pd.DataFrame, target, predicates, beam_width, index: CoverageIndex = None, cache: RuleCache = None,
+                       batched: bool = True, rows: Bitset = None, implications: ImplicationMatrix = None):
+    stats = ConfusionMatrix(df, target, index, cache, rows)
+
+    # fixes the order in which predicates are visited (sorted, so that ties are broken
+    # the same way whatever the hash seed, i.e., the iteration order of the set of predicates)
+    predicates = sorted(predicates, key=str)
+    if batched:
+        scorer = ExtensionScorer(stats, predicates)
+        score = scorer.score
+    else:
+        score = functools.partial(score_one_by_one, stats)
+
+    def score_extensions(extensions):
+        return [score(rule, candidates) for (rule, candidates) in extensions]
+
+    # TP(new_rule) < TP(existing) AND
+    # FP(new_rule) > FP(existing)
+    def irrelevant(new_rule, num_covered, num_tp, new_beam, counts):
+        return is_irrelevant(new_rule, new_beam, stats)
+
+    (rules, _) = beam_search(predicates, beam_width, stats.num_rows, stats.num_pos, score(Rule(), predicates),
+                             score_extensions, irrelevant, implications)
+    return rules
 
-    for pred in predicates:
+
+# Beam search shared by generate_conjuncts and its streaming counterpart (see rules/streaming.py),
+# which only differ in how extensions are counted and how irrelevant rules are detected
+# predicates is a list, in the order in which they are visited
+# seed: arrays (num_covered, num_tp, q) of the rules made of a single predicate
+# score_extensions: [(rule, candidate predicates)] -> [arrays (num_covered, num_tp, q) of the extensions of rule by each candidate]
+# irrelevant: (new_rule, num_covered, num_tp, beam, counts) -> is new_rule irrelevant?
+# Returns the beam (rule -> q value) and the (num_covered, num_tp) counts of the rules that entered it, by Rule.key
+def beam_search(predicates, beam_width: int, num_rows: int, num_pos: int, seed, score_extensions: Callable,
+                irrelevant: Callable, implications: ImplicationMatrix = None):
+    min_support = math.sqrt(num_pos) / num_rows
+
+    if implications is None or not implications.contains_all(predicates):
+        implications = ImplicationMatrix(predicates)
+    positions = implications.positions(predicates)
+    counts = {}
+
+    # seed is a mapping from single-predicate rules to q_values
+    (seed_covered, seed_tp, seed_q) = seed
+    seed = {}
+    for (k, pred) in enumerate(predicates):
         r = Rule()
         r.add_conjunct(pred)
-        q = r.eval(stats)
-        beam[r] = q
+        seed[r] = float(seed_q[k])
+        counts[r.key] = (int(seed_covered[k]), int(seed_tp[k]))
 
-    if beam_width > len(predicates):
-        new_beam = beam.copy()
-    else:
-        values = sorted(beam.values(), reverse=True)
+    if beam_width <= len(predicates):
+        values = sorted(seed.values(), reverse=True)
         cutoff = values[beam_width - 1]
-        new_beam = {key: value for (key, value) in beam.items() if value >= cutoff}
-        beam = new_beam.copy()
+        seed = {key: value for (key, value) in seed.items() if value >= cutoff}
+
+    new_beam = Beam(beam_width)
+    for (r, q) in seed.items():
+        new_beam.add(r, q)
+
+    Timing.count('candidates generated', len(predicates))
 
     i = 0
     while True:
-        improved = False
-        for rule in list(beam):
-            for pred in predicates:
-                if rule.check_useless(pred):
-                    continue
+        with Timing.span('beam level', level=i):
+            improved = False
+            # rules added during this level are only extended in the next one
+            extensions = [(rule, [pred for (pred, is_useless) in zip(predicates, implications.useless_mask(rule)[positions])
+                                  if not is_useless])
+                          for rule in new_beam.rules()]
+            level_scores = score_extensions(extensions)
 
-                new_rule = Rule(rule)
-                new_rule.add_conjunct(pred)
+            for ((rule, candidates), (candidates_covered, candidates_tp, candidates_q)) in zip(extensions, level_scores):
+                Timing.count('candidates generated', len(candidates))
+                Timing.count('pruned: useless', len(predicates) - len(candidates))
 
-                if is_duplicate(new_rule, new_beam):
-                    continue
+                for (k, pred) in enumerate(candidates):
+                    new_rule = Rule(rule)
+                    new_rule.add_conjunct(pred)
 
-                q = new_rule.eval(stats)
-                num_tp = len(stats.true_positive(new_rule))
-                exceeds_min_support = num_tp / df.shape[0] >= min_support
-                if not exceeds_min_support:
-                    continue
+                    if is_duplicate(new_rule, new_beam):
+                        Timing.count('pruned: duplicate')
+                        continue
 
-                (worst_rule, worst_q) = get_worst_rule(new_beam, beam_width)
+                    q = float(candidates_q[k])
+                    num_tp = int(candidates_tp[k])
+                    exceeds_min_support = num_tp / num_rows >= min_support
+                    if not exceeds_min_support:
+                        Timing.count('pruned: min support')
+                        continue
 
-                if q <= worst_q:
-                    continue
+                    (worst_rule, worst_q) = new_beam.worst()
 
-                # TP(new_rule) < TP(existing) AND
-                # FP(new_rule) > FP(existing)
-                if is_irrelevant(new_rule, new_beam, stats):
-                    continue
-                if worst_q > 0:
-                    new_beam.pop(worst_rule)
-                new_beam[new_rule] = q
-                improved = True
+                    if q <= worst_q:
+                        Timing.count('pruned: q value')
+                        continue
 
-        if i == 0:
-            clean_beam(new_beam)
+                    num_covered = int(candidates_covered[k])
+                    if irrelevant(new_rule, num_covered, num_tp, new_beam, counts):
+                        Timing.count('pruned: irrelevant')
+                        continue
+                    if worst_q > 0:
+                        new_beam.remove(worst_rule)
+                    new_beam.add(new_rule, q)
+                    counts[new_rule.key] = (num_covered, num_tp)
+                    improved = True
 
         if not improved:
             break
 
-        beam = new_beam
         i += 1
-    return beam
+    return (new_beam.to_dict(), counts)
+
+
+class ExtensionScorer:
+    """
+        Scores the extensions of a rule by many predicates with a few numpy operations.
+
+        The coverage masks of all predicates are stacked into one array once. For a rule,
+        its mask is AND-ed with the rows of the candidate predicates and the bits are
+        counted row by row, which gives the coverage and TP counts of every extension.
+        The q values are then computed as in Rule.eval, with the cfg weights applied
+        to whole arrays.
+    """
+    def __init__(self, stats: ConfusionMatrix, predicates):
+        self.stats = stats
+        self.num_pos = stats.num_pos
+        self._rows = {pred: k for (k, pred) in enumerate(predicates)}
+        if len(predicates) > 0:
+            self._words = bitset.stack(stats.index.predicate_mask(pred) for pred in predicates)
+
+    # Returns arrays (num_covered, num_tp, q) with one entry per candidate extension
+    def score(self, rule: Rule, candidates):
+        num_candidates = len(candidates)
+        if num_candidates == 0:
+            return (np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64), np.zeros(0))
+
+        words = self._words[[self._rows[pred] for pred in candidates]]
+        words &= self.stats.coverage_mask(rule).words
+        num_covered = bitset.count_rows(words)
+        Timing.count('rows scanned', num_candidates * self.stats.num_rows)
+        num_tp = bitset.count_rows(words & self.stats.pos_mask.words)
+
+        return (num_covered, num_tp, q_values(num_covered, num_tp, extension_sizes(rule, candidates), self.num_pos))
+
+
+# Same as ExtensionScorer.score, evaluating every extension on its own with Rule.eval
+def score_one_by_one(stats: ConfusionMatrix, rule: Rule, candidates):
+    num_covered = np.zeros(len(candidates), dtype=np.int64)
+    num_tp = np.zeros(len(candidates), dtype=np.int64)
+    q = np.zeros(len(candidates))
+    for (k, pred) in enumerate(candidates):
+        new_rule = Rule(rule)
+        new_rule.add_conjunct(pred)
+        q[k] = new_rule.eval(stats)
+        num_tp[k] = len(stats.true_positive(new_rule))
+        num_covered[k] = stats.num_covered(new_rule)
+    return (num_covered, num_tp, q)
+
+
+# Sizes of the extensions of rule by each candidate predicate
+# (an extension by a predicate already in the rule does not change its size)
+def extension_sizes(rule: Rule, candidates) -> np.ndarray:
+    return np.array([rule.get_size() + (pred not in rule.elems) for pred in candidates])
+
+
+# q values (see Rule.eval) of rules given as arrays of their coverage, TP counts and sizes
+def q_values(num_covered: np.ndarray, num_tp: np.ndarray, sizes: np.ndarray, num_pos: int) -> np.ndarray:
+    num_rules = len(num_covered)
+    size_score = 1 - sizes / cfg.max_size
+
+    if num_pos > 0:
+        coverage_ratio = num_tp / num_pos
+    else:
+        coverage_ratio = np.zeros(num_rules)
+    tp_ratio = np.divide(num_tp, num_covered, out=np.zeros(num_rules), where=num_covered > 0)
+
+    return coverage_ratio * cfg.coverage_conjunct \
+        + tp_ratio * cfg.tpr_conjunct \
+        + size_score * cfg.size_conjunct
+
+
+class Beam:
+    """
+        Rules of the beam and their q values.
+
+        Rules are kept in insertion order (the order in which beam search
+        visits and returns them). A min-heap over (q, insertion number) finds the
+        worst rule without scanning the beam; entries of removed rules stay in
+        the heap and are skipped lazily. Duplicates are detected through the
+        canonical key of a rule (Rule.key), the same notion of equality as Rule.__eq__.
+    """
+    def __init__(self, width: int):
+        self.width = width
+        # rule key -> (rule, q, insertion number)
+        self._entries = {}
+        self._heap = []
+        self._num_inserted = 0
+
+    @staticmethod
+    def _key(rule):
+        return rule.key
+
+    def add(self, rule, q):
+        key = self._key(rule)
+        self._entries.pop(key, None)
+        self._entries[key] = (rule, q, self._num_inserted)
+        heapq.heappush(self._heap, (q, self._num_inserted, key))
+        self._num_inserted += 1
+
+    def remove(self, rule):
+        del self._entries[self._key(rule)]
+
+    # Returns the rule with the lowest q value (the earliest inserted one among ties),
+    # or (None, -1) while the beam holds less than width rules
+    def worst(self):
+        if len(self._entries) < self.width:
+            return (None, -1)
+        while True:
+            (q, num_inserted, key) = self._heap[0]
+            entry = self._entries.get(key)
+            if entry is not None and entry[2] == num_inserted:
+                return (entry[0], q)
+            heapq.heappop(self._heap)
+
+    def rules(self):
+        return [rule for (rule, _, _) in self._entries.values()]
+
+    def items(self):
+        return [(rule, q) for (rule, q, _) in self._entries.values()]
+
+    def to_dict(self):
+        return dict(self.items())
+
+    def __contains__(self, rule):
+        return self._key(rule) in self._entries
+
+    def __iter__(self):
+        return iter(self.rules())
+
+    def __len__(self):
+        return len(self._entries)
 
 
 # is rule implied by existing rule in the beam?
-def is_redundant(rule, new_beam):
-    return any(r.implies(rule) for r in new_beam)
+def is_redundant(rule, new_beam, implications: ImplicationMatrix = None):
+    return any(r.implies(rule, implications) for r in new_beam)
 
 
 # is rule a duplicate of another rule in the beam?
 def is_duplicate(rule, new_beam):
-    return any(r == rule for r in new_beam)
-
-
-# find worst rule in beam
-def get_worst_rule(beam, beam_width):
-    if len(beam) < beam_width:
-        return (None, -1)
-    worst_q = 2**60
-    for cur_r in beam:
-        cur_q = beam[cur_r]
-        if cur_q < worst_q:
-            worst_q = cur_q
-            worst_rule = cur_r
-    return (worst_rule, worst_q)
+    return rule in new_beam
 
 
 def clean_beam(beam):
@@ -126,12 +302,13 @@ def print_beam(beam, stats: ConfusionMatrix):
 
 
 # A rule R is irrelevant TP(R) < TP(existing) and FP(R) > FP(existing)
+# TPs and FPs are Bitsets, so the check is done against the whole beam at once
 def is_irrelevant(rule: Rule, new_beam, stats: ConfusionMatrix):
     (new_q, new_tp, new_fp) = rule.get_eval_result(stats)
-    for r in new_beam:
-        if len(r.elems) == 0:
-            continue
-        (old_q, old_tp, old_fp) = r.get_eval_result(stats)
-        if new_tp.issubset(old_tp) and old_fp.issubset(new_fp):
-            return True
-    return False
+    existing = [r.get_eval_result(stats) for r in new_beam if len(r.elems) > 0]
+    if len(existing) == 0:
+        return False
+    old_tps = bitset.stack(old_tp for (_, old_tp, _) in existing)
+    old_fps = bitset.stack(old_fp for (_, _, old_fp) in existing)
+    dominated = bitset.subset_of_rows(new_tp, old_tps) & bitset.rows_subset_of(old_fps, new_fp)
+    return bool(dominated.any())
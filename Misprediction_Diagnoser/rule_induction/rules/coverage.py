@@ -0,0 +1,64 @@
+# Copyright (c) Facebook, Inc. and its affiliates.
+# All rights reserved.
+#
+# This source code is licensed under the license found in the
+# LICENSE file in the root directory of this source tree.
+
+import pandas as pd
+
+from .bitset import Bitset
+from .encoding import ColumnEncoding
+
+
+class CoverageIndex:
+    """
+        Packed coverage masks of predicates over one dataset.
+
+        Every predicate is evaluated once against the full data frame (on its
+        integer coded columns, see rules/encoding.py) and its mask is kept as a Bitset. The rows covered by a rule (a conjunction of
+        predicates) are then obtained by AND-ing the masks of its predicates,
+        which avoids re-parsing and re-running df.query for every rule.
+
+        Parameters
+        ----------
+
+        df : pd.DataFrame
+            Tabular data as Pandas data frame
+
+        predicates : Iterable[Predicate]
+            Predicates whose masks are computed up front. Masks of any other
+            predicate are computed (and kept) the first time they are requested.
+    """
+    def __init__(self, df: pd.DataFrame, predicates=()):
+        self.df = df
+        self.num_rows = df.shape[0]
+        self.encoding = ColumnEncoding(df)
+        self._masks = {}
+        self._targets = {}
+        for predicate in predicates:
+            self.predicate_mask(predicate)
+
+    def predicate_mask(self, predicate) -> Bitset:
+        mask = self._masks.get(predicate)
+        if mask is None:
+            mask = Bitset.from_mask(self.encoding.mask(predicate))
+            self._masks[predicate] = mask
+        return mask
+
+    def rule_mask(self, rule) -> Bitset:
+        mask = None
+        for predicate in rule.elems:
+            predicate_mask = self.predicate_mask(predicate)
+            mask = predicate_mask if mask is None else mask & predicate_mask
+        if mask is None:
+            # an empty conjunction covers every row
+            return Bitset.ones(self.num_rows)
+        return mask
+
+    def target_mask(self, target) -> Bitset:
+        target_name, target_value = target
+        mask = self._targets.get((target_name, target_value))
+        if mask is None:
+            mask = Bitset.from_mask((self.df[target_name] == target_value).to_numpy(dtype=bool, na_value=False))
+            self._targets[(target_name, target_value)] = mask
+        return mask
@@ -0,0 +1,117 @@
+# Copyright (c) Facebook, Inc. and its affiliates.
+# All rights reserved.
+#
+# This source code is licensed under the license found in the
+# LICENSE file in the root directory of this source tree.
+
+import numbers
+import numpy as np
+import pandas as pd
+from pandas.api.types import is_bool_dtype, is_integer_dtype, is_numeric_dtype
+
+# Integers of at most this magnitude are represented exactly as float32
+_FLOAT32_EXACT = 2**24
+
+
+class DiscreteColumn:
+    """
+        Dictionary encoded column: codes[i] is the position of the value of row i in
+        categories (-1 for missing values), so that equality predicates are integer comparisons.
+    """
+    __slots__ = ('codes', 'categories', '_lookup')
+
+    def __init__(self, column: pd.Series):
+        (codes, categories) = pd.factorize(column)
+        self.codes = np.ascontiguousarray(codes, dtype=np.int32)
+        self.categories = categories
+        self._lookup = {value: code for (code, value) in enumerate(categories)}
+
+    def decode(self, codes):
+        return np.asarray(self.categories)[codes]
+
+    def compare(self, op, value):
+        if op != '==' and op != '!=':
+            return None
+        code = self._lookup.get(value)
+        if op == '==':
+            return self.codes == code if code is not None else np.zeros(len(self.codes), dtype=bool)
+        return self.codes != code if code is not None else np.ones(len(self.codes), dtype=bool)
+
+
+class NumericColumn:
+    """
+        Numerical column as a contiguous float array (float32 if that is exact, float64 otherwise),
+        missing values are NaN and never satisfy <=, > or ==.
+    """
+    __slots__ = ('values',)
+
+    def __init__(self, column: pd.Series):
+        dtype = np.float64
+        if column.dtype == np.float32:
+            dtype = np.float32
+        elif is_integer_dtype(column.dtype) and column.notna().any():
+            if max(abs(column.min()), abs(column.max())) <= _FLOAT32_EXACT:
+                dtype = np.float32
+        self.values = np.ascontiguousarray(column.to_numpy(dtype=dtype, na_value=np.nan))
+
+    def compare(self, op, value):
+        if isinstance(value, bool) or not isinstance(value, numbers.Real):
+            return None
+        values = self.values
+        if values.dtype == np.float32 and float(np.float32(value)) != value:
+            # value is not a float32, compare exactly
+            values = values.astype(np.float64)
+        with np.errstate(invalid='ignore'):
+            if op == '>':
+                return values > value
+            if op == '<=':
+                return values <= value
+            if op == '==':
+                return values == value
+            if op == '!=':
+                return values != value
+        return None
+
+
+class ColumnEncoding:
+    """
+        Columnar, integer coded copy of the attributes of a data frame, used to evaluate predicates.
+
+        Discrete (non-numerical) attributes are dictionary encoded (DiscreteColumn), numerical
+        attributes are kept as contiguous float arrays (NumericColumn). A column is encoded the
+        first time a predicate over it is evaluated. Predicate values stay the original labels,
+        so rules are printed as before; a predicate that cannot be evaluated on the codes
+        falls back to Predicate.mask.
+
+        Parameters
+        ----------
+
+        df : pd.DataFrame
+            Tabular data as Pandas data frame
+    """
+    def __init__(self, df: pd.DataFrame):
+        self.df = df
+        self._columns = {}
+
+    def column(self, name):
+        encoded = self._columns.get(name)
+        if encoded is None:
+            column = self.df[name]
+            if is_numeric_dtype(column.dtype) and not is_bool_dtype(column.dtype):
+                encoded = NumericColumn(column)
+            else:
+                encoded = DiscreteColumn(column)
+            self._columns[name] = encoded
+        return encoded
+
+    # Same as predicate.mask(df), evaluated on the encoded column
+    def mask(self, predicate) -> np.ndarray:
+        result = self.column(predicate.name).compare(predicate.op, predicate.val)
+        if result is None:
+            return predicate.mask(self.df)
+        return result
+
+    @property
+    def nbytes(self):
+        return sum(column.codes.nbytes if isinstance(column, DiscreteColumn) else column.values.nbytes
+                   for column in self._columns.values())
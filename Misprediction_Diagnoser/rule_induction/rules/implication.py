@@ -0,0 +1,101 @@
+# Copyright (c) Facebook, Inc. and its affiliates.
+# All rights reserved.
+#
+# This source code is licensed under the license found in the
+# LICENSE file in the root directory of this source tree.
+
+import numpy as np
+
+
+class ImplicationMatrix:
+    """
+        Relations between the predicates of a catalog, computed once per discover call.
+
+        implies[i, j] is predicates[i].implies(predicates[j]) and useless[i, j] is
+        predicates[i].makes_useless(predicates[j]), i.e., whether extending a rule that contains
+        predicates[i] by predicates[j] is useless (see Rule.check_useless). Only predicates over the
+        same attribute are related, so the matrices are filled attribute by attribute.
+
+        The checks of a rule then become array operations: the useless extensions of a rule are
+        the OR of the useless rows of its predicates, and a rule implies another one if the OR of
+        the implies rows of its predicates covers all predicates of the other rule.
+        Predicates of a rule that are not in the catalog get their rows computed when first needed.
+
+        Parameters
+        ----------
+
+        predicates : Iterable[Predicate]
+            Predicates of the catalog
+    """
+    def __init__(self, predicates):
+        self.predicates = list(predicates)
+        self._positions = {pred: k for (k, pred) in enumerate(self.predicates)}
+        num_predicates = len(self.predicates)
+        self.implies = np.zeros((num_predicates, num_predicates), dtype=bool)
+        self.useless = np.zeros((num_predicates, num_predicates), dtype=bool)
+
+        attributes = {}
+        for (k, pred) in enumerate(self.predicates):
+            attributes.setdefault(pred.name, []).append(k)
+        for positions in attributes.values():
+            for i in positions:
+                for j in positions:
+                    self.implies[i, j] = self.predicates[i].implies(self.predicates[j])
+                    self.useless[i, j] = self.predicates[i].makes_useless(self.predicates[j])
+
+        # predicate -> (implies row, useless row) of predicates that are not in the catalog
+        self._extra_rows = {}
+
+    def __contains__(self, pred):
+        return pred in self._positions
+
+    def __len__(self):
+        return len(self.predicates)
+
+    def contains_all(self, predicates) -> bool:
+        return all(pred in self._positions for pred in predicates)
+
+    # Positions of the predicates in the catalog (all of them have to be in it)
+    def positions(self, predicates) -> np.ndarray:
+        return np.array([self._positions[pred] for pred in predicates], dtype=np.intp)
+
+    def _rows(self, pred):
+        k = self._positions.get(pred)
+        if k is not None:
+            return (self.implies[k], self.useless[k])
+        rows = self._extra_rows.get(pred)
+        if rows is None:
+            rows = (np.array([pred.implies(other) for other in self.predicates], dtype=bool),
+                    np.array([pred.makes_useless(other) for other in self.predicates], dtype=bool))
+            self._extra_rows[pred] = rows
+        return rows
+
+    # OR of the rows (in matrix) of the predicates of rule, one array operation for the predicates of the catalog
+    def _rule_mask(self, rule, matrix: np.ndarray, which: int) -> np.ndarray:
+        in_catalog = [self._positions[pred] for pred in rule.elems if pred in self._positions]
+        mask = matrix[in_catalog].any(axis=0)
+        for pred in rule.elems:
+            if pred not in self._positions:
+                mask |= self._rows(pred)[which]
+        return mask
+
+    # Which predicates of the catalog are useless extensions of rule? (same as rule.check_useless)
+    def useless_mask(self, rule) -> np.ndarray:
+        return self._rule_mask(rule, self.useless, 1)
+
+    # Which predicates of the catalog are implied by rule (by one of its predicates)?
+    def implied_mask(self, rule) -> np.ndarray:
+        return self._rule_mask(rule, self.implies, 0)
+
+    # Is pred a useless extension of rule? (same as rule.check_useless(pred))
+    def is_useless(self, rule, pred) -> bool:
+        k = self._positions.get(pred)
+        if k is None:
+            return any(p.makes_useless(pred) for p in rule.elems)
+        return bool(self.useless_mask(rule)[k])
+
+    # Does rule imply other? (same as rule.implies(other), all predicates of other have to be in the catalog)
+    def rule_implies(self, rule, other) -> bool:
+        if len(other.elems) == 0:
+            return True
+        return bool(self.implied_mask(rule)[self.positions(other.elems)].all())
@@ -6,7 +6,10 @@
 
 import re
 import ast
+import itertools
+import weakref
 import pandas as pd
+import numpy as np
 import math
 from typing import Dict, Set, List
 
@@ -15,10 +18,36 @@ from util import BinningMethod
 
 # Predicate of the form attrib OP value
 class Predicate:
-    def __init__(self, attribute_name, operator, value):
-        self.name = attribute_name
-        self.op = operator
-        self.val = value
+    """
+        Predicates are interned: creating a predicate equal to an existing (live) one returns the
+        existing object, so equal predicates are the same object and compare by identity.
+        Every predicate gets an integer id that rules use as their canonical key (see Rule.key).
+        The intern table only holds weak references, so predicates that are no longer used
+        (e.g., those of a file that has been diagnosed) are freed; ids are never reused.
+        Ids are only meaningful within a process. Predicates are immutable; unpickling one interns it again.
+    """
+    __slots__ = ('name', 'op', 'val', 'id', '_hash', '__weakref__')
+
+    # (attribute_name, operator, type of value, value) -> live predicate
+    # the type is part of the key since values such as 1, 1.0 and True are equal but print differently
+    _interned = weakref.WeakValueDictionary()
+    _ids = itertools.count()
+
+    def __new__(cls, attribute_name, operator, value):
+        key = (attribute_name, operator, type(value), value)
+        pred = cls._interned.get(key)
+        if pred is None:
+            pred = object.__new__(cls)
+            pred.name = attribute_name
+            pred.op = operator
+            pred.val = value
+            pred.id = next(cls._ids)
+            pred._hash = hash((attribute_name, operator, value))
+            cls._interned[key] = pred
+        return pred
+
+    def __reduce__(self):
+        return (Predicate, self._get_uid())
 
     def _get_uid(self):
         return (self.name, self.op, self.val)
@@ -39,14 +68,17 @@ class Predicate:
         # partial order in predicate indicates numerical type
         if operator[0] == '<' or operator[0] == '>':
             value = ast.literal_eval(value)
+        elif len(value) >= 2 and value[0] == '"' and value[-1] == '"':
+            # values of (in)equality predicates are printed in quotes (see __str__)
+            value = value[1:-1]
         if operator == '=':
             operator = '=='
         return cls(attribute_name, operator, value)
 
+    # number of rows of df returned by df.query(self.dataframe_query()), i.e., (in)equality
+    # predicates compare the column to the (quoted) string of their value
     def num_positive(self, df: pd.DataFrame):
-        #return sum(1 for _, row in data.iterrows() if self.eval(row))
-        # or just call coverage from util
-        return len(df.query(self.dataframe_query()))
+        return count_positives([self], df)[self]
 
 
     def eval(self, instance):
@@ -62,12 +94,28 @@ class Predicate:
 
         raise Exception("attribute type not supported" + self.op)
 
+    # Vectorized counterpart of eval: evaluates the predicate for all rows of df at once
+    # and returns a boolean numpy array
+    def mask(self, df: pd.DataFrame):
+        column = df[self.name]
+        if self.op == ">":
+            result = column > self.val
+        elif self.op == "<=":
+            result = column <= self.val
+        elif self.op == "==":
+            result = column == self.val
+        elif self.op == "!=":
+            result = column != self.val
+        else:
+            raise Exception("attribute type not supported" + self.op)
+        return result.to_numpy(dtype=bool, na_value=False)
+
+    # equal predicates are the same (interned) object, so __eq__ is identity
     def __eq__(self, other):
-        return self.name == other.name and self.op == other.op and self.val == other.val
+        return self is other
 
     def __hash__(self):
-        # We can use id(self) or proper hashing, this is not the issue I fixed (see other __hash__)
-        return hash(self._get_uid())
+        return self._hash
 
     def implies(self, other):
         if self.name != other.name:
@@ -100,6 +148,25 @@ class Predicate:
 
         raise Exception("attribute type not supported" + self.op)
 
+    # is it useless to extend a rule that contains this predicate by other? (see Rule.check_useless)
+    # Note that predicates use "==", so an equality predicate never makes an extension useless
+    def makes_useless(self, other):
+        if self.name != other.name:
+            return False
+        if self.op == ">":
+            if other.op == ">" or other.op == "=" or other.op == "!=":
+                return True
+        if self.op == "<=":
+            if other.op == "<=" or other.op == "=" or other.op == "!=":
+                return True
+        if self.op == "=":
+            return True
+
+        if self.op == "!=":
+            return True
+
+        return False
+
 
 def filter(predicates: Set[Predicate], df: pd.DataFrame, pos: pd.DataFrame, predicate_relevance_threshold=0.01, minimum_relative_coverage=0):
     """
@@ -126,19 +193,36 @@ def filter(predicates: Set[Predicate], df: pd.DataFrame, pos: pd.DataFrame, pred
         filtered: Set[Predicate]
             A subset of filtered predicates
     """
+    num_passing = count_positives(predicates, df)
+    num_passing_pos = count_positives(predicates, pos)
+    return filter_counts(predicates, num_passing, num_passing_pos, pos.shape[0], df.shape[0],
+                         predicate_relevance_threshold, minimum_relative_coverage)
+
+
+def filter_counts(
+    predicates: Set[Predicate],
+    num_passing: Dict[Predicate, int],
+    num_passing_pos: Dict[Predicate, int],
+    num_pos: int,
+    num_total: int,
+    predicate_relevance_threshold=0.01,
+    minimum_relative_coverage=0
+) -> Set[Predicate]:
+    """
+        Same as filter, given the number of rows (num_passing) and of positive rows (num_passing_pos)
+        that satisfy each predicate, e.g., counted chunk by chunk
+    """
     filtered = set()
-    num_pos = pos.shape[0]
-    num_total = df.shape[0]
     ratio_whole = num_pos / num_total
 
     for predicate in predicates:
-        num_pass = predicate.num_positive(df)
+        num_pass = num_passing[predicate]
         if num_pass == 0:
             continue
         # minimum_relative_coverage is given in %
         if num_pass / num_total < (minimum_relative_coverage/100):
             continue
-        num_tp = predicate.num_positive(pos)
+        num_tp = num_passing_pos[predicate]
         ratio_current_predicate = num_tp / num_pass
 
         diff = ratio_current_predicate - ratio_whole
@@ -148,6 +232,56 @@ def filter(predicates: Set[Predicate], df: pd.DataFrame, pos: pd.DataFrame, pred
     return filtered
 
 
+def count_positives(predicates: Set[Predicate], df: pd.DataFrame) -> Dict[Predicate, int]:
+    """
+        Computes Predicate.num_positive for many predicates with one pass per attribute
+
+        Continuous predicates (<=, >) of an attribute are counted by sorting its column once
+        and locating every cutoff with a binary search. Discrete predicates (==, !=) are
+        counted from the value counts of the column. As for df.query, the column is compared
+        to the string of the value (see dataframe_query), so a discrete predicate on a column
+        of numbers or booleans covers no row (==) or all rows (!=) and is filtered out.
+
+        Parameters
+        ----------
+
+        predicates : Set[Predicate]
+            Predicates to count
+
+        df : pd.DataFrame
+            Tabular data as Pandas data frame
+
+        Returns
+        -------
+        counts: Dict[Predicate, int]
+            Number of rows of df that satisfy each predicate
+    """
+    by_attribute: Dict[str, List[Predicate]] = {}
+    for predicate in predicates:
+        by_attribute.setdefault(predicate.name, []).append(predicate)
+
+    counts = {}
+    num_total = df.shape[0]
+    for attribute_name, attribute_predicates in by_attribute.items():
+        column = df[attribute_name]
+        sorted_values = None
+        value_counts = None
+        for predicate in attribute_predicates:
+            if predicate.op == "<=" or predicate.op == ">":
+                if sorted_values is None:
+                    sorted_values = np.sort(column.dropna().to_numpy())
+                num_leq = int(np.searchsorted(sorted_values, predicate.val, side='right'))
+                counts[predicate] = num_leq if predicate.op == "<=" else len(sorted_values) - num_leq
+            elif predicate.op == "==" or predicate.op == "!=":
+                if value_counts is None:
+                    value_counts = column.value_counts(dropna=True).to_dict()
+                num_eq = int(value_counts.get(str(predicate.val), 0))
+                counts[predicate] = num_eq if predicate.op == "==" else num_total - num_eq
+            else:
+                raise Exception("attribute type not supported" + predicate.op)
+    return counts
+
+
 def generate(df: pd.DataFrame, relevant_attributes: Dict[str, str], num_bins: int, binning_method: BinningMethod) -> Set[Predicate]:
     """
         Generates a set of predicates based on the dataset and search hyper-parameters
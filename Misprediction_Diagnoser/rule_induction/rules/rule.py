@@ -4,40 +4,53 @@
 # This source code is licensed under the license found in the
 # LICENSE file in the root directory of this source tree.
 
-from .cache import cache, get_cache_key
+from .cache import get_cache_key
 from .predicate import Predicate
 from util import ConfusionMatrix
 import cfg as cfg
+import timing as Timing
 
 
 class Rule:
     # Rule : is a conjunction of predicates. We also call this a 'conjunct'
+    # Its canonical form (key) is the sorted tuple of the ids of its predicates, it does not depend on
+    # the order in which predicates were added and is used for equality, hashing and cache keys
     def __init__(self, orig=None):
         self.elems = set(orig.elems) if orig else set()
+        self._key = orig._key if orig else ()
+        self._hash = orig._hash if orig else None
 
     def add_conjunct(self, pred):
-        self.elems.add(pred)
-
-    def check_useless(self, pred):
-        for p in self.elems:
-            if pred.name != p.name:
-                continue
-            if p.op == ">":
-                if pred.op == ">" or pred.op == "=" or pred.op == "!=":
-                    return True
-            if p.op == "<=":
-                if pred.op == "<=" or pred.op == "=" or pred.op == "!=":
-                    return True
-            if p.op == "=":
-                return True
-
-            if p.op == "!=":
-                return True
-
-        return False
+        if pred not in self.elems:
+            self.elems.add(pred)
+            self._key = None
+            self._hash = None
+
+    @property
+    def key(self):
+        if self._key is None:
+            self._key = tuple(sorted(p.id for p in self.elems))
+        return self._key
+
+    # predicate ids differ between processes, the key is computed again after unpickling
+    def __getstate__(self):
+        return {'elems': self.elems}
+
+    def __setstate__(self, state):
+        self.elems = state['elems']
+        self._key = None
+        self._hash = None
+
+    # If implications (an ImplicationMatrix) is given, the relations between predicates are looked up there
+    def check_useless(self, pred, implications=None):
+        if implications is not None:
+            return implications.is_useless(self, pred)
+        return any(p.makes_useless(pred) for p in self.elems)
 
     # does this rule imply another one?
-    def implies(self, other):
+    def implies(self, other, implications=None):
+        if implications is not None and implications.contains_all(other.elems):
+            return implications.rule_implies(self, other)
         for other_pred in other.elems:
             implied = False
             for self_pred in self.elems:
@@ -50,24 +63,20 @@ class Rule:
         return True
 
     def is_subset(self, other):
-        for p in self.elems:
-            contains_pred = any(p == q for q in other.elems)
-            if not contains_pred:
-                return False
-        return True
+        return self.elems <= other.elems
 
     def __eq__(self, other):
-        return self.is_subset(other) and other.is_subset(self)
+        return self.key == other.key
 
     def __hash__(self):
-        # Potential Issue: using id(self) is just comparison by pointer address
-        # This results in failed matches during beam search
-        # Using "hash(frozenset(self.elems))" below will produce a different (smaller) result
-        #return id(self)
-        return hash(frozenset(self.elems))
+        if self._hash is None:
+            self._hash = hash(self.key)
+        return self._hash
 
+    # predicates are printed in sorted order, so that the string of a rule does not depend on
+    # the order of its set of predicates (which changes with the hash seed)
     def __str__(self):
-        return ' & '.join(str(p) for p in self.elems)
+        return ' & '.join(sorted(str(p) for p in self.elems))
 
     def __repr__(self):
         return self.__str__()
@@ -85,14 +94,7 @@ class Rule:
 
     # Returns a triple (Q_value, TPs, FPs)
     def get_eval_result(self, stats):
-        cache_key = get_cache_key(self, stats.df)
-        if cache_key in cache.keys():
-            (q, tps, fps, nc) = cache[cache_key]
-            return (q, tps, fps)
-
-        self.eval(stats)
-        assert cache_key in cache.keys()
-        (q, tps, fps, nc) = cache[cache_key]
+        (q, tps, fps, nc) = self._eval_entry(stats)
         return (q, tps, fps)
 
     # Does this rule evaluate to true or false for this point?
@@ -108,11 +110,16 @@ class Rule:
 
     # Important function for calculating objective (q) value
     def eval(self, stats: ConfusionMatrix):
-        cache_key = get_cache_key(self, stats.df)
-        if cache_key in cache.keys():
-            (q, tps, fps, nc) = cache[cache_key]
-            return q
+        return self._eval_entry(stats)[0]
+
+    # Returns the (possibly cached) tuple (Q_value, TPs, FPs, num_covered)
+    def _eval_entry(self, stats: ConfusionMatrix):
+        cache_key = get_cache_key(self, stats.token, stats.target)
+        entry = stats.cache.get(cache_key)
+        if entry is not None:
+            return entry
 
+        Timing.count('rows scanned', stats.num_rows)
         tps = stats.true_positive(self)
         fps = stats.false_positive(self)
         nc = stats.num_covered(self)
@@ -124,8 +131,9 @@ class Rule:
             + stats.get_tp_ratio(self) * cfg.tpr_conjunct \
             + size_score * cfg.size_conjunct
 
-        cache[cache_key] = (q, tps, fps, nc)
-        return q
+        entry = (q, tps, fps, nc)
+        stats.cache.put(cache_key, entry)
+        return entry
 
     def is_better(self, other_rule, stats: ConfusionMatrix):
         """
@@ -11,6 +11,10 @@ import math
 from .rule import Rule
 from .predicate import Predicate
 from .conjuncts import generate_conjuncts
+from .coverage import CoverageIndex
+from .bitset import Bitset
+from .cache import RuleCache
+from .implication import ImplicationMatrix
 from util import sorted_pareto_optimal_rules, ConfusionMatrix
 import cfg as cfg
 
@@ -21,7 +25,11 @@ def generate_ruleset(
     target,
     predicates: Set[Predicate],
     target_coverage: float,
-    beam_width: int
+    beam_width: int,
+    index: CoverageIndex = None,
+    cache: RuleCache = None,
+    batched: bool = True,
+    implications: ImplicationMatrix = None
 ):
     """
         Discovers a set of rules until target_coverage is achieved or until a certain number of
@@ -48,6 +56,18 @@ def generate_ruleset(
             Beam width controls the width of the beam during beam search.
             A large beam leads to more precision, but is slower
 
+        index : CoverageIndex
+            Predicate masks over df (optional, computed on demand otherwise)
+
+        cache : RuleCache
+            Cache of rule evaluations (optional)
+
+        batched : bool
+            Score beam search candidates in batches (see generate_conjuncts)
+
+        implications : ImplicationMatrix
+            Relations between the predicates (optional, see generate_conjuncts)
+
         Returns
         -------
         rs: RuleSet
@@ -57,25 +77,27 @@ def generate_ruleset(
     rs = RuleSet()
     rs.add_rule(rule)  # start with the rule that was passed in
 
-    cur_df = df
-    stats = ConfusionMatrix(df, target)
-    cur_pos = stats.pos_df
-    cur_neg = stats.neg_df
+    if index is None:
+        index = CoverageIndex(df)
+    stats = ConfusionMatrix(df, target, index, cache)
+    # rows of df that are not covered by any rule of rs yet
+    remaining = Bitset.ones(df.shape[0])
 
     for _ in range(cfg.MAX_ITERS):
         # remove the points for which the 'rule' was true
-        cur_df = filter_by_rule(cur_df, rule)
-        cur_pos = filter_by_rule(cur_pos, rule)
-        cur_neg = filter_by_rule(cur_neg, rule)
+        remaining = remaining & ~index.rule_mask(rule)
+        if remaining.count() == 0:
+            break
 
-        rules = generate_conjuncts(cur_df, target, predicates, beam_width)
+        # search on the remaining rows, re-using the predicate masks of the full dataset
+        rules = generate_conjuncts(df, target, predicates, beam_width, index, cache, batched, remaining, implications)
         if len(rules) == 0:
             break
 
         rules = filter_rules(rules, stats)
         if len(rules) == 0:
             break
-        best_rules = sorted_pareto_optimal_rules(rules, df, target)
+        best_rules = sorted_pareto_optimal_rules(rules, df, target, index, cache)
         rule = best_rules[0]  # pick the very top one
 
         if len(rule.elems) == 0:
@@ -93,10 +115,8 @@ def generate_ruleset(
 
 # Filters out parts of data that are covered by the given rule
 def filter_by_rule(df: pd.DataFrame, rule: Rule):
-    new_data = pd.DataFrame.copy(df)
-    indices = [i for i, (_, row) in enumerate(df.iterrows()) if rule.eval_point(row)]
-    new_data.drop(new_data.index[indices], inplace=True)
-    return new_data
+    covered = CoverageIndex(df).rule_mask(rule)
+    return df[(~covered).to_mask()]
 
 
 # performs statistical significant test to identify interesting rules
@@ -111,14 +131,14 @@ def filter_rules(rules, stats):
 # passes various thresholds in terms
 # of true positive ratio and coverage
 def pass_threshold(r, stats: ConfusionMatrix):
-    num_pos = stats.pos_df.shape[0]
-    num_total = stats.df.shape[0]
+    num_pos = stats.num_pos
+    num_total = stats.num_rows
     ratio_whole = num_pos / num_total
     min_support = math.sqrt(num_pos) / num_total
 
     tps = stats.true_positive(r)
     num_tp = len(tps)
-    exceeds_min_support = num_tp / stats.df.shape[0] >= min_support
+    exceeds_min_support = num_tp / num_total >= min_support
     if not exceeds_min_support:
         return False
     cur_tpr = stats.get_tp_ratio(r)
@@ -139,8 +159,9 @@ class RuleSet:
     def add_rule(self, rule):
         self.elems.add(rule)
 
+    # rules are printed in sorted order (see Rule.__str__)
     def __str__(self):
-        return ' | '.join(f'({p})' for p in self.elems)
+        return ' | '.join(sorted(f'({p})' for p in self.elems))
 
     def __eq__(self, other):
         """Overrides the default implementation"""
@@ -149,6 +170,11 @@ class RuleSet:
     def __hash__(self):
         return hash(frozenset(self.elems))
 
+    # canonical form of the rule set: the set of the keys of its rules (see Rule.key)
+    @property
+    def key(self):
+        return frozenset(rule.key for rule in self.elems)
+
     # Does this ruleSet cover this point (i.e., does it evaluate to true?)
     def covers(self, point):
         return any(rule.eval_point(point) for rule in self.elems)
@@ -158,27 +184,24 @@ class RuleSet:
         return self.covers(point)
 
     def is_subset(self, other):
-        for r in self.elems:
-            contains_rule = any(r == x for x in other.elems)
-            if not contains_rule:
-                return False
-        return True
+        return self.elems <= other.elems
 
     def equals(self, other):
         return self.is_subset(other) and other.is_subset(self)
 
-    def impliesRule(self, rule):
-        return any(r.implies(rule) for r in self.elems)
+    # If implications (an ImplicationMatrix) is given, the relations between predicates are looked up there
+    def impliesRule(self, rule, implications=None):
+        return any(r.implies(rule, implications) for r in self.elems)
 
-    def impliesRuleSet(self, other):
-        return all(self.impliesRule(r) for r in other.elems)
+    def impliesRuleSet(self, other, implications=None):
+        return all(self.impliesRule(r, implications) for r in other.elems)
 
-    def check_useless(self, rule):
-        if self.impliesRule(rule):
+    def check_useless(self, rule, implications=None):
+        if self.impliesRule(rule, implications):
             return True
         rs = RuleSet()
         rs.add_rule(rule)
-        return rs.impliesRuleSet(self)
+        return rs.impliesRuleSet(self, implications)
 
     def get_size(self):
         return sum(r.get_size() for r in self.elems)
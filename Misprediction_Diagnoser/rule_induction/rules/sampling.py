@@ -0,0 +1,160 @@
+# Copyright (c) Facebook, Inc. and its affiliates.
+# All rights reserved.
+#
+# This source code is licensed under the license found in the
+# LICENSE file in the root directory of this source tree.
+
+import numpy as np
+import pandas as pd
+from statistics import NormalDist
+from typing import Dict
+
+from .rule import Rule
+from .coverage import CoverageIndex
+from .conjuncts import q_values
+from util import rule_statistics
+
+
+def stratified_sample(df: pd.DataFrame, target, size: int, seed: int = 0) -> pd.DataFrame:
+    """
+        Draws size rows of df without replacement, separately from the positive and the negative
+        rows, so that the sample has (up to rounding) the same share of the target as df.
+        At least one positive row is kept if df has any. Rows keep their order in df.
+    """
+    target_name, target_value = target
+    pos_mask = (df[target_name] == target_value).to_numpy(dtype=bool, na_value=False)
+    pos_rows = np.flatnonzero(pos_mask)
+    neg_rows = np.flatnonzero(~pos_mask)
+
+    num_pos = int(round(size * len(pos_rows) / df.shape[0]))
+    if len(pos_rows) > 0:
+        num_pos = max(num_pos, 1)
+    num_pos = min(num_pos, len(pos_rows))
+    num_neg = min(size - num_pos, len(neg_rows))
+
+    rng = np.random.default_rng(seed)
+    rows = np.concatenate([
+        rng.choice(pos_rows, num_pos, replace=False),
+        rng.choice(neg_rows, num_neg, replace=False),
+    ])
+    return df.iloc[np.sort(rows)]
+
+
+# Wilson score interval of a proportion successes / trials (arrays) at the given confidence level
+def wilson_interval(successes: np.ndarray, trials: np.ndarray, confidence: float = 0.95):
+    z = NormalDist().inv_cdf((1 + confidence) / 2)
+    successes = np.asarray(successes, dtype=float)
+    trials = np.asarray(trials, dtype=float)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        p = successes / trials
+        denominator = 1 + z**2 / trials
+        center = (p + z**2 / (2 * trials)) / denominator
+        margin = z * np.sqrt(p * (1 - p) / trials + z**2 / (4 * trials**2)) / denominator
+    lower = np.where(trials > 0, np.clip(center - margin, 0, 1), 0.0)
+    upper = np.where(trials > 0, np.clip(center + margin, 0, 1), 1.0)
+    return (lower, upper)
+
+
+class SampleReport:
+    """
+        Compares the final beam as scored on the sample with its exact scores on the full data.
+
+        Attributes
+        ----------
+
+        rules : pd.DataFrame
+            One row per beam rule: q value, rank, precision and recall on the sample, the confidence
+            bounds of precision and recall derived from the sample, and the exact values on the full data
+
+        discordance : float
+            Fraction of pairs of beam rules that the sample ranks in the opposite order of the full data
+
+        top_agreement : float
+            Fraction of the num_rules best rules on the full data that are also among the num_rules best on the sample
+    """
+    def __init__(self, rules: pd.DataFrame, sample_size: int, num_rows: int, confidence: float, num_rules: int):
+        self.rules = rules
+        self.sample_size = sample_size
+        self.num_rows = num_rows
+        self.confidence = confidence
+        self.num_rules = num_rules
+        self.discordance = discordance(rules['sample_q'].to_numpy(), rules['exact_q'].to_numpy())
+        sample_top = set(rules.sort_values('sample_rank')['rule'][:num_rules])
+        exact_top = set(rules.sort_values('exact_rank')['rule'][:num_rules])
+        self.top_agreement = len(sample_top & exact_top) / len(exact_top) if len(exact_top) > 0 else 1.0
+
+    def to_dict(self):
+        return {
+            'sample_size': self.sample_size,
+            'num_rows': self.num_rows,
+            'confidence': self.confidence,
+            'discordance': self.discordance,
+            'top_agreement': self.top_agreement,
+            'precision_within_bounds': float(self.rules['precision_within_bounds'].mean()) if len(self.rules) else 1.0,
+            'recall_within_bounds': float(self.rules['recall_within_bounds'].mean()) if len(self.rules) else 1.0,
+        }
+
+    def __str__(self):
+        summary = self.to_dict()
+        return "\n".join([
+            "Sample: {} of {} rows, {:.0%} confidence bounds".format(self.sample_size, self.num_rows, self.confidence),
+            "Ranking disagreement (discordant pairs): {:.2%}".format(summary['discordance']),
+            "Top {} agreement: {:.2%}".format(self.num_rules, summary['top_agreement']),
+            "Exact precision within bounds: {:.2%}".format(summary['precision_within_bounds']),
+            "Exact recall within bounds: {:.2%}".format(summary['recall_within_bounds']),
+        ])
+
+
+# Fraction of pairs (i, j) with x[i] < x[j] and y[i] > y[j] (or vice versa)
+def discordance(x: np.ndarray, y: np.ndarray) -> float:
+    if len(x) < 2:
+        return 0.0
+    dx = np.sign(x[:, None] - x[None, :])
+    dy = np.sign(y[:, None] - y[None, :])
+    num_pairs = len(x) * (len(x) - 1)
+    return float((dx * dy < 0).sum() / num_pairs)
+
+
+def rescore(rules: Dict[Rule, float], target, sample_index: CoverageIndex, full_index: CoverageIndex,
+            confidence: float = 0.95, num_rules: int = 3):
+    """
+        Scores the rules found on a sample (sample_index) again on the full data (full_index)
+
+        Returns
+        -------
+        (rules, report): Tuple[Dict[Rule, float], SampleReport]
+            The rules with their exact q values and the comparison of sample and exact scores
+    """
+    candidates = list(rules.keys())
+    sample_stats = rule_statistics(candidates, sample_index.df, target, sample_index)
+    full_stats = rule_statistics(candidates, full_index.df, target, full_index)
+    sizes = np.array([rule.get_size() for rule in candidates])
+    num_pos = full_index.target_mask(target).count()
+    exact_q = q_values(full_stats['num_covered'].to_numpy(), full_stats['num_true_positive'].to_numpy(), sizes, num_pos)
+    sample_q = np.array([rules[rule] for rule in candidates], dtype=float)
+
+    sample_num_pos = sample_index.target_mask(target).count()
+    sample_tp = sample_stats['num_true_positive'].to_numpy()
+    (precision_lower, precision_upper) = wilson_interval(sample_tp, sample_stats['num_covered'].to_numpy(), confidence)
+    (recall_lower, recall_upper) = wilson_interval(sample_tp, np.full(len(candidates), sample_num_pos), confidence)
+
+    table = pd.DataFrame({
+        'rule': sample_stats['rule'],
+        'sample_q': sample_q,
+        'exact_q': exact_q,
+        'sample_rank': (-sample_q).argsort(kind='stable').argsort(kind='stable') + 1,
+        'exact_rank': (-exact_q).argsort(kind='stable').argsort(kind='stable') + 1,
+        'precision': sample_stats['precision'],
+        'precision_lower': precision_lower,
+        'precision_upper': precision_upper,
+        'exact_precision': full_stats['precision'],
+        'recall': sample_stats['recall'],
+        'recall_lower': recall_lower,
+        'recall_upper': recall_upper,
+        'exact_recall': full_stats['recall'],
+    })
+    table['precision_within_bounds'] = (table['exact_precision'] >= precision_lower) & (table['exact_precision'] <= precision_upper)
+    table['recall_within_bounds'] = (table['exact_recall'] >= recall_lower) & (table['exact_recall'] <= recall_upper)
+
+    report = SampleReport(table, sample_index.num_rows, full_index.num_rows, confidence, num_rules)
+    return ({rule: float(q) for (rule, q) in zip(candidates, exact_q)}, report)
@@ -0,0 +1,192 @@
+# Copyright (c) Facebook, Inc. and its affiliates.
+# All rights reserved.
+#
+# This source code is licensed under the license found in the
+# LICENSE file in the root directory of this source tree.
+
+import numpy as np
+import pandas as pd
+from pandas.api.types import is_bool_dtype, is_numeric_dtype
+from typing import List
+
+from .predicate import Predicate
+from .rule import Rule
+from .ruleset import RuleSet
+from .encoding import ColumnEncoding
+
+
+class RuleScorer:
+    """
+        Tags rows of new data with the rules (or rule sets) that cover them.
+
+        The rules are compiled once: every distinct predicate of the rules gets a position, and
+        every rule becomes the lists of positions of its conjunctions (a rule is one conjunction,
+        a rule set one conjunction per rule). Scoring a batch evaluates each predicate once on the
+        columns of the batch (see rules/encoding.py) and combines the predicate masks with AND
+        (within a conjunction) and OR (across the rules of a rule set).
+
+        Rules of a Result (see from_result) cover the same rows as the rules of its dataframe().
+        Rules parsed from strings (see from_strings) differ in one case: a quoted "==" or "!=" value
+        on a numerical or boolean column (e.g., b=="0.0") is converted to the type of the column
+        (see coerce_predicate), whereas discover and df.query compare the column to the string,
+        which no row equals. discover never returns such predicates.
+
+        Parameters
+        ----------
+
+        rules : List[Rule or RuleSet]
+            Rules to score, in the order of the columns of the membership matrix
+
+        columns : List[str]
+            Column names of the NumPy batches passed to score (optional, not needed for data frames)
+    """
+    def __init__(self, rules: List, columns: List[str] = None):
+        self.rules = list(rules)
+        self.columns = list(columns) if columns is not None else None
+        # distinct predicates of all rules
+        self.predicates = []
+        positions = {}
+        # for every rule, the predicate positions of each of its conjunctions
+        self._conjunctions = []
+        for rule in self.rules:
+            conjunctions = list(rule.elems) if isinstance(rule, RuleSet) else [rule]
+            compiled = []
+            for conjunction in conjunctions:
+                for pred in conjunction.elems:
+                    if pred not in positions:
+                        positions[pred] = len(self.predicates)
+                        self.predicates.append(pred)
+                compiled.append(np.array(sorted(positions[pred] for pred in conjunction.elems), dtype=np.intp))
+            self._conjunctions.append(compiled)
+        # attributes read from a batch
+        self.attributes = sorted({pred.name for pred in self.predicates})
+
+    @classmethod
+    def from_result(cls, result, columns: List[str] = None):
+        """
+            Scorer of the rules of a Result, or of the rule sets of a DisjunctiveResult
+        """
+        if hasattr(result, 'rulesets'):
+            return cls(result.rulesets, columns)
+        return cls(result.rules, columns)
+
+    @classmethod
+    def from_strings(cls, rule_strs, columns: List[str] = None):
+        """
+            Scorer of rules given as strings, one rule per line (as in Result.import_rules) or as a list.
+            A rule is a conjunction of predicates separated by '&'; rules of a rule set are put in
+            parentheses and separated by ' | ' (as printed by RuleSet); a '|' inside a quoted value is part of the value. Values of '==' and '!=' predicates
+            are read as strings and converted to the type of their column when scored (see coerce_predicate).
+        """
+        if isinstance(rule_strs, str):
+            rule_strs = rule_strs.split('\n')
+        rules = []
+        for rule_str in rule_strs:
+            rule_str = rule_str.strip()
+            # a rule set of a single rule has no ' | ', but its rule is still in parentheses
+            conjunctions = split_unquoted(rule_str, ' | ')
+            if len(conjunctions) > 1 or rule_str.startswith('('):
+                ruleset = RuleSet()
+                for conjunction in conjunctions:
+                    ruleset.add_rule(Rule.from_string(strip_parentheses(conjunction.strip())))
+                rules.append(ruleset)
+            else:
+                rules.append(Rule.from_string(rule_str))
+        return cls(rules, columns)
+
+    def _frame(self, data) -> pd.DataFrame:
+        if isinstance(data, pd.DataFrame):
+            return data
+        if isinstance(data, np.ndarray) and data.dtype.names is not None:
+            return pd.DataFrame({name: data[name] for name in self.attributes})
+        if isinstance(data, np.ndarray):
+            if self.columns is None:
+                raise Exception("column names are needed to score a NumPy batch")
+            data = np.atleast_2d(data)
+            return pd.DataFrame({name: data[:, self.columns.index(name)] for name in self.attributes}).infer_objects()
+        return pd.DataFrame({name: data[name] for name in self.attributes})
+
+    # Boolean matrix (predicates x rows): the rows of data covered by each predicate
+    def predicate_masks(self, data) -> np.ndarray:
+        encoding = ColumnEncoding(self._frame(data))
+        num_rows = encoding.df.shape[0]
+        masks = np.empty((len(self.predicates), num_rows), dtype=bool)
+        for (k, pred) in enumerate(self.predicates):
+            masks[k] = encoding.mask(coerce_predicate(pred, encoding.df[pred.name]))
+        return masks
+
+    def score(self, data) -> np.ndarray:
+        """
+            Evaluates all rules on a batch of rows
+
+            Parameters
+            ----------
+
+            data : pd.DataFrame, np.ndarray or Dict[str, np.ndarray]
+                The rows to score: a data frame, a 2-d array with the columns given to the
+                constructor, a structured array, or a mapping from attributes to arrays
+
+            Returns
+            -------
+            membership : np.ndarray
+                Boolean matrix of shape (rows, rules): membership[i, j] is True if rule j covers row i
+        """
+        masks = self.predicate_masks(data)
+        num_rows = masks.shape[1]
+        membership = np.zeros((len(self.rules), num_rows), dtype=bool)
+        for (j, conjunctions) in enumerate(self._conjunctions):
+            for positions in conjunctions:
+                # an empty conjunction covers every row
+                membership[j] |= masks[positions].all(axis=0) if len(positions) > 0 else True
+        return membership.T
+
+    # Same as score, as a data frame with one column per rule (named after the rule) and the index of data
+    def score_frame(self, data) -> pd.DataFrame:
+        membership = self.score(data)
+        index = data.index if isinstance(data, pd.DataFrame) else None
+        return pd.DataFrame(membership, columns=[str(rule) for rule in self.rules], index=index)
+
+
+# Splits text at every separator that is not inside a quoted value (values of "==" and "!=" predicates
+# are printed in double quotes, see Predicate.__str__)
+def split_unquoted(text: str, separator: str) -> List[str]:
+    parts = []
+    start = 0
+    in_quotes = False
+    k = 0
+    while k < len(text):
+        if text[k] == '"':
+            in_quotes = not in_quotes
+        elif not in_quotes and text.startswith(separator, k):
+            parts.append(text[start:k])
+            k += len(separator)
+            start = k
+            continue
+        k += 1
+    parts.append(text[start:])
+    return parts
+
+
+# Removes the pair of parentheses RuleSet.__str__ puts around each of its rules
+def strip_parentheses(conjunction: str) -> str:
+    if conjunction.startswith('(') and conjunction.endswith(')'):
+        return conjunction[1:-1].strip()
+    return conjunction
+
+
+# Values of "==" and "!=" predicates parsed from strings (see Predicate.from_string) are strings, also if
+# they were printed from a number or a boolean (e.g., b=="0.0" of a discrete attribute with numerical values).
+# Returns the predicate with its value converted to the type of a numerical or boolean column.
+def coerce_predicate(pred: Predicate, column: pd.Series) -> Predicate:
+    if not isinstance(pred.val, str) or (pred.op != '==' and pred.op != '!='):
+        return pred
+    if is_bool_dtype(column.dtype):
+        if pred.val == 'True' or pred.val == 'False':
+            return Predicate(pred.name, pred.op, pred.val == 'True')
+        return pred
+    if is_numeric_dtype(column.dtype):
+        try:
+            return Predicate(pred.name, pred.op, float(pred.val))
+        except ValueError:
+            return pred
+    return pred
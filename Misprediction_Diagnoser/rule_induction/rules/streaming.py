@@ -0,0 +1,274 @@
+# Copyright (c) Facebook, Inc. and its affiliates.
+# All rights reserved.
+#
+# This source code is licensed under the license found in the
+# LICENSE file in the root directory of this source tree.
+
+import numpy as np
+import pandas as pd
+from pandas.util import hash_array
+from typing import Callable, Dict, List, Set
+
+from . import predicate as Predicates
+from . import bitset
+from .predicate import Predicate
+from .rule import Rule
+from .coverage import CoverageIndex
+from .conjuncts import Beam, beam_search, extension_sizes, q_values
+from .implication import ImplicationMatrix
+from util import BinningMethod, sorted_pareto_optimal_counts
+from timing import time_log
+import timing as Timing
+
+
+# Returns a function that yields the data as a sequence of data frames (chunks) every time it is called
+# data is a path to a CSV file, a data frame, or already such a function
+def chunk_source(data, chunk_size: int = 100000) -> Callable:
+    if isinstance(data, str):
+        return lambda: pd.read_csv(data, chunksize=chunk_size)
+    if isinstance(data, pd.DataFrame):
+        return lambda: (data.iloc[start:start + chunk_size] for start in range(0, data.shape[0], chunk_size))
+    if callable(data):
+        return data
+    raise Exception("data source not supported: " + str(type(data)))
+
+
+class ValueSketch:
+    """
+        Distinct values of a discrete attribute, collected chunk by chunk.
+        Two sketches are merged by taking the union of their values.
+    """
+    def __init__(self):
+        self._values = set()
+        self._has_nan = False
+
+    def add(self, column: pd.Series):
+        for value in column.unique():
+            if pd.isna(value):
+                self._has_nan = True
+            else:
+                self._values.add(value)
+
+    def merge(self, other):
+        self._values |= other._values
+        self._has_nan = self._has_nan or other._has_nan
+
+    def values(self) -> Set:
+        values = set(self._values)
+        if self._has_nan:
+            values.add(np.nan)
+        return values
+
+
+class QuantileSketch:
+    """
+        Bounded, mergeable summary of the distinct values of a numerical attribute.
+
+        equi_freq places its cutoffs at quantiles of the (sorted) distinct values of an
+        attribute. The sketch keeps the size distinct values with the smallest hashes,
+        i.e., a uniform sample of the distinct values (bottom-k sketch) whose quantiles
+        approximate those of all distinct values. While an attribute has at most size
+        distinct values the sample holds all of them and the cutoffs are exact.
+        The minimum and maximum (all equi_width needs) are always exact.
+        Merging two sketches gives the sketch of the union of their values.
+
+        Parameters
+        ----------
+
+        size : int
+            Maximum number of distinct values kept
+    """
+    def __init__(self, size: int = 4096):
+        self.size = size
+        self.exact = True
+        self.min = None
+        self.max = None
+        # sorted hashes and the values they belong to
+        self._hashes = np.empty(0, dtype=np.uint64)
+        self._values = np.empty(0)
+
+    def add(self, column: pd.Series):
+        values = pd.unique(column.dropna().to_numpy())
+        if len(values) == 0:
+            return
+        # values are hashed as floats, so that chunks read as int and as float agree
+        self._update(hash_array(values.astype(np.float64)), values, values.min(), values.max(), True)
+
+    def merge(self, other):
+        if other.min is None:
+            return
+        self._update(other._hashes, other._values, other.min, other.max, other.exact)
+
+    def _update(self, hashes, values, min_value, max_value, exact):
+        self.min = min_value if self.min is None else min(self.min, min_value)
+        self.max = max_value if self.max is None else max(self.max, max_value)
+        self.exact = self.exact and exact
+        if len(self._hashes) > 0:
+            hashes = np.concatenate([self._hashes, hashes])
+            values = np.concatenate([self._values, values])
+        (hashes, first) = np.unique(hashes, return_index=True)
+        values = values[first]
+        if len(hashes) > self.size:
+            hashes = hashes[:self.size]
+            values = values[:self.size]
+            self.exact = False
+        self._hashes = hashes
+        self._values = values
+
+    # The sampled distinct values, always including the minimum and the maximum
+    def values(self) -> Set:
+        if self.min is None:
+            return set()
+        return set(self._values.tolist()) | {self.min, self.max}
+
+
+# Scans the data once: number of rows, number of positive rows and a sketch of the values of each attribute
+def scan(source: Callable, target, relevant_attributes: Dict[str, str], sketch_size: int = 4096):
+    target_name, target_value = target
+    sketches = {}
+    for (attribute_name, attribute_type) in relevant_attributes.items():
+        if attribute_type == 'D':
+            sketches[attribute_name] = ValueSketch()
+        elif attribute_type == 'C' or attribute_type == 'I':
+            sketches[attribute_name] = QuantileSketch(sketch_size)
+        else:
+            raise Exception("attribute type not supported")
+
+    num_rows = 0
+    num_pos = 0
+    for chunk in source():
+        num_rows += chunk.shape[0]
+        num_pos += int((chunk[target_name] == target_value).sum())
+        for (attribute_name, sketch) in sketches.items():
+            sketch.add(chunk[attribute_name])
+        Timing.count('rows scanned', chunk.shape[0])
+    return (num_rows, num_pos, sketches)
+
+
+# Same as Predicates.generate, with the values of each attribute taken from its sketch
+def generate(sketches: Dict, relevant_attributes: Dict[str, str], num_bins: int, binning_method: BinningMethod) -> Set[Predicate]:
+    features: Set[Predicate] = set()
+    for (attribute_name, attribute_type) in relevant_attributes.items():
+        values = sketches[attribute_name].values()
+        if len(values) == 0:
+            continue
+        if attribute_type == 'D':
+            features |= Predicates.generate_discrete_predicates(attribute_name, values)
+        else:
+            features |= Predicates.generate_continous_predicates(attribute_name, values, num_bins, binning_method)
+    return features
+
+
+# Counts, in one pass over the chunks, the rows and the positive rows that satisfy every predicate
+# as Predicates.count_positives does (i.e., as Predicates.filter counts them)
+# Returns predicate -> (num_covered, num_tp)
+def count_predicates(source: Callable, target, predicates: List[Predicate]) -> Dict[Predicate, tuple]:
+    target_name, target_value = target
+    num_covered = dict.fromkeys(predicates, 0)
+    num_tp = dict.fromkeys(predicates, 0)
+    for chunk in source():
+        pos = chunk[chunk[target_name] == target_value]
+        for (pred, count) in Predicates.count_positives(predicates, chunk).items():
+            num_covered[pred] += count
+        for (pred, count) in Predicates.count_positives(predicates, pos).items():
+            num_tp[pred] += count
+        Timing.count('rows scanned', len(predicates) * chunk.shape[0])
+    return {pred: (num_covered[pred], num_tp[pred]) for pred in predicates}
+
+
+def count_extensions(source: Callable, target, predicates: List[Predicate], extensions) -> List:
+    """
+        Counts, in one pass over the chunks, the rows and the positive rows covered by
+        the extensions of several rules
+
+        Parameters
+        ----------
+
+        source : Callable
+            Returns the chunks of the data (see chunk_source)
+
+        target : Target
+            Target variable (attribute_name, attribute_value)
+
+        predicates : List[Predicate]
+            All predicates that rules and candidates are made of
+
+        extensions : List[Tuple[Rule, List[Predicate]]]
+            Rules and the predicates to extend each of them with
+            (Rule() and all predicates give the counts of the predicates themselves)
+
+        Returns
+        -------
+        counts: List[Tuple[np.ndarray, np.ndarray]]
+            For every rule, the arrays (num_covered, num_tp) with one entry per extension
+    """
+    rows = {pred: k for (k, pred) in enumerate(predicates)}
+    selections = [np.array([rows[pred] for pred in candidates], dtype=np.intp) for (_, candidates) in extensions]
+    counts = [(np.zeros(len(selection), dtype=np.int64), np.zeros(len(selection), dtype=np.int64))
+              for selection in selections]
+    if len(predicates) == 0:
+        return counts
+
+    num_candidates = sum(len(selection) for selection in selections)
+    for chunk in source():
+        # masks of the chunk, dropped as soon as the chunk is counted
+        index = CoverageIndex(chunk)
+        words = bitset.stack(index.predicate_mask(pred) for pred in predicates)
+        pos_words = index.target_mask(target).words
+        for ((rule, _), selection, (num_covered, num_tp)) in zip(extensions, selections, counts):
+            if len(selection) == 0:
+                continue
+            covered = words[selection] & index.rule_mask(rule).words
+            num_covered += bitset.count_rows(covered)
+            num_tp += bitset.count_rows(covered & pos_words)
+        Timing.count('rows scanned', num_candidates * chunk.shape[0])
+    return counts
+
+
+# Streaming counterpart of generate_conjuncts: every level of the beam search counts
+# the extensions of the beam rules in one pass over the chunks
+# predicate_counts maps every predicate to its (num_covered, num_tp) counts
+# Returns the beam (rule -> q value) and the (num_covered, num_tp) counts of its rules
+@time_log
+def generate_conjuncts(source: Callable, target, predicates, beam_width: int, num_rows: int, num_pos: int,
+                       predicate_counts: Dict[Predicate, tuple], implications: ImplicationMatrix = None):
+    # fixes the order in which predicates are visited (sorted, so that ties are broken
+    # the same way whatever the hash seed, i.e., the iteration order of the set of predicates)
+    predicates = sorted(predicates, key=str)
+
+    seed_covered = np.array([predicate_counts[pred][0] for pred in predicates], dtype=np.int64)
+    seed_tp = np.array([predicate_counts[pred][1] for pred in predicates], dtype=np.int64)
+    seed_q = q_values(seed_covered, seed_tp, extension_sizes(Rule(), predicates), num_pos)
+
+    def score_extensions(extensions):
+        level_counts = count_extensions(source, target, predicates, extensions)
+        return [(num_covered, num_tp, q_values(num_covered, num_tp, extension_sizes(rule, candidates), num_pos))
+                for ((rule, candidates), (num_covered, num_tp)) in zip(extensions, level_counts)]
+
+    def irrelevant(new_rule, num_covered, num_tp, new_beam, counts):
+        return is_irrelevant(new_rule, num_covered - num_tp, new_beam, counts)
+
+    (rules, counts) = beam_search(predicates, beam_width, num_rows, num_pos, (seed_covered, seed_tp, seed_q),
+                                  score_extensions, irrelevant, implications)
+    return (rules, {rule: counts[rule.key] for rule in rules})
+
+
+# Streaming counterpart of conjuncts.is_irrelevant. The covered rows are not kept while streaming,
+# so rule is only compared to the beam rules made of a subset of its predicates: such a rule
+# covers every row covered by rule, hence it makes rule irrelevant iff both have the same
+# number of false positives. Irrelevance with respect to other beam rules is not detected.
+def is_irrelevant(rule: Rule, num_fp: int, new_beam: Beam, counts) -> bool:
+    for r in new_beam:
+        if len(r.elems) > 0 and r.elems <= rule.elems:
+            (num_covered, num_tp) = counts[r.key]
+            if num_covered - num_tp == num_fp:
+                return True
+    return False
+
+
+# Same as sorted_pareto_optimal_rules, given the (num_covered, num_tp) counts of the rules
+@time_log
+def sorted_pareto_optimal_rules(rules, counts, num_pos: int):
+    num_covered = np.array([counts[r][0] for r in rules], dtype=np.int64)
+    num_tp = np.array([counts[r][1] for r in rules], dtype=np.int64)
+    return sorted_pareto_optimal_counts(rules, num_covered, num_tp, num_pos)
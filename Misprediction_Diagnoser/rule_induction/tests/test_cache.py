@@ -0,0 +1,138 @@
+# Copyright (c) Facebook, Inc. and its affiliates.
+# All rights reserved.
+#
+# This source code is licensed under the license found in the
+# LICENSE file in the root directory of this source tree.
+
+import gc
+
+import numpy as np
+import pandas as pd
+
+from diagnoser import discover, Settings, Target
+from rules.cache import DatasetRegistry, RuleCache, dataset_token, entry_size
+
+
+def frame(num_rows=200, seed=0):
+    rng = np.random.default_rng(seed)
+    df = pd.DataFrame({'d0': rng.choice(['a', 'b', 'c'], num_rows), 'c0': rng.random(num_rows).round(2)})
+    df['target'] = rng.random(num_rows) < 0.2 + 0.5 * (df['d0'] == 'a')
+    return df
+
+
+# cache key of rule number k, evaluated on the dataset (or rows subset) with the given token
+def key(k, token=0):
+    return ('rule{}'.format(k), token, ('target', True))
+
+
+def value(k):
+    return (k / 10, k, 2 * k, 3 * k)
+
+
+def test_least_recently_used_entries_are_evicted_first():
+    cache = RuleCache(max_entries=3, max_bytes=None)
+    for k in range(3):
+        cache.put(key(k), value(k))
+    assert cache.get(key(0)) == value(0)
+    cache.put(key(3), value(3))
+    # rule1 is the least recently used entry, rule0 was used after rule2
+    assert key(1) not in cache
+    cache.put(key(4), value(4))
+    assert key(2) not in cache
+    assert [k for k in range(5) if key(k) in cache] == [0, 3, 4]
+    # putting an existing key replaces its value and makes it the most recently used
+    cache.put(key(0), value(5))
+    cache.put(key(6), value(6))
+    assert key(3) not in cache
+    assert cache.get(key(0)) == value(5)
+
+
+def test_entry_and_byte_budgets():
+    cache = RuleCache(max_entries=4, max_bytes=None)
+    for k in range(10):
+        cache.put(key(k), value(k))
+        assert len(cache) == min(k + 1, 4)
+    assert cache.evictions == 6
+
+    size = entry_size(value(1))
+    cache = RuleCache(max_entries=None, max_bytes=2 * size + size // 2)
+    for k in range(1, 6):
+        cache.put(key(k), value(k))
+        assert cache.num_bytes <= cache.max_bytes
+    assert len(cache) == 2
+    assert cache.num_bytes == sum(entry_size(value(k)) for k in (4, 5))
+    assert cache.evictions == 3
+
+
+def test_counters():
+    cache = RuleCache(max_entries=2)
+    assert cache.get(key(0)) is None
+    cache.put(key(0), value(0))
+    cache.put(key(1), value(1))
+    assert cache.get(key(0)) == value(0)
+    assert cache.get(key(1)) == value(1)
+    cache.put(key(2), value(2))
+    assert cache.get(key(0)) is None
+    assert cache.stats() == {'entries': 2, 'bytes': entry_size(value(1)) + entry_size(value(2)),
+                             'hits': 2, 'misses': 2, 'evictions': 1}
+    cache.clear()
+    assert cache.stats()['entries'] == 0 and cache.stats()['bytes'] == 0
+
+
+def test_invalidate_drops_the_entries_of_a_dataset_and_its_row_subsets():
+    cache = RuleCache()
+    for k in range(3):
+        cache.put(key(k, 7), value(k))
+        # rows subsets of dataset 7 and of dataset 8
+        cache.put(key(k, (7, 'rows digest')), value(k))
+        cache.put(key(k, 8), value(k))
+        cache.put(key(k, (8, 'rows digest')), value(k))
+    cache.invalidate(7)
+    assert len(cache) == 6
+    assert not any(key(k, token) in cache for k in range(3) for token in (7, (7, 'rows digest')))
+    assert all(key(k, token) in cache for k in range(3) for token in (8, (8, 'rows digest')))
+    assert cache.num_bytes == sum(entry_size(value(k)) for k in range(3)) * 2
+    # unknown tokens are ignored
+    cache.invalidate(9)
+    assert len(cache) == 6
+    assert cache.hits == 0 and cache.misses == 0 and cache.evictions == 0
+
+
+def test_tokens_are_forgotten_with_their_data_frames():
+    registry = DatasetRegistry()
+    df = frame()
+    same = frame()
+    token = registry.register(df)
+    assert registry.register(same) == token
+    assert registry.register(frame(seed=1)) != token
+    assert len(registry) == 1
+    del df
+    gc.collect()
+    assert len(registry) == 1
+    del same
+    gc.collect()
+    assert len(registry) == 0
+    # tokens are not reused
+    assert registry.register(frame()) != token
+
+
+def test_modified_data_frame_gets_a_new_token():
+    registry = DatasetRegistry()
+    df = frame()
+    token = registry.register(df)
+    df.loc[0, 'd0'] = 'c' if df.loc[0, 'd0'] != 'c' else 'a'
+    assert registry.register(df) == token
+    assert registry.register(df, verify=True) != token
+    assert len(registry) == 1
+
+
+def test_discover_fingerprints_modified_data_frame():
+    df = frame(1000)
+    target = Target('target', True)
+    attributes = {'d0': 'D', 'c0': 'C'}
+    discover(df, target, attributes, Settings())
+    token = dataset_token(df)
+    df['target'] = df['d0'] == 'b'
+    discover(df, target, attributes, Settings())
+    assert dataset_token(df) != token
+    assert dataset_token(df) == dataset_token(df.copy())
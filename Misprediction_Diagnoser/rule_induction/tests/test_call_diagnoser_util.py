@@ -0,0 +1,211 @@
+# Copyright (c) Facebook, Inc. and its affiliates.
+# All rights reserved.
+#
+# This source code is licensed under the license found in the
+# LICENSE file in the root directory of this source tree.
+
+import io
+import os
+import shutil
+from concurrent.futures import Future
+from contextlib import redirect_stdout
+
+import numpy as np
+import pandas as pd
+
+import rule_induction.call_diagnoser_util as CallDiagnoser
+from rule_induction.call_diagnoser_util import (attribute_combinations, call_diagnoser, discover, file_memory,
+                                                 file_schema, load_file, load_file_chunks, parallel_files,
+                                                 ResultWriter, Settings, Target)
+
+
+# CSV file with an unnamed index column (as load_file expects), a discrete attribute holding numbers
+# and one holding strings
+def write_file(path, num_rows=400, seed=0):
+    rng = np.random.default_rng(seed)
+    df = pd.DataFrame({
+        'grade': rng.integers(1, 4, num_rows),
+        'city': rng.choice(['a', 'b', 'c'], num_rows),
+        'income': rng.normal(size=num_rows).round(2),
+        'age': rng.integers(18, 80, num_rows),
+    })
+    df['y'] = np.where(rng.random(num_rows) < 0.2 + 0.6 * (df['city'] == 'c') + 0.1 * (df['grade'] == 3), 'yes', 'no')
+    df.to_csv(path)
+    return str(path)
+
+
+def test_schema_loading_finds_the_same_rules(tmp_path):
+    path = write_file(tmp_path / 'data.csv')
+    attributes = {'grade': 'D', 'city': 'D', 'income': 'C', 'age': 'I'}
+    schema = file_schema(attributes, 'y')
+    target = Target('target', True)
+    for settings in (Settings(), Settings(all_rules=True)):
+        expected = [str(rule) for rule in discover(load_file(path, 'y', 'yes'), target, attributes, settings).rules]
+        found = [str(rule) for rule in discover(load_file(path, 'y', 'yes', schema), target, attributes, settings).rules]
+        assert found == expected
+        chunks = pd.concat(load_file_chunks(path, 'y', 'yes', chunk_size=150, schema=schema)(), ignore_index=True)
+        assert [str(rule) for rule in discover(chunks, target, attributes, settings).rules] == expected
+
+
+COMBINATIONS = [{'a': 'D'}, {'b': 'C'}, {'a': 'D', 'b': 'C'}, {'c': 'I'}, {'a': 'D', 'c': 'I'}, {'b': 'C', 'c': 'I'},
+                {'d': 'D'}]
+FILE_NAMES = ['f0.csv', 'f1.csv']
+
+
+# Writes the results of the combinations of two files as collect_results does (every third combination
+# finds no rules), skipping the completed ones. Stops, without closing the writer, before combination stop.
+def write_results(writer, stop=None):
+    count = writer.count
+    k = 0
+    for file_name in FILE_NAMES:
+        for combination in COMBINATIONS:
+            if k == stop:
+                return
+            if not writer.is_completed(file_name, combination):
+                result_df = None
+                if k % 3 != 2:
+                    count += 1
+                    result_df = pd.DataFrame({'rule': ['{} {}'.format(file_name, combination)], 'precision': [k / 10],
+                                              'count': [count]})
+                writer.write(file_name, combination, result_df, count)
+            k += 1
+    writer.close()
+
+
+def uninterrupted_results(tmp_path):
+    path = str(tmp_path / 'expected.csv')
+    write_results(ResultWriter(path, flush_every=3, fingerprint='run'))
+    with open(path) as result_file:
+        return result_file.read()
+
+
+# Leaves the files of a run killed during its fourth flush: a row of the flush is already in the CSV,
+# its progress line is only partly written. Returns the size of the CSV after the third flush.
+def crash_mid_flush(path):
+    writer = ResultWriter(path, flush_every=3, fingerprint='run')
+    write_results(writer, stop=11)
+    offset = os.path.getsize(path)
+    writer._pending_frames[0].to_csv(path, mode='a', header=False, index=False)
+    with open(writer.progress_path, 'a') as progress_file:
+        progress_file.write(writer._progress_line(os.path.getsize(path), writer._pending_keys)[:20])
+    return offset
+
+
+def completed_pairs(writer):
+    return [(file_name, combination) for file_name in FILE_NAMES for combination in COMBINATIONS
+            if writer.is_completed(file_name, combination)]
+
+
+def test_resume_after_crash_matches_uninterrupted_run(tmp_path):
+    expected = uninterrupted_results(tmp_path)
+    path = str(tmp_path / 'results.csv')
+    offset = crash_mid_flush(path)
+
+    writer = ResultWriter(path, flush_every=3, resume=True, fingerprint='run')
+    # the row of the unfinished flush is cut off and the pairs of the three recorded flushes are skipped
+    assert os.path.getsize(path) == offset
+    assert completed_pairs(writer) == [(file_name, combination) for file_name in FILE_NAMES
+                                       for combination in COMBINATIONS][:9]
+    assert writer.count == 6
+    write_results(writer)
+    with open(path) as result_file:
+        assert result_file.read() == expected
+
+
+def test_resume_with_another_fingerprint_starts_over(tmp_path):
+    expected = uninterrupted_results(tmp_path)
+    path = str(tmp_path / 'results.csv')
+    crash_mid_flush(path)
+
+    writer = ResultWriter(path, flush_every=3, resume=True, fingerprint='other settings')
+    assert os.path.getsize(path) == 0
+    assert writer.count == 0
+    assert completed_pairs(writer) == []
+    write_results(writer)
+    with open(path) as result_file:
+        assert result_file.read() == expected
+
+
+def test_parallel_sweep_matches_serial_diagnosis(tmp_path):
+    data = load_file(write_file(tmp_path / 'data.csv'), 'y', 'yes')
+    attributes = {'grade': 'D', 'city': 'D', 'income': 'C', 'age': 'I'}
+    outcomes = []
+    for (workers, chunk_size) in ((1, 1), (3, 1), (3, 4)):
+        output = io.StringIO()
+        with redirect_stdout(output):
+            (result_data, count) = call_diagnoser(data, pd.DataFrame(), Settings(), attributes, 0, workers, chunk_size)
+        outcomes.append((output.getvalue(), result_data, count))
+    (expected_output, expected_data, expected_count) = outcomes[0]
+    assert expected_count > 0
+    for (output, result_data, count) in outcomes[1:]:
+        assert output == expected_output
+        pd.testing.assert_frame_equal(result_data, expected_data)
+        assert count == expected_count
+
+
+def test_parallel_files_yields_outcomes_in_file_order(tmp_path):
+    # the first file is the largest, so that it is diagnosed last
+    files = [write_file(tmp_path / 'data{}.csv'.format(k), num_rows, seed=k)
+             for (k, num_rows) in enumerate((3000, 300, 600))]
+    attributes = {'grade': 'D', 'city': 'D', 'income': 'C'}
+    combination_lists = [attribute_combinations(attributes)] * len(files)
+    load_options = {'target_column': 'y', 'target_value': 'yes'}
+    targets = [Target('target', True)]
+    outcomes = list(parallel_files(files, combination_lists, Settings(), attributes, targets, load_options, 3))
+    expected = [CallDiagnoser._diagnose_file_in_worker(path, combination_lists[0], Settings(), attributes, targets,
+                                                       load_options) for path in files]
+    assert len(outcomes) == len(files)
+    for (file_outcomes, expected_outcomes) in zip(outcomes, expected):
+        assert [output for (output, _) in file_outcomes] == [output for (output, _) in expected_outcomes]
+        for ((_, result_df), (_, expected_df)) in zip(file_outcomes, expected_outcomes):
+            if expected_df is None:
+                assert result_df is None
+            else:
+                pd.testing.assert_frame_equal(result_df, expected_df)
+
+
+# Runs every file when it is submitted and records when files are started and when parallel_files waits
+class RecordingExecutor:
+    def __init__(self, events, **kwargs):
+        self.events = events
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        return False
+
+    def submit(self, function, file_path, *args):
+        self.events.append(os.path.basename(file_path))
+        future = Future()
+        future.set_result(file_path)
+        return future
+
+
+def test_parallel_files_starts_files_in_order_within_memory_budget(tmp_path, monkeypatch):
+    first = write_file(tmp_path / 'data0.csv')
+    files = [first] + [str(shutil.copy(first, tmp_path / 'data{}.csv'.format(k))) for k in range(1, 5)]
+    events = []
+
+    # every running file is done
+    def wait(running, return_when):
+        events.append('wait')
+        return (set(running), set())
+
+    monkeypatch.setattr(CallDiagnoser, 'ProcessPoolExecutor', lambda **kwargs: RecordingExecutor(events, **kwargs))
+    monkeypatch.setattr(CallDiagnoser, 'wait', wait)
+
+    def schedule(file_workers, max_memory):
+        events.clear()
+        assert list(parallel_files(files, [[]] * len(files), Settings(), {}, [], {}, file_workers, max_memory)) == files
+        return events[:]
+
+    estimate = file_memory(first)
+    # at most file_workers files at a time
+    assert schedule(2, None) == ['data0.csv', 'data1.csv', 'wait', 'data2.csv', 'data3.csv', 'wait', 'data4.csv', 'wait']
+    # at most two files fit in memory
+    assert schedule(4, 2 * estimate + estimate // 2) == \
+        ['data0.csv', 'data1.csv', 'wait', 'data2.csv', 'data3.csv', 'wait', 'data4.csv', 'wait']
+    # a file that does not fit in memory still runs, alone
+    assert schedule(4, estimate // 2) == \
+        ['data0.csv', 'wait', 'data1.csv', 'wait', 'data2.csv', 'wait', 'data3.csv', 'wait', 'data4.csv', 'wait']
@@ -0,0 +1,52 @@
+# Copyright (c) Facebook, Inc. and its affiliates.
+# All rights reserved.
+#
+# This source code is licensed under the license found in the
+# LICENSE file in the root directory of this source tree.
+
+import numpy as np
+
+from rules.conjuncts import Beam
+from rules.predicate import Predicate
+from rules.rule import Rule
+
+
+# worst rule of a beam kept as a dict (rule -> q value), as generate_conjuncts used to find it
+def dict_worst_rule(beam, beam_width):
+    if len(beam) < beam_width:
+        return (None, -1)
+    worst_q = 2**60
+    for cur_r in beam:
+        cur_q = beam[cur_r]
+        if cur_q < worst_q:
+            worst_q = cur_q
+            worst_rule = cur_r
+    return (worst_rule, worst_q)
+
+
+def test_beam_matches_dict_beam():
+    rng = np.random.default_rng(0)
+    predicates = [Predicate('a', '<=', value) for value in range(8)] + [Predicate('b', '==', str(value)) for value in range(8)]
+    for beam_width in (1, 3, 10):
+        beam = Beam(beam_width)
+        reference = {}
+        for _ in range(500):
+            rule = Rule()
+            for k in rng.choice(len(predicates), rng.integers(1, 4), replace=False):
+                rule.add_conjunct(predicates[k])
+            if rule in beam:
+                assert rule in reference
+                continue
+            # few distinct q values, so that ties are frequent
+            q = float(rng.integers(0, 20)) / 4
+            (worst_rule, worst_q) = beam.worst()
+            (reference_rule, reference_q) = dict_worst_rule(reference, beam_width)
+            assert worst_q == reference_q
+            assert worst_rule == reference_rule
+            if q > worst_q:
+                if worst_rule is not None:
+                    beam.remove(worst_rule)
+                    reference.pop(reference_rule)
+                beam.add(rule, q)
+                reference[rule] = q
+            assert beam.items() == list(reference.items())
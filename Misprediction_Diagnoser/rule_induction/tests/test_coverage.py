@@ -0,0 +1,55 @@
+# Copyright (c) Facebook, Inc. and its affiliates.
+# All rights reserved.
+#
+# This source code is licensed under the license found in the
+# LICENSE file in the root directory of this source tree.
+
+import itertools
+
+import numpy as np
+import pandas as pd
+
+import rules.predicate as Predicates
+from rules.coverage import CoverageIndex
+from rules.rule import Rule
+from util import BinningMethod, ConfusionMatrix, partition
+
+
+def mixed_frame(num_rows=1000, seed=0):
+    rng = np.random.default_rng(seed)
+    df = pd.DataFrame({
+        'd0': rng.choice(['a', 'b', 'c'], num_rows),
+        'd1': pd.Categorical(rng.choice(['x', 'y'], num_rows)),
+        'c0': rng.normal(size=num_rows).round(2),
+        'i0': rng.integers(0, 50, num_rows),
+    })
+    df.loc[rng.random(num_rows) < 0.05, 'd0'] = np.nan
+    df.loc[rng.random(num_rows) < 0.05, 'c0'] = np.nan
+    df['target'] = rng.random(num_rows) < 0.2 + 0.5 * (df['d0'] == 'a')
+    return df
+
+
+def test_rule_counts_match_query():
+    df = mixed_frame()
+    target = ('target', True)
+    attributes = {'d0': 'D', 'd1': 'D', 'c0': 'C', 'i0': 'I'}
+    predicates = sorted(Predicates.generate(df, attributes, 5, BinningMethod.EQFreq), key=str)
+    index = CoverageIndex(df)
+    stats = ConfusionMatrix(df, target, index)
+    pos, _ = partition(df, target)
+
+    rules = []
+    for size in (1, 2, 3):
+        for combination in itertools.islice(itertools.combinations(predicates, size), 0, None, 7):
+            rule = Rule()
+            for predicate in combination:
+                rule.add_conjunct(predicate)
+            rules.append(rule)
+    assert len(rules) > 100
+
+    for rule in rules:
+        covered = df.query(rule.dataframe_query())
+        mask = index.rule_mask(rule).to_mask()
+        assert (np.flatnonzero(mask) == df.index.get_indexer(covered.index)).all(), str(rule)
+        assert stats.num_covered(rule) == len(covered), str(rule)
+        assert stats.num_true_positive(rule) == len(pos.query(rule.dataframe_query())), str(rule)
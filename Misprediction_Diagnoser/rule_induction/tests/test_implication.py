@@ -0,0 +1,39 @@
+# Copyright (c) Facebook, Inc. and its affiliates.
+# All rights reserved.
+#
+# This source code is licensed under the license found in the
+# LICENSE file in the root directory of this source tree.
+
+import itertools
+
+from rules.implication import ImplicationMatrix
+from rules.predicate import Predicate
+from rules.rule import Rule
+
+
+def catalog():
+    return ([Predicate('c', op, value) for op in ('<=', '>') for value in (1, 2, 3)]
+            + [Predicate('d', op, value) for op in ('==', '!=') for value in ('x', 'y')])
+
+
+def test_matrix_matches_predicates():
+    predicates = catalog()
+    implications = ImplicationMatrix(predicates)
+    positions = implications.positions(predicates)
+    # the last rules contain a predicate that is not in the catalog
+    others = [Predicate('c', '<=', 0), Predicate('e', '==', 'z')]
+    for size in (0, 1, 2):
+        for elems in itertools.combinations(predicates + others, size):
+            rule = Rule()
+            for pred in elems:
+                rule.add_conjunct(pred)
+            useless = implications.useless_mask(rule)[positions]
+            for (pred, is_useless) in zip(predicates, useless):
+                assert is_useless == rule.check_useless(pred), (str(rule), str(pred))
+                assert implications.is_useless(rule, pred) == rule.check_useless(pred), (str(rule), str(pred))
+            for pred in others:
+                assert implications.is_useless(rule, pred) == rule.check_useless(pred), (str(rule), str(pred))
+            for other in predicates:
+                other_rule = Rule()
+                other_rule.add_conjunct(other)
+                assert implications.rule_implies(rule, other_rule) == rule.implies(other_rule), (str(rule), str(other))
@@ -0,0 +1,59 @@
+# Copyright (c) Facebook, Inc. and its affiliates.
+# All rights reserved.
+#
+# This source code is licensed under the license found in the
+# LICENSE file in the root directory of this source tree.
+
+import numpy as np
+import pandas as pd
+
+import rules.predicate as Predicates
+from util import BinningMethod, partition
+
+
+def mixed_frame(num_rows=1000, seed=0):
+    rng = np.random.default_rng(seed)
+    df = pd.DataFrame({
+        'd0': rng.choice(['a', 'b', 'c'], num_rows),
+        'd1': pd.Categorical(rng.choice(['0.0', '1.0'], num_rows)),
+        # discrete attributes with numerical and boolean values
+        'b0': rng.choice([0.0, 1.0], num_rows),
+        'i0': rng.integers(0, 3, num_rows),
+        'flag': rng.random(num_rows) < 0.5,
+        'c0': rng.random(num_rows).round(2),
+    })
+    df.loc[rng.random(num_rows) < 0.05, 'd0'] = np.nan
+    df.loc[rng.random(num_rows) < 0.05, 'c0'] = np.nan
+    df['target'] = rng.random(num_rows) < 0.2 + 0.5 * (df['d0'] == 'a')
+    return df
+
+
+def test_count_positives_matches_query():
+    df = mixed_frame()
+    attributes = {'d0': 'D', 'd1': 'D', 'b0': 'D', 'i0': 'D', 'flag': 'D', 'c0': 'C'}
+    predicates = Predicates.generate(df, attributes, 5, BinningMethod.EQFreq)
+    pos, _ = partition(df, ('target', True))
+    for data in (df, pos):
+        counts = Predicates.count_positives(predicates, data)
+        for predicate in predicates:
+            expected = len(data.query(predicate.dataframe_query()))
+            assert counts[predicate] == expected, str(predicate)
+            assert predicate.num_positive(data) == expected, str(predicate)
+
+
+def test_filter_drops_numerical_discrete_predicates():
+    df = mixed_frame()
+    attributes = {'d0': 'D', 'b0': 'D', 'i0': 'D', 'flag': 'D'}
+    predicates = Predicates.generate(df, attributes, 5, BinningMethod.EQFreq)
+    pos, _ = partition(df, ('target', True))
+    filtered = Predicates.filter(predicates, df, pos, 0.0, 0)
+    assert len(filtered) > 0
+    assert all(predicate.name == 'd0' for predicate in filtered)
+
+
+def test_equal_values_of_different_types_are_different_predicates():
+    predicates = [Predicates.Predicate('x', '==', value) for value in (1, 1.0, True)]
+    assert len({id(predicate) for predicate in predicates}) == 3
+    assert len({predicate.id for predicate in predicates}) == 3
+    assert [str(predicate) for predicate in predicates] == ['x=="1"', 'x=="1.0"', 'x=="True"']
+    assert all(Predicates.Predicate('x', '==', predicate.val) is predicate for predicate in predicates)
@@ -0,0 +1,107 @@
+# Copyright (c) Facebook, Inc. and its affiliates.
+# All rights reserved.
+#
+# This source code is licensed under the license found in the
+# LICENSE file in the root directory of this source tree.
+
+import itertools
+from statistics import NormalDist
+
+import numpy as np
+import pandas as pd
+
+from diagnoser import discover, Settings, Target
+from rules.coverage import CoverageIndex
+from rules.sampling import discordance, rescore, stratified_sample, wilson_interval
+from util import ConfusionMatrix
+
+
+def frame(num_rows=3000, seed=0):
+    rng = np.random.default_rng(seed)
+    df = pd.DataFrame({
+        'd0': rng.choice(['a', 'b', 'c', 'd'], num_rows),
+        'c0': rng.normal(size=num_rows).round(2),
+        'i0': rng.integers(0, 40, num_rows),
+    })
+    df['target'] = rng.random(num_rows) < 0.05 + 0.4 * (df['d0'] == 'a') + 0.2 * (df['i0'] < 10)
+    return df
+
+
+ATTRIBUTES = {'d0': 'D', 'c0': 'C', 'i0': 'I'}
+TARGET = Target('target', True)
+
+
+def test_stratified_sample_keeps_the_positive_share():
+    df = frame()
+    for rate in (0.5, 0.05, 0.001):
+        df['target'] = np.random.default_rng(1).random(len(df)) < rate
+        share = df['target'].mean()
+        for size in (10, 100, 1000):
+            sample = stratified_sample(df, TARGET, size, seed=size)
+            assert len(sample) == size
+            assert sample.index.is_unique and sample.index.is_monotonic_increasing
+            assert abs(sample['target'].sum() - size * share) <= 0.5 or sample['target'].sum() == 1
+            assert sample['target'].sum() >= 1
+
+
+def test_beam_found_on_sample_is_rescored_exactly():
+    df = frame()
+    result = discover(df, TARGET, ATTRIBUTES, Settings(all_rules=True, sample_size=500))
+    stats = ConfusionMatrix(df, TARGET)
+    assert len(result.rules) > 5
+    for (rule, q) in result.rules.items():
+        assert q == result.sample_report.rules.set_index('rule').loc[str(rule), 'exact_q']
+        assert np.isclose(q, rule.get_eval_result(stats)[0]), str(rule)
+
+
+def test_sample_report_bounds_and_discordance():
+    df = frame()
+    settings = Settings(all_rules=True, sample_size=500, sample_confidence=0.9)
+    report = discover(df, TARGET, ATTRIBUTES, settings).sample_report
+    sample = stratified_sample(df, TARGET, 500, settings.sample_seed)
+    z = NormalDist().inv_cdf(0.95)
+    num_pos = sample['target'].sum()
+    for row in report.rules.itertuples():
+        covered = sample.query(row.rule)
+        tp = covered['target'].sum()
+        for (trials, lower, upper) in ((len(covered), row.precision_lower, row.precision_upper),
+                                       (num_pos, row.recall_lower, row.recall_upper)):
+            p = tp / trials
+            center = (p + z**2 / (2 * trials)) / (1 + z**2 / trials)
+            margin = z * np.sqrt(p * (1 - p) / trials + z**2 / (4 * trials**2)) / (1 + z**2 / trials)
+            assert np.isclose(lower, max(center - margin, 0)) and np.isclose(upper, min(center + margin, 1)), row.rule
+
+    sample_q = report.rules['sample_q'].to_numpy()
+    exact_q = report.rules['exact_q'].to_numpy()
+    pairs = list(itertools.permutations(range(len(sample_q)), 2))
+    expected = sum((sample_q[i] - sample_q[j]) * (exact_q[i] - exact_q[j]) < 0 for (i, j) in pairs) / len(pairs)
+    assert np.isclose(report.discordance, expected)
+
+
+def test_wilson_interval_and_discordance_of_known_values():
+    (lower, upper) = wilson_interval(np.array([8, 0]), np.array([10, 0]))
+    assert np.allclose([lower[0], upper[0]], [0.4902, 0.9433], atol=1e-4)
+    # no trials, no information
+    assert (lower[1], upper[1]) == (0.0, 1.0)
+    # the pair (2, 3) of three is in the opposite order
+    assert np.isclose(discordance(np.array([1.0, 2.0, 3.0]), np.array([1.0, 3.0, 2.0])), 1 / 3)
+    assert discordance(np.array([1.0]), np.array([2.0])) == 0.0
+
+
+def test_sample_of_all_rows_gives_the_exact_result():
+    df = frame()
+    for settings in (dict(all_rules=True), dict(), dict(disjunctions=True)):
+        expected = discover(df, TARGET, ATTRIBUTES, Settings(**settings))
+        for sample_size in (len(df), len(df) + 100):
+            result = discover(df, TARGET, ATTRIBUTES, Settings(sample_size=sample_size, **settings))
+            assert result.sample_report is None
+            assert result.dataframe().to_dict('records') == expected.dataframe().to_dict('records')
+
+    # the report of a "sample" that is the full data agrees with the exact scores
+    rules = discover(df, TARGET, ATTRIBUTES, Settings(all_rules=True)).rules
+    index = CoverageIndex(df)
+    (rescored, report) = rescore(rules, TARGET, index, index)
+    assert rescored == rules
+    assert report.discordance == 0.0
+    assert report.top_agreement == 1.0
+    assert report.rules['precision_within_bounds'].all() and report.rules['recall_within_bounds'].all()
@@ -0,0 +1,113 @@
+# Copyright (c) Facebook, Inc. and its affiliates.
+# All rights reserved.
+#
+# This source code is licensed under the license found in the
+# LICENSE file in the root directory of this source tree.
+
+import numpy as np
+import pandas as pd
+
+from diagnoser import discover, Settings, Target
+from rules.predicate import Predicate
+from rules.rule import Rule
+from rules.ruleset import RuleSet
+from rules.scoring import RuleScorer
+
+
+def mixed_frame(num_rows=1000, seed=0):
+    rng = np.random.default_rng(seed)
+    df = pd.DataFrame({
+        'd0': rng.choice(['a', 'b', 'c'], num_rows),
+        # discrete attribute with numerical values
+        'b0': rng.choice([0.0, 1.0], num_rows),
+        'c0': rng.random(num_rows).round(2),
+        'flag': rng.random(num_rows) < 0.5,
+    })
+    df['target'] = rng.random(num_rows) < 0.2 + 0.5 * ((df['d0'] == 'a') & (df['b0'] == 0.0))
+    return df
+
+
+def test_numeric_discrete_rule_round_trips():
+    df = mixed_frame()
+    rule = Rule()
+    for pred in (Predicate('d0', '==', 'a'), Predicate('b0', '==', 0.0), Predicate('c0', '>', 0.4)):
+        rule.add_conjunct(pred)
+    expected = ((df['d0'] == 'a') & (df['b0'] == 0.0) & (df['c0'] > 0.4)).to_numpy()
+
+    from_rule = RuleScorer([rule]).score(df)[:, 0]
+    from_string = RuleScorer.from_strings(str(rule)).score(df)[:, 0]
+    assert expected.sum() > 0
+    assert (from_rule == expected).all()
+    assert (from_string == expected).all()
+
+
+def test_boolean_and_inequality_round_trip():
+    df = mixed_frame()
+    rule = Rule()
+    rule.add_conjunct(Predicate('flag', '==', True))
+    rule.add_conjunct(Predicate('b0', '!=', 1.0))
+    expected = (df['flag'] & (df['b0'] != 1.0)).to_numpy()
+    assert (RuleScorer.from_strings(str(rule)).score(df)[:, 0] == expected).all()
+
+
+def test_single_rule_ruleset_round_trips():
+    df = mixed_frame()
+    rule = Rule()
+    rule.add_conjunct(Predicate('d0', '==', 'a'))
+    ruleset = RuleSet()
+    ruleset.add_rule(rule)
+    expected = (df['d0'] == 'a').to_numpy()
+    assert (RuleScorer.from_strings(str(ruleset)).score(df)[:, 0] == expected).all()
+
+
+def test_discovered_rules_round_trip():
+    df = mixed_frame()
+    attributes = {'d0': 'D', 'b0': 'D', 'c0': 'C'}
+    for settings in (Settings(all_rules=True), Settings(disjunctions=True)):
+        result = discover(df, Target('target', True), attributes, settings)
+        scorer = result.scorer()
+        rules = scorer.rules
+        parsed = RuleScorer.from_strings([str(rule) for rule in rules])
+        assert (parsed.score(df) == scorer.score(df)).all()
+
+
+def test_numpy_batch_matches_data_frame():
+    df = mixed_frame()
+    result = discover(df, Target('target', True), {'d0': 'D', 'b0': 'D', 'c0': 'C'}, Settings(all_rules=True))
+    columns = ['d0', 'b0', 'c0']
+    expected = result.scorer().score(df)
+    batch = df[columns].to_numpy(dtype=object)
+    assert (RuleScorer.from_result(result, columns).score(batch) == expected).all()
+    assert (result.scorer().score(df[columns].to_records(index=False)) == expected).all()
+
+
+def test_pipe_in_value_is_not_a_ruleset_separator():
+    df = pd.DataFrame({'job': ['a|b', 'a', 'b', 'c|d', 'c'], 'age': [20, 30, 40, 50, 60]})
+    (rule,) = RuleScorer.from_strings('job=="a|b"').rules
+    assert isinstance(rule, Rule)
+    assert (RuleScorer.from_strings('job=="a|b"').score(df)[:, 0] == (df['job'] == 'a|b').to_numpy()).all()
+
+    ruleset = RuleSet()
+    for (value, cutoff) in (('a|b', 25), ('c|d', 55)):
+        conjunction = Rule()
+        conjunction.add_conjunct(Predicate('job', '==', value))
+        conjunction.add_conjunct(Predicate('age', '<=', cutoff))
+        ruleset.add_rule(conjunction)
+    (parsed,) = RuleScorer.from_strings(str(ruleset)).rules
+    assert isinstance(parsed, RuleSet) and len(parsed.elems) == 2
+    expected = df['job'].isin(['a|b', 'c|d']).to_numpy()
+    assert (RuleScorer.from_strings(str(ruleset)).score(df)[:, 0] == expected).all()
+
+
+def test_result_scorer_matches_result_coverage():
+    df = mixed_frame()
+    attributes = {'d0': 'D', 'b0': 'D', 'c0': 'C', 'flag': 'D'}
+    for settings in (Settings(all_rules=True), Settings(disjunctions=True)):
+        result = discover(df, Target('target', True), attributes, settings)
+        stats = result.dataframe()
+        scored = RuleScorer.from_result(result).score_frame(df)
+        assert len(stats) > 0
+        for (rule_str, coverage) in zip(stats.iloc[:, 0].astype(str), stats['rule_coverage']):
+            expected = df.eval(rule_str).to_numpy(dtype=bool)
+            assert (scored[rule_str].to_numpy() == expected).all(), rule_str
+            assert scored[rule_str].mean() == coverage, rule_str
@@ -0,0 +1,42 @@
+# Copyright (c) Facebook, Inc. and its affiliates.
+# All rights reserved.
+#
+# This source code is licensed under the license found in the
+# LICENSE file in the root directory of this source tree.
+
+import pytest
+
+import rules.conjuncts as Conjuncts
+from benchmarks.discover_suite import PRESETS, settings_grid
+from benchmarks.synthetic import DatasetSpec, generate
+from diagnoser import discover, discover_stream, Settings, Target
+
+
+# conjuncts.is_irrelevant restricted to the beam rules made of a subset of the predicates of rule,
+# the only ones discover_stream compares rule to (see rules/streaming.py, is_irrelevant)
+def subset_irrelevant(rule, new_beam, stats):
+    num_fp = len(stats.false_positive(rule))
+    return any(len(r.elems) > 0 and r.elems <= rule.elems and len(stats.false_positive(r)) == num_fp
+               for r in new_beam)
+
+
+def discover_pairs(num_rows):
+    (df, relevant_attributes, _) = generate(DatasetSpec(num_rows=num_rows))
+    target = Target('target', True)
+    for settings in settings_grid(PRESETS['small'][1]):
+        if settings['disjunctions']:
+            continue
+        for all_rules in (False, True):
+            # exact cutoffs, as discover uses
+            streaming_settings = Settings(all_rules=all_rules, stream_chunk_size=777, sketch_size=num_rows, **settings)
+            streamed = discover_stream(df, target, relevant_attributes, streaming_settings)
+            result = discover(df, target, relevant_attributes, Settings(all_rules=all_rules, **settings))
+            yield (settings, all_rules, result.dataframe().round(12), streamed.dataframe().round(12))
+
+
+@pytest.mark.parametrize('num_rows', PRESETS['small'][0])
+def test_discover_stream_matches_discover_up_to_irrelevance(num_rows, monkeypatch):
+    monkeypatch.setattr(Conjuncts, 'is_irrelevant', subset_irrelevant)
+    for (settings, all_rules, expected, streamed) in discover_pairs(num_rows):
+        assert streamed.to_dict('records') == expected.to_dict('records'), (settings, all_rules)
+
@@ -0,0 +1,56 @@
+# Copyright (c) Facebook, Inc. and its affiliates.
+# All rights reserved.
+#
+# This source code is licensed under the license found in the
+# LICENSE file in the root directory of this source tree.
+
+import numpy as np
+import pandas as pd
+
+from diagnoser import discover, Settings, Target
+from util import ConfusionMatrix, sorted_pareto_optimal_rules, strictly_dominated
+
+
+def test_strictly_dominated_matches_pairwise():
+    rng = np.random.default_rng(0)
+    for num_points in (0, 1, 2, 10, 200):
+        # few distinct values, so that ties in x, in y and in both are frequent
+        x = rng.integers(0, 8, num_points) / 8
+        y = rng.integers(0, 8, num_points) / 8
+        expected = np.array([bool(((x > x[i]) & (y > y[i])).any()) for i in range(num_points)], dtype=bool)
+        assert (strictly_dominated(x, y) == expected).all()
+
+
+# Pareto filter of sorted_pareto_optimal_rules before the skyline: every pair of rules is compared
+def pairwise_pareto_optimal_rules(rules, df, target):
+    stats = ConfusionMatrix(df, target)
+    retained = {}
+    filtered = set()
+    for r1 in rules.keys():
+        keep = True
+        for r2 in rules.keys():
+            if r1 == r2 or r2 in filtered:
+                continue
+            if r2.is_better(r1, stats):
+                keep = False
+                filtered.add(r1)
+                break
+        if keep:
+            retained[r1] = rules[r1]
+    return [rule for rule, _ in sorted(retained.items(), key=lambda x: x[1], reverse=True)]
+
+
+def test_pareto_optimal_rules_match_pairwise():
+    rng = np.random.default_rng(1)
+    num_rows = 2000
+    df = pd.DataFrame({
+        'd0': rng.choice(['a', 'b', 'c', 'd'], num_rows),
+        'c0': rng.normal(size=num_rows).round(1),
+        'i0': rng.integers(0, 30, num_rows),
+    })
+    df['target'] = rng.random(num_rows) < 0.2 + 0.4 * (df['d0'] == 'a') + 0.3 * (df['i0'] < 8)
+    target = Target('target', True)
+    result = discover(df, target, {'d0': 'D', 'c0': 'C', 'i0': 'I'}, Settings(all_rules=True, beam_width=20))
+    rules = {rule: rule.get_eval_result(ConfusionMatrix(df, target))[0] for rule in result.rules}
+    assert len(rules) > 10
+    assert sorted_pareto_optimal_rules(rules, df, target) == pairwise_pareto_optimal_rules(rules, df, target)
@@ -5,8 +5,9 @@
 # LICENSE file in the root directory of this source tree.
 
 from functools import wraps
+import json
+import os
 import time
-import copy
 
 
 class TimeLog:
@@ -32,20 +33,207 @@ _time_log = TimeLog(_time_log_container, TIMING_DEBUG)
 
 def get_time_log():
     global _time_log, _time_log_container
-    time_log = copy.deepcopy(_time_log)
-    # Reset time log entries
+    # the entries are handed over as they are, later entries go to a new time log
+    time_log = _time_log
     _time_log_container = []
     _time_log = TimeLog(_time_log_container, TIMING_DEBUG)
     return time_log
 
 
 def time_log(f):
+    name = f.__module__ + "/" + f.__name__
     @wraps(f)
     def wrap(*args, **kw):
-        start = time.perf_counter()
-        result = f(*args, **kw)
-        end = time.perf_counter()
-        name = f.__module__ + "/" + f.__name__
-        _time_log.add_time_log(name, start, end)
-        return result
+        if _profiler is not None:
+            with _profiler.span(name):
+                return _timed(f, name, *args, **kw)
+        return _timed(f, name, *args, **kw)
+    return wrap
+
+
+def _timed(f, name, *args, **kw):
+    start = time.perf_counter()
+    result = f(*args, **kw)
+    end = time.perf_counter()
+    _time_log.add_time_log(name, start, end)
+    return result
+
+
+class Span:
+    """
+        A timed section of the program (e.g., one beam search level).
+        Spans opened while another span is open become its children,
+        counters incremented while a span is open are recorded on it.
+    """
+    __slots__ = ('name', 'args', 'start', 'end', 'counters', 'children')
+
+    def __init__(self, name, args, start):
+        self.name = name
+        self.args = args
+        self.start = start
+        self.end = None
+        self.counters = {}
+        self.children = []
+
+    @property
+    def duration(self):
+        return (self.end if self.end is not None else time.perf_counter()) - self.start
+
+    def to_dict(self):
+        return {
+            'name': self.name,
+            'args': self.args,
+            'duration': self.duration,
+            'counters': self.counters,
+            'children': [child.to_dict() for child in self.children],
+        }
+
+
+class _ActiveSpan:
+    __slots__ = ('profiler', 'span')
+
+    def __init__(self, profiler, span):
+        self.profiler = profiler
+        self.span = span
+
+    def __enter__(self):
+        return self.span
+
+    def __exit__(self, *exc):
+        self.span.end = time.perf_counter()
+        self.profiler._stack.pop()
+        return False
+
+
+class _NoSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return None
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NO_SPAN = _NoSpan()
+
+
+class Profiler:
+    """
+        Hierarchical spans and named counters of one process.
+
+        Created by enable_profiling(). While no profiler is enabled, span() and
+        count() return immediately, so instrumented code runs at (nearly) full speed.
+        The recorded spans can be exported as JSON (to_dict / write_json) or in the
+        Chrome trace event format (chrome_trace / write_chrome_trace), which can be
+        opened in chrome://tracing or Perfetto.
+    """
+    def __init__(self):
+        self.origin = time.perf_counter()
+        self.root = Span('profile', {}, self.origin)
+        # totals of all counters, regardless of the span they were recorded in
+        self.counters = {}
+        self._stack = [self.root]
+
+    def span(self, name, **args):
+        span = Span(name, args, time.perf_counter())
+        self._stack[-1].children.append(span)
+        self._stack.append(span)
+        return _ActiveSpan(self, span)
+
+    def count(self, name, n=1):
+        self.counters[name] = self.counters.get(name, 0) + n
+        counters = self._stack[-1].counters
+        counters[name] = counters.get(name, 0) + n
+
+    def to_dict(self):
+        return {
+            'duration': self.root.duration,
+            'counters': self.counters,
+            'spans': [child.to_dict() for child in self.root.children],
+        }
+
+    def write_json(self, path):
+        with open(path, 'w') as f:
+            json.dump(self.to_dict(), f, indent=1, default=str)
+
+    # Spans as complete ('X') events with microsecond timestamps, counter totals as a final 'C' event
+    def chrome_trace(self):
+        pid = os.getpid()
+        events = []
+        pending = list(self.root.children)
+        while pending:
+            span = pending.pop()
+            args = dict(span.args)
+            args.update(span.counters)
+            events.append({
+                'name': span.name,
+                'ph': 'X',
+                'ts': (span.start - self.origin) * 1e6,
+                'dur': span.duration * 1e6,
+                'pid': pid,
+                'tid': 0,
+                'args': args,
+            })
+            pending.extend(span.children)
+        events.sort(key=lambda event: event['ts'])
+        events.append({
+            'name': 'counters',
+            'ph': 'C',
+            'ts': (time.perf_counter() - self.origin) * 1e6,
+            'pid': pid,
+            'tid': 0,
+            'args': self.counters,
+        })
+        return {'traceEvents': events, 'displayTimeUnit': 'ms'}
+
+    def write_chrome_trace(self, path):
+        with open(path, 'w') as f:
+            json.dump(self.chrome_trace(), f, default=str)
+
+
+_profiler = None
+
+
+# Starts recording spans and counters (replacing the current profiler, if any)
+def enable_profiling():
+    global _profiler
+    _profiler = Profiler()
+    return _profiler
+
+
+# Stops recording and returns the profiler with everything recorded so far (None if profiling was not enabled)
+def disable_profiling():
+    global _profiler
+    profiler = _profiler
+    _profiler = None
+    return profiler
+
+
+def get_profiler():
+    return _profiler
+
+
+# Context manager timing a nested section, e.g. with span("beam level", level=i): ...
+def span(name, **args):
+    if _profiler is None:
+        return _NO_SPAN
+    return _profiler.span(name, **args)
+
+
+# Adds n to the counter name (of the current span and of the whole profile)
+def count(name, n=1):
+    if _profiler is not None:
+        _profiler.count(name, n)
+
+
+# Decorator recording every call of f as a span (without adding it to the time log)
+def traced(f):
+    name = f.__module__ + "/" + f.__name__
+    @wraps(f)
+    def wrap(*args, **kw):
+        if _profiler is None:
+            return f(*args, **kw)
+        with _profiler.span(name):
+            return f(*args, **kw)
     return wrap
@@ -5,12 +5,15 @@
 # LICENSE file in the root directory of this source tree.
 
 import pandas as pd
+import numpy as np
 import logging
 from enum import Enum
 from typing import List
 from collections.abc import Callable
 
-from rules.cache import cache, get_cache_key
+from rules.cache import RuleCache, get_cache_key, dataset_token
+from rules.coverage import CoverageIndex
+from rules.bitset import Bitset, stack, count_rows
 from timing import time_log
 
 
@@ -45,49 +48,99 @@ def partition(
 
 
 class ConfusionMatrix:
-    def __init__(self, df: pd.DataFrame, target):
-        self.df = df
-        self.pos_df, self.neg_df = partition(df, target)
+    # true_positive and false_positive return the covered rows as a Bitset over the rows of df
+    # If rows (a Bitset over the rows of df) is given, only those rows are considered,
+    # as if the confusion matrix was built for that subset of df
+    def __init__(self, df: pd.DataFrame, target, index: CoverageIndex = None, cache: RuleCache = None, rows: Bitset = None):
+        self.target = target
+        self.rows = rows
+        self.cache = cache if cache is not None else RuleCache()
+        # compact identifier of df used in cache keys
+        self.token = dataset_token(df)
+        # coverage of rules is computed on packed row masks (see rules/coverage.py)
+        self.index = index if index is not None else CoverageIndex(df)
+        self.pos_mask = self.index.target_mask(target)
+        self.neg_mask = ~self.pos_mask
+        if rows is not None:
+            self.token = (self.token, rows.digest())
+            self.pos_mask = self.pos_mask & rows
+            self.neg_mask = self.neg_mask & rows
+            self.num_rows = rows.count()
+        else:
+            self.num_rows = df.shape[0]
+        self.num_pos = self.pos_mask.count()
+        self._full_df = df
+        self._df = df if rows is None else None
+        self._pos_df = None
+        self._neg_df = None
+
+    # the (subset of the) data the confusion matrix is built for
+    @property
+    def df(self):
+        if self._df is None:
+            self._df = self._full_df[self.rows.to_mask()]
+        return self._df
+
+    @property
+    def pos_df(self):
+        if self._pos_df is None:
+            self._pos_df, self._neg_df = partition(self.df, self.target)
+        return self._pos_df
+
+    @property
+    def neg_df(self):
+        if self._neg_df is None:
+            self._pos_df, self._neg_df = partition(self.df, self.target)
+        return self._neg_df
 
     def true_positive(self, rule):
-        cache_key = get_cache_key(rule, self.df)
-        if cache_key in cache.keys():
-            (q, tps, fps, nc) = cache[cache_key]
+        entry = self.cache.get(get_cache_key(rule, self.token, self.target))
+        if entry is not None:
+            (q, tps, fps, nc) = entry
             return tps
-        tp_coverage = self.coverage(rule, self.pos_df)
-        return {u_id for u_id, row in tp_coverage.iterrows()}
+        return self.coverage_mask(rule) & self.pos_mask
 
     def false_positive(self, rule):
-        cache_key = get_cache_key(rule, self.df)
-        if cache_key in cache.keys():
-            (q, tps, fps, nc) = cache[cache_key]
+        entry = self.cache.get(get_cache_key(rule, self.token, self.target))
+        if entry is not None:
+            (q, tps, fps, nc) = entry
             return fps
-        fp_coverage = self.coverage(rule, self.neg_df)
-        return {u_id for u_id, row in fp_coverage.iterrows()}
+        return self.coverage_mask(rule) & self.neg_mask
 
     # returns the number of data points covered by rule
     def num_covered(self, rule):
-        cache_key = get_cache_key(rule, self.df)
-        if cache_key in cache.keys():
-            (q, tps, fps, nc) = cache[cache_key]
+        entry = self.cache.get(get_cache_key(rule, self.token, self.target))
+        if entry is not None:
+            (q, tps, fps, nc) = entry
             return nc
-        return len(self.coverage(rule))
+        return self.coverage_mask(rule).count()
+
+    def num_true_positive(self, rule):
+        return (self.coverage_mask(rule) & self.pos_mask).count()
+
+    # returns the rows covered by rule as a Bitset over the rows of df
+    def coverage_mask(self, rule):
+        mask = self.index.rule_mask(rule)
+        if self.rows is not None:
+            mask = mask & self.rows
+        return mask
 
     def coverage(self, rule, df=None):
         if df is None:
             df = self.df
-        return df.query(rule.dataframe_query())
+        index = self.index if df is self.index.df else CoverageIndex(df)
+        return df[index.rule_mask(rule).to_mask()]
 
     # P(feature | misprediction) - recall
     def get_coverage_ratio(self, rule):
-        num_tp = len(self.true_positive(rule)) # churn = true, prediction = true
-        pos_length = self.pos_df.shape[0] # churn = true von df
+        num_tp = self.num_true_positive(rule) # churn = true, prediction = true
+        pos_length = self.num_pos # churn = true von df
         return num_tp / pos_length if pos_length > 0 else 0
     # Recall = feature explains 30% of all mispredictison for positive cases
 
     # P(misprediction | feature) - precision
     def get_tp_ratio(self, rule):
-        num_tp = len(self.true_positive(rule)) # churn = true, prediction = true
+        num_tp = self.num_true_positive(rule) # churn = true, prediction = true
         nc = self.num_covered(rule) #
         if nc == 0:
             return 0
@@ -95,38 +148,135 @@ class ConfusionMatrix:
     # Precision = for this combination of features, model mispredicts in 95% of cases
 
 
+def rule_statistics(
+    rules,
+    df: pd.DataFrame,
+    target,
+    index: CoverageIndex = None,
+    mask_function: Callable = None
+) -> pd.DataFrame:
+    """ Computes the statistics of several rules at once
+
+        The coverage masks of all rules are stacked into one array, so that the
+        covered rows and true positives of every rule are counted in a single
+        vectorized pass instead of building a ConfusionMatrix per rule.
+
+        Parameters
+        ----------
+
+        rules : Iterable[Rule]
+            Rules to evaluate (or rulesets, see mask_function)
+
+        df : pd.DataFrame
+            Tabular data as Pandas data frame
+
+        target : Target
+            Target variable (attribute_name, attribute_value)
+
+        index : CoverageIndex
+            Predicate masks over df (optional)
+
+        mask_function : Callable
+            Function (rule, index) -> Bitset of the rows covered by a rule,
+            defaults to CoverageIndex.rule_mask
+
+        Returns
+        -------
+        pd.DataFrame with one row per rule (in the given order) and the columns
+        rule, num_covered, num_true_positive, num_false_positive, precision, recall, rule_coverage and lift
+
+    """
+    if index is None:
+        index = CoverageIndex(df)
+    rules = list(rules)
+    num_rows = df.shape[0]
+    pos_mask = index.target_mask(target)
+    num_pos = pos_mask.count()
+
+    if len(rules) > 0:
+        if mask_function is None:
+            masks = stack([index.rule_mask(rule) for rule in rules])
+        else:
+            masks = stack([mask_function(rule, index) for rule in rules])
+        num_covered = count_rows(masks)
+        num_tp = count_rows(masks & pos_mask.words)
+    else:
+        num_covered = np.zeros(0, dtype=np.int64)
+        num_tp = np.zeros(0, dtype=np.int64)
+
+    return statistics_table(rules, num_covered, num_tp, num_pos, num_rows)
+
+
+# Table of rule_statistics given the coverage and TP counts of each rule
+def statistics_table(rules, num_covered: np.ndarray, num_tp: np.ndarray, num_pos: int, num_rows: int) -> pd.DataFrame:
+    with np.errstate(divide='ignore', invalid='ignore'):
+        precision = np.where(num_covered > 0, num_tp / num_covered, 0.0)
+        recall = num_tp / num_pos if num_pos > 0 else np.zeros(len(rules))
+        rule_coverage = num_covered / num_rows if num_rows > 0 else np.zeros(len(rules))
+        # precision relative to the share of the target in the whole dataset
+        base_rate = num_pos / num_rows if num_rows > 0 else 0
+        lift = precision / base_rate if base_rate > 0 else np.zeros(len(rules))
+
+    return pd.DataFrame({
+        'rule': [str(rule) for rule in rules],
+        'num_covered': num_covered,
+        'num_true_positive': num_tp,
+        'num_false_positive': num_covered - num_tp,
+        'precision': precision,
+        'recall': recall,
+        'rule_coverage': rule_coverage,
+        'lift': lift,
+    })
+
+
 # Returns the best rule according to q value after
 # filtering out non-pareto-optimal rules
 @time_log
-def sorted_pareto_optimal_rules(rules, df: pd.DataFrame, target):
+def sorted_pareto_optimal_rules(rules, df: pd.DataFrame, target, index: CoverageIndex = None, cache: RuleCache = None):
+    stats = ConfusionMatrix(df, target, index, cache)
+    candidates = list(rules.keys())
+    num_covered = np.array([stats.num_covered(r) for r in candidates], dtype=np.int64)
+    num_tp = np.array([stats.num_true_positive(r) for r in candidates], dtype=np.int64)
+    return sorted_pareto_optimal_counts(rules, num_covered, num_tp, stats.num_pos)
+
+
+# Same as sorted_pareto_optimal_rules, given the number of rows (num_covered) and of positive rows (num_tp)
+# covered by each rule, in the order of rules
+def sorted_pareto_optimal_counts(rules, num_covered: np.ndarray, num_tp: np.ndarray, num_pos: int):
+    candidates = list(rules.keys())
+    # tpr and coverage of each rule, the two criteria of Rule.is_better
+    tpr = np.divide(num_tp, num_covered, out=np.zeros(len(candidates)), where=num_covered > 0)
+    coverage = num_tp / num_pos if num_pos > 0 else np.zeros(len(candidates))
     # filters out rules that are not on the Pareto frontier
-    def retain_pareto_optimal(rules: List, stats: ConfusionMatrix):
-        retained = {}
-        filtered = set()
-        for r1 in rules.keys():
-            keep = True
-            for r2 in rules.keys():
-                if r1 == r2:
-                    continue
-                if r2 in filtered:
-                    continue
-                # there is some rule that is better than r1,
-                # so we don't need to keep r1
-                if r2.is_better(r1, stats):
-                    keep = False
-                    filtered.add(r1)
-                    break
-            if keep:
-                retained[r1] = rules[r1]
-        return retained
-
-    stats = ConfusionMatrix(df, target)
-    pareto_optimal = retain_pareto_optimal(rules, stats)
+    dominated = strictly_dominated(tpr, coverage)
+    pareto_optimal = {r: rules[r] for (r, is_dominated) in zip(candidates, dominated) if not is_dominated}
     sorted_rules = sorted(pareto_optimal.items(), key=lambda x: x[1], reverse=True)
     # leave out score
     return [rule for rule, _ in sorted_rules]
 
 
+def strictly_dominated(x: np.ndarray, y: np.ndarray) -> np.ndarray:
+    """ For every point i, is there a point j with x[j] > x[i] and y[j] > y[i]?
+
+        2-D skyline in O(n log n): points are visited in decreasing order of x,
+        one group of equal x values at a time, while keeping the largest y of
+        all groups visited so far (i.e., of all points with a strictly larger x).
+    """
+    dominated = np.zeros(len(x), dtype=bool)
+    order = np.argsort(-x, kind='stable')
+    best_y = -np.inf
+    start = 0
+    while start < len(order):
+        end = start
+        while end < len(order) and x[order[end]] == x[order[start]]:
+            end += 1
+        group = order[start:end]
+        dominated[group] = y[group] < best_y
+        best_y = max(best_y, y[group].max())
+        start = end
+    return dominated
+
+
 class BinningMethod(Enum):
     EQFreq = 1
     EQWidth = 2